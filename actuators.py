@@ -0,0 +1,194 @@
+import queue
+import threading
+import time
+
+from metrics import METRICS, stage
+
+
+LCD_WRITE_SECONDS = stage('lcd_write')
+
+
+# --- Actuator service ---
+# The only code that touches the buzzer GPIO pin and the I2C LCD. Callers
+# queue commands and return immediately; one thread applies them:
+#   - show(text): LCD text. Only the newest text matters, so commands that
+#     pile up are coalesced, unchanged text is never redrawn, and redraws are
+#     at most one per min_redraw seconds.
+#   - buzz(pattern, message): (on, off) seconds steps, or a single duration.
+#     The message replaces the LCD text while the pattern plays, then the
+#     latest show() text comes back.
+#   - silence(): stop the current pattern.
+# `gpio` is the RPi.GPIO module (or FakeGPIO), `lcd` a CharLCD (or FakeLCD).
+class ActuatorService(threading.Thread):
+    def __init__(self, gpio, lcd, buzzer_pin, min_redraw=0.5, clock=time.monotonic):
+        super().__init__(daemon=True)
+        self.gpio = gpio
+        self.lcd = lcd
+        self.buzzer_pin = buzzer_pin
+        self.min_redraw = min_redraw
+        self.clock = clock
+        self._commands = queue.Queue()
+        self._text = ''            # latest show() text
+        self._message = None       # shown instead while a pattern plays
+        self._displayed = None     # what is on the LCD right now
+        self._last_redraw = None
+        self._steps = []           # [(level, until)] of the current pattern
+        self._level = False
+        self.redraws = 0
+
+    # --- Caller side (never blocks) ---
+    def show(self, text):
+        self._commands.put(('show', text))
+
+    def buzz(self, pattern, message=None):
+        if isinstance(pattern, (int, float)):
+            pattern = [(pattern, 0)]
+        self._commands.put(('buzz', (list(pattern), message)))
+
+    def silence(self):
+        self._commands.put(('silence', None))
+
+    @property
+    def pending(self):
+        # Commands queued but not applied yet
+        return self._commands.qsize()
+
+    def register_metrics(self, **labels):
+        METRICS.gauge('queue_depth', lambda: self.pending, "Queued work items", queue='actuators', **labels)
+
+    def stop(self, timeout=2.0):
+        self._commands.put(('stop', None))
+        if self.is_alive():
+            self.join(timeout)
+
+    # --- Actuator thread ---
+    def run(self):
+        running = True
+        while running:
+            try:
+                command = self._commands.get(timeout=self._next_deadline())
+            except queue.Empty:
+                command = None
+            while command is not None:
+                running = self._apply(*command) and running
+                try:
+                    command = self._commands.get_nowait()
+                except queue.Empty:
+                    command = None
+            if running:
+                self._advance()
+        self._set_buzzer(False)
+        self._write('')
+
+    def _apply(self, kind, arg):
+        if kind == 'show':
+            self._text = arg
+        elif kind == 'buzz':
+            pattern, message = arg
+            now = self.clock()
+            self._steps = []
+            for on, off in pattern:
+                now += on
+                self._steps.append((True, now))
+                if off:
+                    now += off
+                    self._steps.append((False, now))
+            self._message = message
+        elif kind == 'silence':
+            self._steps = []
+        elif kind == 'stop':
+            return False
+        return True
+
+    def _advance(self):
+        now = self.clock()
+        while self._steps and self._steps[0][1] <= now:
+            self._steps.pop(0)
+        if self._steps:
+            self._set_buzzer(self._steps[0][0])
+        else:
+            self._set_buzzer(False)
+            self._message = None
+
+        text = self._pending_text()
+        if text != self._displayed and (
+                self._last_redraw is None or now - self._last_redraw >= self.min_redraw):
+            self._write(text)
+            self._last_redraw = now
+
+    def _pending_text(self):
+        return self._message if self._message is not None else self._text
+
+    def _next_deadline(self):
+        now = self.clock()
+        deadlines = []
+        if self._steps:
+            deadlines.append(self._steps[0][1])
+        if self._pending_text() != self._displayed and self._last_redraw is not None:
+            deadlines.append(self._last_redraw + self.min_redraw)
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - now)
+
+    def _set_buzzer(self, level):
+        if level == self._level:
+            return
+        try:
+            self.gpio.output(self.buzzer_pin, self.gpio.HIGH if level else self.gpio.LOW)
+            self._level = level
+        except Exception as e:
+            print("[ACTUATOR] Buzzer error:", e)
+
+    def _write(self, text):
+        try:
+            with LCD_WRITE_SECONDS.time():
+                self.lcd.clear()
+                if text:
+                    self.lcd.write_string(text)
+            self._displayed = text
+            self.redraws += 1
+            print("[LCD] " + text)
+        except Exception as e:
+            print("[ACTUATOR] LCD error:", e)
+
+
+# --- Fake drivers ---
+# Stand-ins for RPi.GPIO and CharLCD that record what was done to them, for
+# running off the Pi and for tests.
+class FakeGPIO:
+    BCM = 'BCM'
+    OUT = 'OUT'
+    HIGH = 1
+    LOW = 0
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.pins = {}
+        self.history = []
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, mode):
+        self.pins[pin] = self.LOW
+
+    def output(self, pin, level):
+        self.pins[pin] = level
+        self.history.append((self.clock(), pin, level))
+
+    def cleanup(self):
+        self.pins.clear()
+
+
+class FakeLCD:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.text = ''
+        self.history = []
+
+    def clear(self):
+        self.text = ''
+
+    def write_string(self, text):
+        self.text += text
+        self.history.append((self.clock(), self.text))
@@ -0,0 +1,139 @@
+import threading
+import time
+
+import numpy as np
+
+
+# --- MCP3008 sampler ---
+# Reads every configured channel once per tick, `rate` ticks a second, into a
+# fixed-size NumPy ring (one row per tick, one column per channel), so readers
+# get windowed statistics instead of a single noisy sample.
+#
+# The MCP3008 starts a conversion on the falling edge of CS and needs CS
+# raised again before the next one, so channels cannot be chained into one
+# long SPI message. A tick is therefore one 3-byte xfer2 per channel issued
+# back to back from this thread, with the request buffers built once.
+#
+# Channels given `thresholds` {channel: (on, off)} also get a debounced state:
+# the windowed median has to rise above `on` to turn on and fall below `off`
+# to turn off again, so flicker and single-sample spikes don't toggle it.
+class Mcp3008Sampler(threading.Thread):
+    def __init__(self, spi, channels=(0,), rate=50.0, window=2.0, thresholds=None,
+                 debounce=0.5, clock=time.monotonic):
+        super().__init__(daemon=True)
+        self.spi = spi
+        self.channels = tuple(channels)
+        self.period = 1.0 / rate
+        self.slots = max(1, int(round(rate * window)))
+        self.thresholds = dict(thresholds or {})
+        self.debounce_samples = max(1, int(round(rate * debounce)))
+        self.clock = clock
+        self._column = {channel: i for i, channel in enumerate(self.channels)}
+        self._requests = [[1, (8 + channel) << 4, 0] for channel in self.channels]
+        self._ring = np.zeros((self.slots, len(self.channels)), np.uint16)
+        self._times = np.zeros(self.slots, np.float64)
+        self._count = 0
+        self._states = {channel: False for channel in self.thresholds}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.errors = 0
+
+    # --- Sampling ---
+    def read_channels(self):
+        values = []
+        for request in self._requests:
+            adc = self.spi.xfer2(list(request))
+            values.append(((adc[1] & 3) << 8) + adc[2])
+        return values
+
+    def sample(self):
+        # One tick; run() calls this at `rate`, tests can call it directly
+        values = self.read_channels()
+        with self._lock:
+            slot = self._count % self.slots
+            self._ring[slot] = values
+            self._times[slot] = self.clock()
+            self._count += 1
+            for channel, (on, off) in self.thresholds.items():
+                level = float(np.median(self._window(self._column[channel], self.debounce_samples)))
+                self._states[channel] = level > (off if self._states[channel] else on)
+        return values
+
+    def run(self):
+        next_tick = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                self.errors += 1
+                print("[ADC] Read error:", e)
+            next_tick += self.period
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                next_tick = time.monotonic()  # fell behind: don't burst to catch up
+                delay = 0
+            self._stop_event.wait(delay)
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    # --- Readers ---
+    def _window(self, column, samples):
+        samples = min(samples, self._count, self.slots)
+        end = self._count % self.slots
+        if samples <= end:
+            return self._ring[end - samples:end, column]
+        return np.concatenate((self._ring[self.slots - (samples - end):, column],
+                               self._ring[:end, column]))
+
+    def window(self, channel, seconds=None):
+        # Copy of the channel's samples from the last `seconds` (default: all)
+        samples = self.slots if seconds is None else max(1, int(round(seconds / self.period)))
+        with self._lock:
+            return self._window(self._column[channel], samples).copy()
+
+    def latest(self, channel):
+        with self._lock:
+            if not self._count:
+                return None
+            return int(self._ring[(self._count - 1) % self.slots, self._column[channel]])
+
+    def mean(self, channel, seconds=None):
+        values = self.window(channel, seconds)
+        return float(values.mean()) if values.size else None
+
+    def median(self, channel, seconds=None):
+        values = self.window(channel, seconds)
+        return float(np.median(values)) if values.size else None
+
+    def state(self, channel):
+        with self._lock:
+            return self._states[channel]
+
+    @property
+    def count(self):
+        return self._count
+
+
+# --- Fake SPI ---
+# Stand-in for spidev.SpiDev that answers MCP3008 requests from
+# source(channel) -> 0..1023, for running off the Pi and for tests.
+class FakeSpi:
+    def __init__(self, source=lambda channel: 0):
+        self.source = source
+        self.max_speed_hz = 0
+        self.transfers = 0
+
+    def open(self, bus, device):
+        pass
+
+    def xfer2(self, data):
+        self.transfers += 1
+        channel = (data[1] >> 4) & 7
+        value = int(self.source(channel)) & 0x3FF
+        return [0, value >> 8, value & 0xFF]
+
+    def close(self):
+        pass
@@ -1,17 +1,39 @@
-from flask import Flask, Response
+from flask import Flask, Response, request
 import cv2
-import imutils
-import numpy as np
 import datetime
+import functools
 import mysql.connector
 import time
+import threading
+import os
+from frame_hub import FrameHub, CaptureThread
+from luma import luma_view, brightness as luma_brightness
+from detection import DetectionWorker
+from tracking import TrackingDetector
+from detectors import create_detector
+from schedule_cache import ScheduleCache, UNKNOWN
+from db import ConnectionPool, MonitoringDB
+from outbox import Outbox, OutboxSender, PermanentError
+from mjpeg import MjpegBroadcaster
+from occupancy import OccupancyEngine, SignalRule
+from clips import ClipIndex, ClipRecorder
+from telemetry import TelemetryStore
+from events import StateChannel
+from async_server import AsyncStreamServer
+from metrics import register_routes, stage
 
 app = Flask(__name__)
-camera = cv2.VideoCapture(1)
+open_capture = functools.partial(cv2.VideoCapture, 1)
+camera = open_capture()
 
 if not camera.isOpened():
     print("Error: Camera failed to open.")
 
+# The capture thread owns the camera and reopens it with backoff when it
+# drops; every /video viewer reads from the hub and resumes with it.
+frame_hub = FrameHub()
+capture_thread = CaptureThread(camera, frame_hub, reopen=open_capture)
+
 db_config = {
     'host': '192.168.1.13',
     'user': 'root',
@@ -19,146 +41,192 @@ db_config = {
     'database': 'monitoring'
 }
 
-hog = cv2.HOGDescriptor()
-hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+DB_POOL_SIZE = 4
+STREAM_URL = "http://192.168.1.7:5000/video"
+# Clips and /events are keyed by the room code, as in test.py and supervisor.py;
+# the numeric room_id is only for the DB
+ROOM_CODE = 'RM123MB'
+
+db = MonitoringDB(ConnectionPool(lambda: mysql.connector.connect(**db_config), size=DB_POOL_SIZE))
+
+# Flags are journaled locally first and written to the DB by a background sender
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+outbox = Outbox(os.path.join(DATA_DIR, 'app_outbox.db'))
+
+# Room state for /events subscribers
+state_channel = StateChannel()
+
+# Brightness, people and schedule status per detection, for utilization reports
+telemetry = TelemetryStore(os.path.join(DATA_DIR, 'telemetry'))
+
+# Last 10s and next 5s of video are saved with every flag
+clip_index = ClipIndex(os.path.join(DATA_DIR, 'clips', 'index.db'))
+recorder = ClipRecorder(frame_hub, clip_index, os.path.join(DATA_DIR, 'clips'))
+
+ANALYSIS_SIZE = (640, 480)  # detection, tracking and overlay size
+
+# Person detector backend, see detectors.create_detector(). Settings from
+# `python tune_hog.py <clips> --base 640x480 --out hog_tuned_640.json`
+# override these once that file exists.
+DETECTOR = {'backend': 'hog', 'win_stride': [4, 4], 'padding': [8, 8], 'scale': 1.05,
+            'tuned': 'hog_tuned_640.json'}
+person_detector = create_detector(DETECTOR, size=ANALYSIS_SIZE)
+
+# Serve /, /video, /video_feed, /events and /metrics from one asyncio loop
+# instead of Flask's thread per viewer (no /metrics/profile in that mode)
+SERVE_ASYNC = False
+
+DETECTION_INTERVAL = 0.5  # seconds between HOG runs, independent of the stream rate
+TRACK_INTERVAL = 0.125  # boxes are moved by optical flow this often between HOG runs
+SCHEDULE_TTL = 300  # seconds before today's schedule is reloaded from the DB
 
-last_detected = None
 room_id = None  # Will be set once per server run or per stream
 
-def get_day_number():
-    return (datetime.datetime.today().weekday() + 1) % 7 or 7
+# Latest monitoring state, drawn onto the stream by every viewer
+light_on = False
+schedule_status = None
+flagged_at = None
+
+# HOG every DETECTION_INTERVAL, tracked in between; NMS-merged boxes with ids
+tracker = TrackingDetector(person_detector, size=ANALYSIS_SIZE,
+                           every=round(DETECTION_INTERVAL / TRACK_INTERVAL))
+detection_worker = DetectionWorker(frame_hub, tracker, interval=TRACK_INTERVAL)
+
+def get_day_number(when=None):
+    when = when or datetime.datetime.today()
+    return (when.weekday() + 1) % 7 or 7
+
+BRIGHTNESS_SECONDS = stage('brightness')
 
 def detect_brightness(frame):
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    return np.mean(gray)
+    # Mean luma over every 4th pixel, without converting the frame
+    with BRIGHTNESS_SECONDS.time():
+        return luma_brightness(luma_view(frame, 4)).mean
 
 def get_room_id_by_stream_url():
     global room_id
     try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor()
-        cursor.execute("SELECT room_id FROM tbl_room WHERE stream_url = %s", ("http://192.168.1.7:5000/video",))
-        row = cursor.fetchone()
-        room_id = row[0] if row else None
-        cursor.close()
-        conn.close()
+        room_id = db.room_id_for_stream(STREAM_URL)
     except Exception as e:
         print(f"DB error getting room_id: {e}")
         room_id = None
 
 def handle_detection_action():
+    recorder.trigger(ROOM_CODE, 'Presence')
+    outbox.put('flag_schedule', {
+        'room_id': room_id,
+        'flagged_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    })
+
+def deliver_flag(event):
+    # Uses the time the flag was raised, not the delivery time, so retries
+    # land on the same schedule row.
     try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor()
-        now = datetime.datetime.now()
-        current_day = str(get_day_number())
-        current_time = now.time()
-
-        cursor.execute("""
-            SELECT schedule_id FROM tbl_schedule
-            WHERE room_id = %s AND schedule_day = %s
-            AND schedule_time <= %s AND end_time >= %s
-        """, (room_id, current_day, current_time, current_time))
-        result = cursor.fetchone()
-
-        if result:
-            schedule_id = result[0]
-            cursor.execute("""
-                UPDATE tbl_schedule SET status = 'Flagged'
-                WHERE schedule_id = %s
-            """, (schedule_id,))
-            print(f"Updated existing schedule ID {schedule_id} to Flagged.")
-        else:
-            cursor.execute("""
-                INSERT INTO tbl_schedule (schedule_day, schedule_time, duration, room_id, used_by, date_added, status, is_permanent)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                current_day, current_time, 30,
-                room_id, 0, now, 'Flagged', 'Temporary'
-            ))
-            print(f"Inserted new temporary schedule for Room {room_id}.")
-
-        conn.commit()
-        cursor.close()
-        conn.close()
-    except Exception as e:
-        print(f"DB error in handle_detection_action: {e}")
+        flag_room_id = event.payload['room_id']
+        flagged_at = datetime.datetime.strptime(event.payload['flagged_at'], '%Y-%m-%d %H:%M:%S')
+    except (KeyError, TypeError, ValueError) as e:
+        raise PermanentError(f"bad flag payload {event.payload!r}: {e}")
+    action, schedule_id = db.flag_schedule(flag_room_id, get_day_number(flagged_at), flagged_at)
+    if action == 'updated':
+        print(f"Updated existing schedule ID {schedule_id} to Flagged.")
+    elif action == 'inserted':
+        print(f"Inserted new temporary schedule for Room {flag_room_id}.")
+    schedule_cache.invalidate(flag_room_id)
 
-def gen_frames():
-    global last_detected, room_id
+outbox_sender = OutboxSender(outbox, {'flag_schedule': deliver_flag})
+
+# Today's schedule per room, refreshed every SCHEDULE_TTL seconds or after a flag
+schedule_cache = ScheduleCache(db.schedules_for_day, ttl=SCHEDULE_TTL)
+
+# Human or light present for 5 minutes flags the room, again every 5 minutes
+# while it lasts
+occupancy = OccupancyEngine({'Presence': SignalRule(300, repeat=300)})
+
+def monitoring_loop():
+    global room_id, light_on, schedule_status, flagged_at
     if room_id is None:
         get_room_id_by_stream_url()
         if room_id is None:
             print("Warning: room_id is None. Check your stream_url in DB.")
-    
-    while True:
-        success, frame = camera.read()
-        if not success:
-            print("Failed to grab frame")
-            break
-        frame = imutils.resize(frame, width=640)
-        orig = frame.copy()
-
-        # Detect humans
-        (regions, _) = hog.detectMultiScale(frame, winStride=(4, 4), padding=(8, 8), scale=1.05)
 
-        for (x, y, w, h) in regions:
-            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-
-        human_detected = len(regions) > 0
-
-        if human_detected:
-            cv2.putText(frame, "Human Detected", (10, 30),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+    detection_seq = 0
+    last_update = 0.0
+    while not detection_worker.stopped:
+        detection = detection_worker.wait(detection_seq)
+        if detection.seq == detection_seq:
+            continue
+        detection_seq = detection.seq
+        # Tracked boxes arrive every TRACK_INTERVAL; keep the checks at
+        # DETECTION_INTERVAL
+        if time.monotonic() - last_update < DETECTION_INTERVAL - TRACK_INTERVAL / 2:
+            continue
+        last_update = time.monotonic()
+        human_detected = len(detection.rects) > 0
 
         # Detect brightness
-        brightness = detect_brightness(orig)
-        light_status = "ON" if brightness > 100 else "OFF"
-        light_on = light_status == "ON"
-        color = (0, 255, 255) if light_on else (0, 0, 255)
-        cv2.putText(frame, f"Light: {light_status}", (10, 60),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+        _, frame = frame_hub.latest()
+        brightness = 0.0
+        if frame is not None:
+            brightness = detect_brightness(frame)
+            light_on = brightness > 100
 
         # Check schedule status only if room_id available
         if room_id is not None:
-            try:
-                conn = mysql.connector.connect(**db_config)
-                cursor = conn.cursor()
-                current_day = str(get_day_number())
-                now = datetime.datetime.now()
-                current_time = now.time()
-
-                cursor.execute("""
-                    SELECT status FROM tbl_schedule
-                    WHERE room_id = %s AND schedule_day = %s
-                    AND schedule_time <= %s AND end_time >= %s
-                """, (room_id, current_day, current_time, current_time))
-                row = cursor.fetchone()
-                cursor.close()
-                conn.close()
-            except Exception as e:
-                print(f"DB error checking schedule status: {e}")
-                row = None
-
-            if row and row[0] == 'Using':
-                cv2.putText(frame, "Status: Using", (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (200, 200, 255), 2)
-                last_detected = None
+            schedule_status = schedule_cache.status(room_id)
+            # Never flag a room whose schedule could not be read
+            if schedule_status in ('Using', UNKNOWN):
+                occupancy.reset(room_id)
             else:
-                if human_detected or light_on:
-                    if last_detected is None:
-                        last_detected = time.time()
-                    elif time.time() - last_detected >= 300:  # 5 minutes
+                for event in occupancy.observe(room_id, 'Presence', human_detected or light_on):
+                    if event.kind == 'flagged':
                         handle_detection_action()
-                        last_detected = None
-                        cv2.putText(frame, "⚠️ Flagged!", (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-                else:
-                    last_detected = None
+                        flagged_at = time.time()
+            telemetry.record(ROOM_CODE, brightness=brightness, humans=len(detection.rects),
+                             status=schedule_status)
+
+        # Dashboards on /events only hear about changes
+        state_channel.publish(ROOM_CODE, human=human_detected, light=light_on,
+                              status=schedule_status,
+                              flagged_at=int(flagged_at) if flagged_at else None,
+                              people=sorted(track.id for track in tracker.tracks),
+                              camera=capture_thread.health().state)
+
+def render_overlay(frame):
+    frame = cv2.resize(frame, ANALYSIS_SIZE)
 
-        # Encode frame
-        _, buffer = cv2.imencode('.jpg', frame)
-        frame_bytes = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+    # Tracked people, with their ids and how long they have been there
+    regions = tracker.tracks
+    for track in regions:
+        x, y, w, h = track.rect
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        cv2.putText(frame, f"#{track.id} {int(track.dwell)}s", (x, max(15, y - 5)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+
+    if len(regions) > 0:
+        cv2.putText(frame, "Human Detected", (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+
+    light_status = "ON" if light_on else "OFF"
+    color = (0, 255, 255) if light_on else (0, 0, 255)
+    cv2.putText(frame, f"Light: {light_status}", (10, 60),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+
+    if schedule_status == 'Using':
+        cv2.putText(frame, "Status: Using", (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (200, 200, 255), 2)
+    if flagged_at is not None and time.time() - flagged_at < 5:
+        cv2.putText(frame, "⚠️ Flagged!", (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+    return frame
+
+# Each frame is drawn and encoded once, however many viewers are connected
+broadcaster = MjpegBroadcaster(frame_hub, render=render_overlay)
+
+def gen_frames():
+    return broadcaster.gen_frames()
+
+# Stage latencies are recorded where the work happens; these are read on scrape
+for component in (broadcaster, capture_thread, detection_worker, outbox, recorder, state_channel):
+    component.register_metrics()
+register_routes(app)
 
 @app.route('/')
 def index():
@@ -172,5 +240,20 @@ def index():
 def video():
     return Response(gen_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/events')
+def events():
+    return Response(state_channel.stream(ROOM_CODE, request.headers.get('Last-Event-ID')),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
+    capture_thread.start()
+    detection_worker.start()
+    recorder.start()
+    outbox_sender.start()
+    threading.Thread(target=monitoring_loop, daemon=True).start()
+    if SERVE_ASYNC:
+        AsyncStreamServer(broadcaster, index(), port=5000,
+                          state_channel=state_channel, events_room=ROOM_CODE).run()
+    else:
+        app.run(host='0.0.0.0', port=5000)
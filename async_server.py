@@ -0,0 +1,293 @@
+import argparse
+import asyncio
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from frame_hub import FrameHub, JpegFrame
+from mjpeg import MjpegBroadcaster, mjpeg_part
+from metrics import METRICS
+
+
+# --- Asyncio streaming server ---
+# Serves /, /video and /video_feed from one event loop instead of one Flask
+# thread per viewer. A single producer thread waits on the hub and gets each
+# frame's JPEG from the broadcaster (encode once, passthrough as configured),
+# then hands it to the loop, which wakes every viewer coroutine at once.
+#
+# Backpressure: a viewer's frame is written only while its socket buffer is
+# below max_buffer; otherwise that frame is dropped for that viewer, so a slow
+# client falls behind by frames, never by memory. A client whose buffer has
+# not drained for stall_timeout seconds is disconnected.
+#
+# Plain asyncio streams and a minimal HTTP/1.1 parser, no extra dependency.
+# /metrics is served here too, and /events when given a StateChannel: its
+# blocking stream runs on a daemon thread per subscriber (at most
+# max_event_streams, as in Flask mode) and feeds the loop. /metrics/profile
+# needs Flask mode.
+MJPEG_HEADERS = (b'HTTP/1.1 200 OK\r\n'
+                 b'Content-Type: multipart/x-mixed-replace; boundary=frame\r\n'
+                 b'Cache-Control: no-cache\r\n'
+                 b'Connection: close\r\n\r\n')
+
+EVENTS_HEADERS = (b'HTTP/1.1 200 OK\r\n'
+                  b'Content-Type: text/event-stream\r\n'
+                  b'Cache-Control: no-cache\r\n'
+                  b'X-Accel-Buffering: no\r\n'
+                  b'Connection: close\r\n\r\n')
+
+
+def _response(status, body, content_type='text/html; charset=utf-8'):
+    body = body.encode() if isinstance(body, str) else body
+    return (f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n'
+            f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n').encode() + body
+
+
+class AsyncStreamServer:
+    def __init__(self, broadcaster, index_html, host='0.0.0.0', port=5000,
+                 max_buffer=512 * 1024, stall_timeout=10.0, stream_paths=('/video', '/video_feed'),
+                 state_channel=None, events_room=None, max_event_streams=64):
+        self.broadcaster = broadcaster
+        self.hub = broadcaster.hub
+        self.index_html = index_html
+        self.host = host
+        self.port = port
+        self.max_buffer = max_buffer
+        self.stall_timeout = stall_timeout
+        self.stream_paths = set(stream_paths)
+        self.state_channel = state_channel
+        self.events_room = events_room
+        self.max_event_streams = max_event_streams
+        self.event_streams = 0
+        self.viewers = 0
+        self.sent_frames = 0
+        self.dropped_frames = 0
+        self._part = None
+        self._frame_event = None
+        self._loop = None
+        self._has_viewers = threading.Event()
+        self._stop_event = threading.Event()
+        METRICS.gauge('async_stream_dropped_frames', lambda: self.dropped_frames,
+                      "Frames skipped for viewers with a full socket buffer")
+
+    # --- Producer thread ---
+    def _produce(self):
+        seq = 0
+        while not self._stop_event.is_set():
+            if not self._has_viewers.wait(0.5):
+                continue  # nobody is watching: don't encode at all
+            started = time.monotonic()
+            newest, frame = self.hub.wait(seq, timeout=1.0)
+            if frame is None:
+                if self.hub.closed:
+                    break
+                continue
+            if newest == seq:
+                continue
+            seq = newest
+            frame_bytes = self.broadcaster.frame_bytes(seq, frame)
+            if frame_bytes is None:
+                continue
+            self._loop.call_soon_threadsafe(self._publish, mjpeg_part(frame_bytes))
+            remaining = self.broadcaster.min_interval - (time.monotonic() - started)
+            if remaining > 0:
+                self._stop_event.wait(remaining)
+
+    def _publish(self, part):
+        # On the loop: swap in a fresh event so waiting viewers wake exactly once
+        self._part = part
+        event, self._frame_event = self._frame_event, asyncio.Event()
+        event.set()
+
+    # --- Connections ---
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 10.0)
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 10.0)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            parts = request_line.decode('latin-1').split()
+            if len(parts) < 2 or parts[0] not in ('GET', 'HEAD'):
+                writer.write(_response('405 Method Not Allowed', 'Method Not Allowed', 'text/plain'))
+            else:
+                path = parts[1].split('?', 1)[0]
+                if path == '/':
+                    writer.write(_response('200 OK', self.index_html))
+                elif path == '/metrics':
+                    writer.write(_response('200 OK', METRICS.render(), 'text/plain; version=0.0.4'))
+                elif path in self.stream_paths:
+                    await self._stream(writer)
+                elif path == '/events' and self.state_channel is not None:
+                    await self._events(writer, headers.get('last-event-id'))
+                else:
+                    writer.write(_response('404 Not Found', 'Not Found', 'text/plain'))
+            if not writer.transport.is_closing():
+                await asyncio.wait_for(writer.drain(), self.stall_timeout)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _stream(self, writer):
+        transport = writer.transport
+        writer.write(MJPEG_HEADERS)
+        self._add_viewer(1)
+        stalled_since = None
+        try:
+            while not transport.is_closing():
+                await self._frame_event.wait()
+                if transport.get_write_buffer_size() > self.max_buffer:
+                    self.dropped_frames += 1
+                    now = time.monotonic()
+                    stalled_since = stalled_since or now
+                    if now - stalled_since > self.stall_timeout:
+                        # Nothing left worth flushing: drop the socket now
+                        transport.abort()
+                        break
+                    continue
+                stalled_since = None
+                writer.write(self._part)
+                self.sent_frames += 1
+        finally:
+            self._add_viewer(-1)
+
+    async def _events(self, writer, last_event_id):
+        if self.event_streams >= self.max_event_streams:
+            writer.write(_response('503 Service Unavailable', 'Too many /events clients', 'text/plain'))
+            return
+        transport = writer.transport
+        writer.write(EVENTS_HEADERS)
+        chunks = asyncio.Queue()
+        done = threading.Event()
+        stream = self.state_channel.stream(self.events_room, last_event_id)
+        self.event_streams += 1
+        threading.Thread(target=self._pump_events, args=(stream, chunks, done), daemon=True).start()
+        try:
+            while not transport.is_closing():
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                writer.write(chunk.encode())
+                await asyncio.wait_for(writer.drain(), self.stall_timeout)
+        finally:
+            # The pump notices at its next message (keepalive at the latest)
+            done.set()
+            self.event_streams -= 1
+
+    def _pump_events(self, stream, chunks, done):
+        # Subscriber thread: blocking SSE generator -> the loop's queue
+        try:
+            for chunk in stream:
+                if done.is_set():
+                    break
+                self._loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+        except RuntimeError:
+            pass  # the loop is gone
+        finally:
+            stream.close()
+            try:
+                self._loop.call_soon_threadsafe(chunks.put_nowait, None)
+            except RuntimeError:
+                pass
+
+    def _add_viewer(self, delta):
+        self.viewers += delta
+        if delta > 0:
+            self.broadcaster.add_viewer()
+        else:
+            self.broadcaster.remove_viewer()
+        if self.viewers:
+            self._has_viewers.set()
+        else:
+            self._has_viewers.clear()
+
+    # --- Running ---
+    async def serve_forever(self):
+        self._loop = asyncio.get_running_loop()
+        self._frame_event = asyncio.Event()
+        producer = threading.Thread(target=self._produce, daemon=True)
+        producer.start()
+        server = await asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+        print(f"[ASYNC] Serving on http://{self.host}:{self.port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._stop_event.set()
+            self._has_viewers.set()
+
+    def run(self):
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            pass
+
+
+# --- Synthetic source for load tests ---
+def synthetic_source(hub, fps=15.0, size=(320, 240), raw=False, stop=None):
+    # Publishes a moving gradient at `fps`, as camera-style JPEGs (passthrough)
+    # or, with raw, as BGR frames the broadcaster has to encode
+    width, height = size
+    base = np.tile(np.linspace(0, 255, width, dtype=np.uint8), (height, 1))
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), 70]
+    n = 0
+    while stop is None or not stop.is_set():
+        started = time.monotonic()
+        image = np.dstack([np.roll(base, n * 4, axis=1), base, np.full_like(base, n % 256)])
+        if raw:
+            hub.publish(image)
+        else:
+            hub.publish(JpegFrame(cv2.imencode('.jpg', image, params)[1].tobytes()))
+        n += 1
+        remaining = 1.0 / fps - (time.monotonic() - started)
+        if remaining > 0:
+            time.sleep(remaining)
+
+
+INDEX_HTML = """
+<html>
+    <body>
+        <h1>Live Camera</h1>
+        <img src="/video_feed" />
+    </body>
+</html>
+"""
+
+
+if __name__ == '__main__':
+    # Stand-alone server on a synthetic source, for loadtest_stream.py
+    parser = argparse.ArgumentParser(description="Serve a synthetic MJPEG stream")
+    parser.add_argument('--mode', choices=['async', 'flask'], default='async')
+    parser.add_argument('--fps', type=float, default=15.0)
+    parser.add_argument('--size', default='320x240')
+    parser.add_argument('--raw', action='store_true', help="publish BGR frames and encode them")
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+
+    hub = FrameHub()
+    size = tuple(int(v) for v in args.size.split('x'))
+    threading.Thread(target=synthetic_source, args=(hub, args.fps, size, args.raw), daemon=True).start()
+    broadcaster = MjpegBroadcaster(hub, quality=70)
+
+    if args.mode == 'async':
+        AsyncStreamServer(broadcaster, INDEX_HTML, port=args.port).run()
+    else:
+        from flask import Flask, Response
+
+        app = Flask(__name__)
+
+        @app.route('/video_feed')
+        def video_feed():
+            return Response(broadcaster.gen_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+        @app.route('/')
+        def index():
+            return INDEX_HTML
+
+        app.run(host='0.0.0.0', port=args.port, threaded=True)
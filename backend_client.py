@@ -0,0 +1,134 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from schedule_cache import get_day_number
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+# --- Circuit breaker ---
+# After `failure_threshold` consecutive failures the circuit opens and calls
+# fail immediately for `reset_timeout` seconds; then a single trial call is
+# let through (half-open) and its outcome closes or re-opens the circuit.
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def allow(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    print(f"[BACKEND] Circuit open after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = self.clock()
+
+
+# --- Backend client ---
+# One keep-alive session for every call to the PHP backend, strict
+# (connect, read) timeouts, and a small thread pool so callers can fire a
+# request and collect the Future later instead of blocking on it.
+class BackendClient:
+    def __init__(self, base_url, timeout=(2.0, 5.0), pool_size=4, max_workers=2, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='backend')
+
+    def request(self, method, path, **kwargs):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"backend circuit open, skipping {method} {path}")
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            res = self.session.request(method, f"{self.base_url}/{path.lstrip('/')}", **kwargs)
+        except requests.RequestException:
+            self.breaker.record_failure()
+            raise
+        if res.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            # A 4xx is the backend answering; it says nothing about its health
+            self.breaker.record_success()
+        res.raise_for_status()
+        return res.json()
+
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(fn, *args, **kwargs)
+
+    # --- Endpoints ---
+    def get_room_id(self, code):
+        return self.request('GET', 'ajax/get_room_id.php', params={'code': code}).get('room_id')
+
+    def get_schedule(self, room_id, schedule_day):
+        data = self.request('GET', 'ajax/get_schedule.php', params={
+            'room_id': room_id,
+            'schedule_day': schedule_day
+        })
+        if not data['success']:
+            raise RuntimeError(data.get('message', 'schedule lookup failed'))
+        return [(s['schedule_id'], s['schedule_time'], s['end_time'], s['status'])
+                for s in data['schedules']]
+
+    def check_schedule(self, room_id, when):
+        # Status at one moment from the older per-lookup endpoint; the
+        # ScheduleCache fallback while get_schedule is unavailable
+        data = self.request('GET', 'ajax/check_schedule.php', params={
+            'room_id': room_id,
+            'schedule_day': get_day_number(when),
+            'current_time': when.strftime('%H:%M:%S')
+        })
+        return data['status'] if data['success'] else None
+
+    def flag_schedule(self, payload, event_id):
+        return self.request('POST', 'ajax/flag_schedule.php',
+                            json=dict(payload, event_id=event_id),
+                            headers={'Idempotency-Key': event_id})
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
@@ -0,0 +1,106 @@
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from detectors import create_detector
+
+
+# --- Detector benchmark ---
+# Runs each configured backend over the same frames on this CPU and reports
+# throughput (frames/s) and per-call latency. --cameras N feeds N frames per
+# call, which is what the supervisor does with a batching backend.
+#
+#   python bench_detectors.py --input clip.mp4 \
+#       --detector '{"backend": "hog", "scale": 1.02}' \
+#       --detector '{"backend": "dnn", "model": "MobileNetSSD.caffemodel", "config": "MobileNetSSD.prototxt"}'
+
+def load_frames(source, count, size):
+    frames = []
+    if source is None:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8) for _ in range(count)]
+    elif os.path.isdir(source):
+        for path in sorted(glob.glob(os.path.join(source, '*')))[:count]:
+            image = cv2.imread(path)
+            if image is not None:
+                frames.append(image)
+    else:
+        capture = cv2.VideoCapture(source)
+        while len(frames) < count:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            frames.append(frame)
+        capture.release()
+    if not frames:
+        raise SystemExit(f"no frames could be read from {source}")
+    return [cv2.resize(f, size) for f in frames]
+
+
+def benchmark(detector, frames, cameras, warmup=2):
+    batches = [frames[i:i + cameras] for i in range(0, len(frames) - cameras + 1, cameras)]
+    if not batches:
+        batches = [frames[:cameras]]
+    for batch in batches[:warmup]:
+        detector.detect_batch(batch)
+
+    latencies = []
+    detections = 0
+    started = time.perf_counter()
+    for batch in batches:
+        t0 = time.perf_counter()
+        results = detector.detect_batch(batch)
+        latencies.append(time.perf_counter() - t0)
+        detections += sum(len(rects) for rects, _ in results)
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array(latencies) * 1000.0
+    frame_count = sum(len(b) for b in batches)
+    return {
+        'backend': detector.name,
+        'cameras': cameras,
+        'frames': frame_count,
+        'fps': frame_count / elapsed if elapsed else 0.0,
+        'latency_ms_mean': float(latencies.mean()),
+        'latency_ms_p50': float(np.percentile(latencies, 50)),
+        'latency_ms_p95': float(np.percentile(latencies, 95)),
+        'detections': detections,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark person detector backends on CPU")
+    parser.add_argument('--input', help="video file or image directory (random frames if omitted)")
+    parser.add_argument('--detector', action='append', default=[],
+                        help="detector config as JSON; repeat to compare backends")
+    parser.add_argument('--frames', type=int, default=60)
+    parser.add_argument('--width', type=int, default=320)
+    parser.add_argument('--height', type=int, default=240)
+    parser.add_argument('--cameras', type=int, default=1, help="frames per detector call")
+    parser.add_argument('--threads', type=int, default=None, help="cv2.setNumThreads before running")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+    configs = [json.loads(c) for c in args.detector] or [{'backend': 'hog'}]
+    frames = load_frames(args.input, args.frames, (args.width, args.height))
+
+    results = []
+    print(f"{'backend':<8} {'cams':>4} {'frames':>6} {'fps':>8} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for config in configs:
+        result = benchmark(create_detector(config, (args.width, args.height)), frames, args.cameras)
+        result['config'] = config
+        results.append(result)
+        print(f"{result['backend']:<8} {result['cameras']:>4} {result['frames']:>6} "
+              f"{result['fps']:>8.1f} {result['latency_ms_mean']:>9.1f} "
+              f"{result['latency_ms_p50']:>8.1f} {result['latency_ms_p95']:>8.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,290 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from frame_hub import FrameHub, CaptureThread, JpegFrame, as_image, _compressed
+from frame_sources import ReplaySource, SimulatedClock
+from actuators import ActuatorService, FakeGPIO, FakeLCD
+from detection import Detection, MotionGatedDetector
+from detectors import create_detector
+from events import StateChannel
+from mjpeg import MjpegBroadcaster
+from monitor import RoomMonitor, occupancy_rules
+from occupancy import OccupancyEngine
+from telemetry import TelemetryStore
+from tracking import TrackingDetector
+
+
+# --- Pipeline benchmark ---
+# Replays a recording through test.py's pipeline (FrameHub, TrackingDetector
+# over MotionGatedDetector/HOG, monitor.RoomMonitor with its occupancy rules,
+# telemetry and LCD/buzzer commands, MjpegBroadcaster) on a simulated clock,
+# as fast as the CPU allows, and reports per-stage latency, end-to-end fps and
+# memory. The script itself opens GPIO, the LCD and a backend at import time,
+# so the monitor gets FakeGPIO/FakeLCD and no schedule instead.
+#
+#   python bench_pipeline.py --input clip.mp4 --mjpeg --save-baseline base.json
+#   python bench_pipeline.py --input clip.mp4 --mjpeg --compare base.json
+#
+# --compare exits with status 1 if a stage got slower (or fps lower) than the
+# baseline by more than --tolerance.
+
+STAGES = ['capture', 'decode', 'hog', 'track', 'monitor', 'encode']
+
+BUZZER_PIN = 18
+
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def synthetic_recording(count, size):
+    # Moving bright block on a gradient, written as JPEGs, for runs without --input
+    directory = tempfile.mkdtemp(prefix='bench_frames_')
+    width, height = size
+    base = np.tile(np.linspace(40, 160, width, dtype=np.uint8), (height, 1))
+    for i in range(count):
+        image = cv2.merge([base, base, base])
+        x = (i * 4) % max(1, width - 60)
+        cv2.rectangle(image, (x, height // 4), (x + 60, height // 4 + 120), (230, 230, 230), -1)
+        cv2.imwrite(os.path.join(directory, f'{i:05d}.jpg'), image)
+    return directory
+
+
+def summarize(samples):
+    values = np.array(samples) * 1000.0
+    if not values.size:
+        return {'count': 0, 'mean_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0}
+    return {
+        'count': int(values.size),
+        'mean_ms': float(values.mean()),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p95_ms': float(np.percentile(values, 95)),
+    }
+
+
+def run_stages(source, clock, detector_config, size, track_every, detections_every, gated, quality):
+    # The monitoring script's pipeline, paced by replayed frames: the tracker
+    # runs every `track_every` frames (HOG on every `detections_every`-th of
+    # those runs, optical flow otherwise) and RoomMonitor.update() on the
+    # frames a detection lands on, like the DETECTION_INTERVAL-paced loop
+    hub = FrameHub()
+    person_detector = create_detector(detector_config, size)
+    if gated:
+        detector = MotionGatedDetector(person_detector, size=size, clock=clock.monotonic)
+    else:
+        detector = person_detector.detect
+    tracker = TrackingDetector(detector, size=size, every=detections_every, clock=clock.monotonic)
+    occupancy = OccupancyEngine(occupancy_rules(), clock=clock.monotonic)
+    actuators = ActuatorService(FakeGPIO(), FakeLCD(), BUZZER_PIN)
+    telemetry = TelemetryStore(tempfile.mkdtemp(prefix='bench_telemetry_'), clock=clock.time)
+    flags = []
+    monitor = RoomMonitor('bench', occupancy, tracker, actuators, schedule_status=lambda: None,
+                          flag=flags.append, telemetry=telemetry, state_channel=StateChannel(),
+                          camera_state=lambda: 'ok', clock=clock.time)
+
+    def render(image):
+        image = cv2.resize(image, size)
+        for track in tracker.tracks:
+            x, y, w, h = track.rect
+            cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        return image
+
+    broadcaster = MjpegBroadcaster(hub, render=render, quality=quality,
+                                   passthrough=lambda: not tracker.tracks)
+    timings = {stage: [] for stage in STAGES}
+    frames = 0
+
+    actuators.start()
+    started = time.perf_counter()
+    while True:
+        t0 = time.perf_counter()
+        ok, raw = source.read()
+        if not ok:
+            break
+        frame = JpegFrame(raw.tobytes()) if _compressed(raw) else raw
+        seq = hub.publish(frame)
+        t1 = time.perf_counter()
+        timings['capture'].append(t1 - t0)
+
+        if frames % track_every == 0:
+            t0 = time.perf_counter()
+            image = as_image(frame)
+            t1 = time.perf_counter()
+            timings['decode'].append(t1 - t0)
+            full_runs = tracker.full_runs
+            rects, weights = tracker(image)
+            t2 = time.perf_counter()
+            if tracker.full_runs > full_runs:
+                timings['hog'].append(t2 - t1)
+                monitor.update(Detection(seq, clock.time(), rects, weights), frame)
+                timings['monitor'].append(time.perf_counter() - t2)
+            else:
+                timings['track'].append(t2 - t1)
+
+        t0 = time.perf_counter()
+        broadcaster.frame_bytes(seq, frame)
+        timings['encode'].append(time.perf_counter() - t0)
+        frames += 1
+    elapsed = time.perf_counter() - started
+    actuators.stop()
+    telemetry.close()
+
+    return {
+        'frames': frames,
+        'fps': frames / elapsed if elapsed else 0.0,
+        'simulated_seconds': frames / source.fps,
+        'speedup': (frames / source.fps) / elapsed if elapsed else 0.0,
+        'flags': len(flags),
+        'encoded_frames': broadcaster.encoded_frames,
+        'passthrough_frames': broadcaster.passthrough_frames,
+        'stages': {stage: summarize(samples) for stage, samples in timings.items()},
+    }
+
+
+def run_stream(source, viewers, quality, size):
+    # The threaded path: CaptureThread on the replay, `viewers` consumers of
+    # MjpegBroadcaster.gen_frames(), at the recording's frame rate
+    hub = FrameHub()
+    capture = CaptureThread(source, hub)
+    broadcaster = MjpegBroadcaster(hub, render=lambda image: cv2.resize(image, size), quality=quality)
+    delivered = [0] * viewers
+
+    def view(index):
+        for _ in broadcaster.gen_frames():
+            delivered[index] += 1
+
+    threads = [threading.Thread(target=view, args=(i,), daemon=True) for i in range(viewers)]
+    for thread in threads:
+        thread.start()
+    while broadcaster.viewers < viewers:
+        time.sleep(0.01)
+
+    started = time.perf_counter()
+    capture.start()
+    while source.frames_read < len(source):
+        time.sleep(0.01)
+    capture.stop()
+    elapsed = time.perf_counter() - started
+    for thread in threads:
+        thread.join(2.0)
+    return {
+        'viewers': viewers,
+        'captured_fps': source.frames_read / elapsed if elapsed else 0.0,
+        'delivered_fps_per_viewer': float(np.mean(delivered)) / elapsed if elapsed else 0.0,
+        'dropped_frames': broadcaster.dropped_frames,
+    }
+
+
+def compare(result, baseline, tolerance):
+    regressions = []
+    for stage, current in result['stages'].items():
+        before = baseline.get('stages', {}).get(stage)
+        if not before or not before['count'] or not current['count']:
+            continue
+        change = current['mean_ms'] / before['mean_ms'] - 1.0 if before['mean_ms'] else 0.0
+        marker = ' <-- regression' if change > tolerance else ''
+        print(f"  {stage:<11} {before['mean_ms']:>8.3f} -> {current['mean_ms']:>8.3f} ms "
+              f"({change:+.0%}){marker}")
+        if marker:
+            regressions.append(stage)
+    if baseline.get('fps'):
+        change = result['fps'] / baseline['fps'] - 1.0
+        marker = ' <-- regression' if change < -tolerance else ''
+        print(f"  {'fps':<11} {baseline['fps']:>8.1f} -> {result['fps']:>8.1f}    ({change:+.0%}){marker}")
+        if marker:
+            regressions.append('fps')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay a recording through the monitoring pipeline")
+    parser.add_argument('--input', help="video file or image directory (synthetic frames if omitted)")
+    parser.add_argument('--frames', type=int, default=300, help="synthetic frame count")
+    parser.add_argument('--fps', type=float, help="recording frame rate (default: from the file, or 15)")
+    parser.add_argument('--size', default='320x240', help="capture size")
+    parser.add_argument('--analysis-size', default='320x240')
+    parser.add_argument('--mjpeg', action='store_true', help="replay as MJPEG capture (JPEG frames)")
+    parser.add_argument('--detector', default='{"backend": "hog", "scale": 1.02}', help="detector config as JSON")
+    parser.add_argument('--detection-interval', type=float, default=1.0, help="seconds between HOG runs")
+    parser.add_argument('--track-interval', type=float, default=0.2, help="seconds between tracker updates")
+    parser.add_argument('--no-gating', action='store_true', help="run HOG on the full frame every time")
+    parser.add_argument('--quality', type=int, default=70)
+    parser.add_argument('--viewers', type=int, default=0, help="also run the threaded stream path")
+    parser.add_argument('--threads', type=int, default=None, help="cv2.setNumThreads before running")
+    parser.add_argument('--save-baseline', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="compare with a saved baseline")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="allowed slowdown, e.g. 0.15 = 15%%")
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+    size = tuple(int(v) for v in args.size.split('x'))
+    analysis_size = tuple(int(v) for v in args.analysis_size.split('x'))
+    path = args.input or synthetic_recording(args.frames, size)
+
+    clock = SimulatedClock()
+    source = ReplaySource(path, fps=args.fps, size=size, mjpeg=args.mjpeg, clock=clock)
+    if not source.isOpened():
+        raise SystemExit(f"no frames could be read from {path}")
+    rss_before = rss_mb()
+    track_every = max(1, int(round(source.fps * args.track_interval)))
+    detections_every = max(1, int(round(args.detection_interval / args.track_interval)))
+    result = run_stages(source, clock, json.loads(args.detector), analysis_size, track_every,
+                        detections_every, not args.no_gating, args.quality)
+    result.update({
+        'input': args.input,
+        'mjpeg': args.mjpeg,
+        'size': list(size),
+        'detector': json.loads(args.detector),
+        'revision': git_revision(),
+        'rss_mb': rss_mb(),
+        'rss_growth_mb': rss_mb() - rss_before,
+        'peak_rss_mb': peak_rss_mb(),
+    })
+    if args.viewers:
+        result['stream'] = run_stream(ReplaySource(path, fps=args.fps, size=size, mjpeg=args.mjpeg, realtime=True),
+                                      args.viewers, args.quality, analysis_size)
+
+    print(f"{result['frames']} frames, {result['fps']:.1f} fps end to end, "
+          f"{result['speedup']:.1f}x real time, {result['flags']} flags")
+    print(f"{'stage':<11} {'count':>6} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for stage in STAGES:
+        s = result['stages'][stage]
+        print(f"{stage:<11} {s['count']:>6} {s['mean_ms']:>9.3f} {s['p50_ms']:>8.3f} {s['p95_ms']:>8.3f}")
+    print(f"memory: {result['rss_mb']:.1f} MB rss, {result['peak_rss_mb']:.1f} MB peak")
+    if 'stream' in result:
+        stream = result['stream']
+        print(f"stream: {stream['viewers']} viewers, {stream['captured_fps']:.1f} fps captured, "
+              f"{stream['delivered_fps_per_viewer']:.1f} fps per viewer, {stream['dropped_frames']} dropped")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"compared with {args.compare} (revision {baseline.get('revision')}):")
+        if compare(result, baseline, args.tolerance):
+            raise SystemExit(1)
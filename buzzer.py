@@ -1,4 +1,5 @@
 import cv2
+import functools
 from flask import Flask, Response
 import time
 import atexit
@@ -6,6 +7,11 @@ import RPi.GPIO as GPIO
 from RPLCD.i2c import CharLCD
 import threading
 import spidev
+from frame_hub import FrameHub, CaptureThread, open_camera
+from mjpeg import MjpegBroadcaster
+from actuators import ActuatorService
+from occupancy import OccupancyEngine, SignalRule
+from adc_sampler import Mcp3008Sampler
 
 # -------------------- GPIO + LCD SETUP --------------------
 BUZZER_PIN = 18
@@ -13,6 +19,7 @@ GPIO.setmode(GPIO.BCM)
 GPIO.setup(BUZZER_PIN, GPIO.OUT)
 
 lcd = CharLCD('PCF8574', 0x27)
+actuators = ActuatorService(GPIO, lcd, BUZZER_PIN)
 
 # -------------------- SPI + LIGHT SENSOR SETUP --------------------
 spi = spidev.SpiDev()
@@ -20,74 +27,57 @@ spi.open(0, 0)
 spi.max_speed_hz = 1350000
 
 # Light Detection Threshold
+LIGHT_CHANNEL = 0
 LIGHT_THRESHOLD = 300
+LIGHT_HYSTERESIS = 30  # light counts as gone only below LIGHT_THRESHOLD - LIGHT_HYSTERESIS
 countdown_seconds = 60
-countdown_active = False
-countdown_lock = threading.Lock()
 
-def read_light_channel(channel=0):
-    adc = spi.xfer2([1, (8 + channel) << 4, 0])
-    value = ((adc[1] & 3) << 8) + adc[2]
-    return value
+# Light sensor sampled at 50 Hz; the light state follows the median of the
+# last 0.5s, so flicker doesn't start or cancel countdowns
+sampler = Mcp3008Sampler(spi, channels=[LIGHT_CHANNEL], rate=50, window=2.0,
+                         thresholds={LIGHT_CHANNEL: (LIGHT_THRESHOLD,
+                                                     LIGHT_THRESHOLD - LIGHT_HYSTERESIS)})
+
+# Light held on for countdown_seconds sounds the buzzer, and again every
+# countdown_seconds while it stays on
+occupancy = OccupancyEngine({'Light': SignalRule(countdown_seconds, repeat=countdown_seconds)})
 
 def trigger_buzzer():
-    GPIO.output(BUZZER_PIN, GPIO.HIGH)
-    lcd.clear()
-    lcd.write_string("🔔 Buzzing!")
-    time.sleep(3)
-    GPIO.output(BUZZER_PIN, GPIO.LOW)
-    lcd.clear()
+    actuators.show("")
+    actuators.buzz(3, message="🔔 Buzzing!")
 
 def light_monitor():
-    global countdown_active
-
     while True:
-        light_level = read_light_channel()
-        if light_level > LIGHT_THRESHOLD:
-            with countdown_lock:
-                if not countdown_active:
-                    countdown_active = True
-                    threading.Thread(target=countdown_and_buzz, daemon=True).start()
-        time.sleep(2)
-
-def countdown_and_buzz():
-    global countdown_active
-
-    lcd.clear()
-    lcd.write_string("Light Detected!")
-    for i in range(countdown_seconds, 0, -1):
-        light_level = read_light_channel()
-        if light_level < LIGHT_THRESHOLD:
-            lcd.clear()
-            lcd.write_string("Light Gone!")
-            countdown_active = False
-            time.sleep(2)
-            lcd.clear()
-            return
-        lcd.clear()
-        lcd.write_string(f"Countdown: {i}s")
+        for event in occupancy.observe('room', 'Light', sampler.state(LIGHT_CHANNEL)):
+            if event.kind == 'started':
+                actuators.show("Light Detected!")
+            elif event.kind in ('cancelled', 'cleared'):
+                actuators.show("Light Gone!")
+                occupancy.call_later(2, lambda: actuators.show(""))
+            elif event.kind == 'flagged':
+                trigger_buzzer()
+
+        remaining = occupancy.remaining('room', 'Light')
+        if remaining is not None and remaining < countdown_seconds:
+            actuators.show(f"Countdown: {int(remaining) + 1}s")
         time.sleep(1)
 
-    trigger_buzzer()
-    countdown_active = False
-
 # -------------------- CAMERA + FLASK --------------------
 app = Flask(__name__)
-camera = cv2.VideoCapture(0, cv2.CAP_V4L2)
-camera.set(cv2.CAP_PROP_FRAME_WIDTH, 320)
-camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 240)
+# MJPEG at 320x240: frames go to viewers exactly as the camera compressed them
+open_capture = functools.partial(open_camera, 0, cv2.CAP_V4L2, 320, 240, fourcc='MJPG')
+
+frame_hub = FrameHub()
+# Reopened with backoff if the camera drops; viewers resume on their own
+capture_thread = CaptureThread(open_capture(), frame_hub, reopen=open_capture)
+
+# One JPEG per captured frame, shared by every viewer; nothing is encoded
+# while no one is watching.
+broadcaster = MjpegBroadcaster(frame_hub, render=lambda frame: cv2.resize(frame, (320, 240)),
+                               quality=70, max_fps=10, passthrough=lambda: True)
 
 def gen_frames():
-    while True:
-        success, frame = camera.read()
-        if not success:
-            break
-        frame = cv2.resize(frame, (320, 240))
-        ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 70])
-        frame_bytes = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        time.sleep(0.1)
+    return broadcaster.gen_frames()
 
 @app.route('/video_feed')
 def video_feed():
@@ -109,12 +99,16 @@ def index():
 @atexit.register
 def cleanup():
     print("Cleaning up...")
-    lcd.clear()
+    actuators.stop()
     GPIO.cleanup()
-    camera.release()
+    capture_thread.stop()
+    sampler.stop()
     spi.close()
 
 # -------------------- START --------------------
 if __name__ == '__main__':
+    actuators.start()
+    capture_thread.start()
+    sampler.start()
     threading.Thread(target=light_monitor, daemon=True).start()
     app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,230 @@
+import collections
+import datetime
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from frame_hub import JpegFrame, as_image
+from metrics import METRICS
+
+
+ClipRecord = collections.namedtuple(
+    'ClipRecord', ['id', 'room', 'reason', 'triggered_at', 'start', 'end', 'frames', 'path'])
+
+
+def _safe_name(value):
+    return re.sub(r'[^\w.-]', '_', str(value))
+
+
+# --- Clip index ---
+# One row per written clip, looked up by room and time.
+class ClipIndex:
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS clips (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                room TEXT NOT NULL,
+                reason TEXT NOT NULL,
+                triggered_at REAL NOT NULL,
+                start REAL NOT NULL,
+                end REAL NOT NULL,
+                frames INTEGER NOT NULL,
+                path TEXT NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS clips_room_time ON clips (room, triggered_at)")
+
+    def add(self, room, reason, triggered_at, start, end, frames, path):
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO clips (room, reason, triggered_at, start, end, frames, path) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (str(room), reason, triggered_at, start, end, frames, path))
+        return cursor.lastrowid
+
+    def find(self, room=None, since=None, until=None, limit=100):
+        # Newest first; since/until are UNIX timestamps on triggered_at
+        where, params = [], []
+        if room is not None:
+            where.append("room = ?")
+            params.append(str(room))
+        if since is not None:
+            where.append("triggered_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("triggered_at < ?")
+            params.append(until)
+        sql = "SELECT id, room, reason, triggered_at, start, end, frames, path FROM clips"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY triggered_at DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(sql, params + [limit]).fetchall()
+        return [ClipRecord(*row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# --- Pre/post-roll recorder ---
+# Keeps the last pre_roll + post_roll seconds of JPEG frames, sampled at
+# `fps`, in one preallocated byte ring: every frame is copied into a fixed
+# slot, nothing is allocated per frame (MJPEG frames are stored as captured,
+# raw frames are converted to BGR and encoded once). For raw capture that
+# encode runs at `fps` for as long as the recorder runs, triggered or not:
+# a few ms per 640x480 frame on a Pi-class CPU, a few percent of one core
+# at the default 5 fps; lower `fps` or `quality` to bound it, or capture MJPEG,
+# which costs nothing here. trigger() only queues a request; the writer
+# thread waits until the post-roll has been captured, copies that time span
+# out of the ring and writes it as a concatenated-JPEG .mjpeg file (plays in
+# ffmpeg/VLC), then records it in the index.
+class ClipRecorder(threading.Thread):
+    def __init__(self, hub, index, directory, pre_roll=10.0, post_roll=5.0, fps=5.0,
+                 slot_bytes=128 * 1024, quality=70):
+        super().__init__(daemon=True)
+        self.hub = hub
+        self.index = index
+        self.directory = directory
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.min_interval = 1.0 / fps
+        self.params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        self.slots = int(np.ceil((pre_roll + post_roll) * fps)) + int(np.ceil(fps))
+        self._ring = np.zeros((self.slots, slot_bytes), np.uint8)
+        self._lengths = np.zeros(self.slots, np.int64)
+        self._times = np.zeros(self.slots, np.float64)
+        self._count = 0
+        self._lock = threading.Lock()
+        self._requests = []
+        self._requests_cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.oversized_frames = 0
+        self.clips_written = 0
+
+    def start(self):
+        super().start()
+        self._writer.start()
+
+    @property
+    def pending(self):
+        # Clips triggered but not written yet
+        with self._requests_cond:
+            return len(self._requests)
+
+    def register_metrics(self, **labels):
+        METRICS.gauge('queue_depth', lambda: self.pending, "Queued work items", queue='clips', **labels)
+
+    # --- Intake ---
+    def run(self):
+        seq = 0
+        last_kept = 0.0
+        while not self._stop_event.is_set():
+            newest, frame = self.hub.wait(seq, timeout=1.0)
+            if frame is None:
+                if self.hub.closed:
+                    break
+                continue
+            if newest == seq:
+                continue
+            seq = newest
+            now = time.time()
+            if now - last_kept < self.min_interval:
+                continue
+            if isinstance(frame, JpegFrame):
+                data = np.frombuffer(frame.data, np.uint8)
+            else:
+                try:
+                    ok, data = cv2.imencode('.jpg', as_image(frame), self.params)
+                except cv2.error as e:
+                    print("[CLIPS] Failed to encode frame:", e)
+                    ok = False
+                if not ok:
+                    continue
+                data = data.reshape(-1)
+            if data.size > self._ring.shape[1]:
+                self.oversized_frames += 1
+                continue
+            with self._lock:
+                slot = self._count % self.slots
+                self._ring[slot, :data.size] = data
+                self._lengths[slot] = data.size
+                self._times[slot] = now
+                self._count += 1
+            last_kept = now
+
+    def trigger(self, room, reason, at=None):
+        # Returns at once; the clip covers [at - pre_roll, at + post_roll]
+        with self._requests_cond:
+            self._requests.append((room, str(reason), time.time() if at is None else at))
+            self._requests_cond.notify()
+
+    def stop(self, timeout=2.0):
+        # Pending clips are written with whatever post-roll has been captured
+        self._stop_event.set()
+        with self._requests_cond:
+            self._requests_cond.notify()
+        for thread in (self, self._writer):
+            if thread.is_alive():
+                thread.join(timeout)
+
+    # --- Writer ---
+    def _write_loop(self):
+        while True:
+            with self._requests_cond:
+                while True:
+                    stopping = self._stop_event.is_set()
+                    if self._requests:
+                        room, reason, at = self._requests[0]
+                        delay = at + self.post_roll - time.time()
+                        if delay <= 0 or stopping:
+                            self._requests.pop(0)
+                            break
+                    elif stopping:
+                        return
+                    else:
+                        delay = None
+                    self._requests_cond.wait(delay)
+            try:
+                self._write_clip(room, reason, at)
+            except Exception as e:
+                print("[CLIPS] Failed to write clip:", e)
+
+    def _snapshot(self, start, end):
+        with self._lock:
+            first = max(0, self._count - self.slots)
+            frames = []
+            for n in range(first, self._count):
+                slot = n % self.slots
+                if start <= self._times[slot] <= end:
+                    frames.append((float(self._times[slot]),
+                                   self._ring[slot, :self._lengths[slot]].tobytes()))
+        return frames
+
+    def _write_clip(self, room, reason, at):
+        frames = self._snapshot(at - self.pre_roll, at + self.post_roll)
+        if not frames:
+            print(f"[CLIPS] No frames buffered for {room} {reason}")
+            return None
+        stamp = datetime.datetime.fromtimestamp(at).strftime('%Y%m%d-%H%M%S')
+        room_dir = os.path.join(self.directory, _safe_name(room))
+        os.makedirs(room_dir, exist_ok=True)
+        path = os.path.join(room_dir, f"{stamp}_{_safe_name(reason)}.mjpeg")
+        with open(path, 'wb') as f:
+            for _, data in frames:
+                f.write(data)
+        self.clips_written += 1
+        return self.index.add(room, reason, at, frames[0][0], frames[-1][0], len(frames), path)
@@ -0,0 +1,186 @@
+import contextlib
+import queue
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+IDLE_PING_AFTER = 60  # seconds a pooled connection may sit idle before it is pinged
+
+
+# SQL differences between the production MySQL server and the SQLite
+# stand-in used for local testing. Queries are written with %s placeholders.
+MYSQL = {'placeholder': '%s', 'for_update': ' FOR UPDATE', 'cursor': {'prepared': True}}
+SQLITE = {'placeholder': '?', 'for_update': '', 'cursor': {}}
+
+
+class _PooledConnection:
+    def __init__(self, conn, cursor_kwargs):
+        self.conn = conn
+        self.cursor_kwargs = cursor_kwargs
+        self.last_used = time.monotonic()
+        self._statements = {}
+
+    def cursor(self, sql):
+        # One cursor per statement text, so a prepared statement is parsed by
+        # the server once per connection and reused on every call.
+        cursor = self._statements.get(sql)
+        if cursor is None:
+            cursor = self.conn.cursor(**self.cursor_kwargs)
+            self._statements[sql] = cursor
+        return cursor
+
+    def execute(self, sql, params=()):
+        cursor = self.cursor(sql)
+        cursor.execute(sql, params)
+        return cursor
+
+    def close(self):
+        for cursor in self._statements.values():
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        self._statements.clear()
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+# --- Bounded connection pool ---
+class ConnectionPool:
+    def __init__(self, connect, size=4, timeout=5.0, dialect=MYSQL):
+        self._connect = connect
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.size = size
+        self.timeout = timeout
+        self.dialect = dialect
+
+    def _checkout(self):
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                return _PooledConnection(self._connect(), self.dialect['cursor'])
+            ping = getattr(pooled.conn, 'ping', None)
+            if ping is None or time.monotonic() - pooled.last_used < IDLE_PING_AFTER:
+                return pooled
+            try:
+                ping(reconnect=False)
+                return pooled
+            except Exception:
+                pooled.close()
+
+    @contextlib.contextmanager
+    def connection(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"no free DB connection after {self.timeout}s")
+        try:
+            pooled = self._checkout()
+            try:
+                yield pooled
+            except Exception:
+                # A connection that cannot roll back is dropped; either way
+                # the caller sees its own error, not the rollback's
+                try:
+                    pooled.conn.rollback()
+                except Exception:
+                    pooled.close()
+                else:
+                    self._release(pooled)
+                raise
+            else:
+                self._release(pooled)
+        finally:
+            self._slots.release()
+
+    def _release(self, pooled):
+        pooled.last_used = time.monotonic()
+        self._idle.put(pooled)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.connection() as pooled:
+            yield pooled
+            pooled.conn.commit()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# --- Monitoring queries ---
+class MonitoringDB:
+    def __init__(self, pool):
+        self.pool = pool
+        self._placeholder = pool.dialect['placeholder']
+        self._for_update = pool.dialect['for_update']
+
+    def _sql(self, sql):
+        if self._placeholder != '%s':
+            sql = sql.replace('%s', self._placeholder)
+        return sql.replace(' {for_update}', self._for_update)
+
+    # Reads commit too, so a pooled connection never keeps an old snapshot open.
+    def room_id_for_stream(self, stream_url):
+        with self.pool.transaction() as conn:
+            cursor = conn.execute(self._sql(
+                "SELECT room_id FROM tbl_room WHERE stream_url = %s"), (stream_url,))
+            rows = cursor.fetchall()
+        return rows[0][0] if rows else None
+
+    def schedules_for_day(self, room_id, schedule_day):
+        with self.pool.transaction() as conn:
+            cursor = conn.execute(self._sql("""
+                SELECT schedule_id, schedule_time, end_time, status FROM tbl_schedule
+                WHERE room_id = %s AND schedule_day = %s
+            """), (room_id, str(schedule_day)))
+            return cursor.fetchall()
+
+    def flag_schedule(self, room_id, schedule_day, now, duration=30):
+        # Flags the schedule running at `now`, or records a temporary flagged
+        # one if none is. The row lock keeps SELECT and UPDATE/INSERT atomic.
+        # Replaying the same `now` is a no-op, so outbox redeliveries are safe.
+        current_time = now.strftime('%H:%M:%S')
+        date_added = now.strftime('%Y-%m-%d %H:%M:%S')
+        with self.pool.transaction() as conn:
+            cursor = conn.execute(self._sql("""
+                SELECT schedule_id FROM tbl_schedule
+                WHERE room_id = %s AND schedule_day = %s
+                AND schedule_time <= %s AND end_time >= %s {for_update}
+            """), (room_id, str(schedule_day), current_time, current_time))
+            rows = cursor.fetchall()
+
+            if rows:
+                row = rows[0]
+                conn.execute(self._sql("""
+                    UPDATE tbl_schedule SET status = 'Flagged'
+                    WHERE schedule_id = %s
+                """), (row[0],))
+                return 'updated', row[0]
+
+            cursor = conn.execute(self._sql("""
+                SELECT schedule_id FROM tbl_schedule
+                WHERE room_id = %s AND date_added = %s
+                AND status = 'Flagged' AND is_permanent = 'Temporary'
+            """), (room_id, date_added))
+            rows = cursor.fetchall()
+            if rows:
+                return 'existing', rows[0][0]
+
+            cursor = conn.execute(self._sql("""
+                INSERT INTO tbl_schedule (schedule_day, schedule_time, duration, room_id, used_by, date_added, status, is_permanent)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """), (
+                str(schedule_day), current_time, duration,
+                room_id, 0, date_added, 'Flagged', 'Temporary'
+            ))
+            return 'inserted', cursor.lastrowid
@@ -1,8 +1,14 @@
 import cv2
+import functools
+import os
 import time
-import threading
 import RPi.GPIO as GPIO
 from RPLCD.i2c import CharLCD
+from frame_hub import FrameHub, CaptureThread, open_camera
+from luma import luma_view, brightness as luma_brightness
+from actuators import ActuatorService
+from occupancy import OccupancyEngine, SignalRule
+from telemetry import TelemetryStore
 
 # GPIO setup for buzzer
 BUZZER_PIN = 18
@@ -12,70 +18,58 @@ GPIO.setup(BUZZER_PIN, GPIO.OUT)
 # LCD setup (replace 0x27 if needed)
 lcd = CharLCD('PCF8574', 0x27)
 lcd.clear()
+actuators = ActuatorService(GPIO, lcd, BUZZER_PIN)
 
-# Camera setup
-camera = cv2.VideoCapture(0, cv2.CAP_V4L2)
+# Camera setup: raw YUYV, so the light check reads the Y plane directly.
+# The capture thread reopens it with backoff if it drops; the loop below
+# just waits for the next frame meanwhile.
+open_capture = functools.partial(open_camera, 0, cv2.CAP_V4L2, fourcc='YUYV')
+frame_hub = FrameHub()
+capture_thread = CaptureThread(open_capture(), frame_hub, reopen=open_capture)
 
-# Control variables
-countdown_started = False
-stop_countdown_flag = False
+# Brightness log, see telemetry.TelemetryStore
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+telemetry = TelemetryStore(os.path.join(DATA_DIR, 'telemetry'))
 
-def buzzer_alert():
-    GPIO.output(BUZZER_PIN, GPIO.HIGH)
-    lcd.clear()
-    lcd.write_string("Buzzing now!")
-    time.sleep(3)
-    GPIO.output(BUZZER_PIN, GPIO.LOW)
-    lcd.clear()
-    lcd.write_string("Monitoring...")
-
-def countdown_and_buzz():
-    global countdown_started, stop_countdown_flag
-
-    print("Light detected! Starting countdown...")
-
-    for i in range(60, 0, -1):
-        if stop_countdown_flag:
-            print("Countdown cancelled due to light loss.")
-            lcd.clear()
-            lcd.write_string("Countdown cancelled")
-            time.sleep(2)
-            lcd.clear()
-            lcd.write_string("Monitoring...")
-            countdown_started = False
-            stop_countdown_flag = False
-            return
+# Light above 100 for 60s sounds the buzzer, again every 60s while it stays on
+occupancy = OccupancyEngine({'Light': SignalRule(60, on=100, repeat=60)})
 
-        lcd.clear()
-        lcd.write_string(f"Countdown:\n{i}s remaining")
-        print(f"Countdown: {i} seconds remaining")
-        time.sleep(1)
-
-    print("Countdown done. Buzzing...")
-    buzzer_alert()
-    countdown_started = False
+def buzzer_alert():
+    actuators.buzz(3, message="Buzzing now!")
+    actuators.show("Monitoring...")
 
 try:
-    lcd.write_string("Monitoring...")
+    actuators.start()
+    actuators.show("Monitoring...")
+    capture_thread.start()
 
+    seq = 0
     while True:
-        ret, frame = camera.read()
-        if not ret:
+        newest, frame = frame_hub.wait(seq, timeout=1.0)
+        if newest == seq:
+            if capture_thread.health().state != 'ok':
+                actuators.show("Camera lost")
             continue
-
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        brightness = gray.mean()
-        print(f"Brightness: {brightness:.2f}")
-
-        if brightness > 100:
-            if not countdown_started:
-                countdown_started = True
-                stop_countdown_flag = False
-                threading.Thread(target=countdown_and_buzz).start()
-        else:
-            # If brightness low and countdown running, cancel countdown
-            if countdown_started:
-                stop_countdown_flag = True
+        seq = newest
+
+        brightness = luma_brightness(luma_view(frame, 4)).mean
+        telemetry.record('room', brightness=brightness)
+
+        for event in occupancy.observe('room', 'Light', brightness):
+            if event.kind == 'started':
+                print("Light detected! Starting countdown...")
+            elif event.kind in ('cancelled', 'cleared'):
+                # Brightness low: cancel the countdown
+                print("Countdown cancelled due to light loss.")
+                actuators.show("Countdown cancelled")
+                occupancy.call_later(2, lambda: actuators.show("Monitoring..."))
+            elif event.kind == 'flagged':
+                print("Countdown done. Buzzing...")
+                buzzer_alert()
+
+        remaining = occupancy.remaining('room', 'Light')
+        if remaining is not None:
+            actuators.show(f"Countdown:\n{int(remaining) + 1}s remaining")
 
         time.sleep(0.5)
 
@@ -83,6 +77,7 @@ except KeyboardInterrupt:
     print("Exiting...")
 
 finally:
-    lcd.clear()
-    camera.release()
+    actuators.stop()
+    capture_thread.stop()
+    telemetry.close()
     GPIO.cleanup()
@@ -0,0 +1,231 @@
+import collections
+import threading
+import time
+
+import cv2
+import imutils
+
+from frame_hub import as_image
+from metrics import METRICS
+
+
+Detection = collections.namedtuple('Detection', ['seq', 'timestamp', 'rects', 'weights'])
+
+EMPTY_DETECTION = Detection(0, None, (), ())
+
+
+# --- Detection worker ---
+# Runs the detector on the newest hub frame at its own pace and caches the
+# result, so streams and occupancy logic never wait on HOG. MJPEG frames are
+# decoded here, at the detection rate, optionally at 1/decode_reduce scale.
+class DetectionWorker(threading.Thread):
+    def __init__(self, hub, detect, interval=1.0, decode_reduce=1):
+        super().__init__(daemon=True)
+        self.hub = hub
+        self.detect = detect
+        self.interval = interval
+        self.decode_reduce = decode_reduce
+        self._cond = threading.Condition()
+        self._result = EMPTY_DETECTION
+        self._stop_event = threading.Event()
+
+    def run(self):
+        frame_seq = 0
+        while not self._stop_event.is_set():
+            started = time.monotonic()
+            seq, frame = self.hub.wait(frame_seq, timeout=1.0)
+            if frame is None:
+                if self.hub.closed:
+                    break
+                continue
+            if seq == frame_seq:
+                continue
+            frame_seq = seq
+
+            try:
+                rects, weights = self.detect(as_image(frame, self.decode_reduce))
+            except Exception as e:
+                print("Detection error:", e)
+                rects, weights = (), ()
+
+            with self._cond:
+                self._result = Detection(seq, time.time(), rects, weights)
+                self._cond.notify_all()
+
+            remaining = self.interval - (time.monotonic() - started)
+            if remaining > 0:
+                self._stop_event.wait(remaining)
+
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def latest(self):
+        with self._cond:
+            return self._result
+
+    def wait(self, after_seq=0, timeout=None):
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._result.seq > after_seq or self._stop_event.is_set(),
+                timeout)
+            return self._result
+
+    @property
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    def register_metrics(self, **labels):
+        METRICS.gauge('detection_age_seconds', lambda: time.time() - self.latest().timestamp,
+                      "Age of the newest detection result", **labels)
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self.is_alive():
+            self.join(timeout)
+
+
+# --- Motion-gated detection ---
+# Wraps a detector that works on analysis-sized images. Static frames skip the
+# detector and keep the previous boxes; frames with motion only run it on the
+# (dilated, padded) regions that changed, replacing the boxes that touch those
+# regions and keeping the rest (someone sitting still while another person
+# walks by); every `full_refresh` seconds the whole frame is searched again so
+# people who stopped moving are re-confirmed.
+class MotionGatedDetector:
+    def __init__(self, detect, size=(320, 240), diff_threshold=25, min_area=500,
+                 dilate_iterations=2, roi_padding=16, min_roi=(80, 144),
+                 full_refresh=30.0, full_frame_ratio=0.6, clock=time.monotonic):
+        self.detect = detect
+        self.size = size
+        self.diff_threshold = diff_threshold
+        self.min_area = min_area
+        self.dilate_iterations = dilate_iterations
+        self.roi_padding = roi_padding
+        self.min_roi = min_roi
+        self.full_refresh = full_refresh
+        self.full_frame_ratio = full_frame_ratio
+        self.clock = clock
+        self.prev_gray = None
+        self.last_full = None
+        self.rects, self.weights = [], []
+        self.motion_area = 0
+        self.full_runs = 0
+        self.roi_runs = 0
+        self.skipped = 0
+
+    FULL = 'full'
+
+    def __call__(self, frame):
+        image, plan = self.prepare(frame)
+        return self.search(image, plan)
+
+    def search(self, image, plan):
+        # Carries out a plan from prepare()
+        if plan is None:
+            return self.rects, self.weights
+        if plan == self.FULL:
+            found, found_weights = self.detect(image)
+            return self.finish(found, found_weights, full=True)
+
+        # Boxes away from every searched region still stand
+        rects, weights = [], []
+        for rect, weight in zip(self.rects, self.weights):
+            if not any(_overlaps(rect, roi) for roi in plan):
+                rects.append(rect)
+                weights.append(weight)
+        for (x, y, w, h) in plan:
+            found, found_weights = self.detect(image[y:y + h, x:x + w])
+            for (rx, ry, rw, rh), weight in zip(found, found_weights):
+                rects.append((int(rx) + x, int(ry) + y, int(rw), int(rh)))
+                weights.append(_scalar(weight))
+        return self.finish(rects, weights, full=False)
+
+    def prepare(self, frame):
+        # Returns (analysis image, plan): plan is None to keep the previous
+        # boxes, FULL to search the whole image, or a list of (x, y, w, h) ROIs.
+        image = cv2.resize(frame, self.size)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        prev_gray, self.prev_gray = self.prev_gray, gray
+        if prev_gray is None:
+            return image, self.FULL
+
+        diff = cv2.absdiff(gray, prev_gray)
+        _, thresh = cv2.threshold(diff, self.diff_threshold, 255, cv2.THRESH_BINARY)
+        self.motion_area = cv2.countNonZero(thresh)
+
+        if self.last_full is None or self.clock() - self.last_full >= self.full_refresh:
+            return image, self.FULL
+        if self.motion_area < self.min_area:
+            self.skipped += 1
+            return image, None
+
+        thresh = cv2.dilate(thresh, None, iterations=self.dilate_iterations)
+        contours = imutils.grab_contours(
+            cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE))
+        rois = self._regions([cv2.boundingRect(c) for c in contours])
+
+        height, width = gray.shape[:2]
+        if sum(w * h for (_, _, w, h) in rois) >= self.full_frame_ratio * width * height:
+            return image, self.FULL
+        return image, rois
+
+    def finish(self, rects, weights, full):
+        self.rects = [tuple(int(v) for v in r) for r in rects]
+        self.weights = [float(_scalar(w)) for w in weights]
+        if full:
+            self.last_full = self.clock()
+            self.full_runs += 1
+        else:
+            self.roi_runs += 1
+        return self.rects, self.weights
+
+    def _regions(self, boxes):
+        width, height = self.size
+        min_w, min_h = self.min_roi
+        regions = []
+        for (x, y, w, h) in boxes:
+            # Pad, grow to at least one detection window, clip to the frame
+            x0, y0 = x - self.roi_padding, y - self.roi_padding
+            x1, y1 = x + w + self.roi_padding, y + h + self.roi_padding
+            if x1 - x0 < min_w:
+                x0 -= (min_w - (x1 - x0)) // 2
+                x1 = x0 + min_w
+            if y1 - y0 < min_h:
+                y0 -= (min_h - (y1 - y0)) // 2
+                y1 = y0 + min_h
+            x0, y0 = max(0, min(x0, width - min_w)), max(0, min(y0, height - min_h))
+            x1, y1 = min(width, max(x1, x0 + min_w)), min(height, max(y1, y0 + min_h))
+            regions.append([x0, y0, x1, y1])
+
+        # Merge overlapping regions so no pixel is searched twice
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(regions)):
+                for j in range(i + 1, len(regions)):
+                    a, b = regions[i], regions[j]
+                    if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                        regions[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                        del regions[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return [(x0, y0, x1 - x0, y1 - y0) for (x0, y0, x1, y1) in regions]
+
+
+def _overlaps(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    return ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah
+
+
+def _scalar(value):
+    # HOG weights come back as an Nx1 array on some OpenCV builds and flat on others
+    try:
+        return value[0]
+    except (TypeError, IndexError):
+        return value
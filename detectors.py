@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from metrics import stage
+
+
+# --- Person detector backends ---
+# Every backend takes a BGR image and returns (rects, weights): rects as
+# (x, y, w, h) tuples in that image's pixels, weights as floats. Backends that
+# can run several images in one pass set `batching` and override
+# detect_batch(); the supervisor then batches frames from all cameras.
+class Detector:
+    name = 'base'
+    batching = False
+
+    def detect(self, image):
+        raise NotImplementedError
+
+    def detect_batch(self, images):
+        return [self.detect(image) for image in images]
+
+    def __call__(self, image):
+        return self.detect(image)
+
+
+HOG_SECONDS = stage('hog')
+DNN_SECONDS = stage('dnn')
+
+
+class HogDetector(Detector):
+    name = 'hog'
+
+    # resize scales every image before the search (e.g. 2.0 finds people half
+    # the 64x128 window size); boxes are mapped back to the caller's pixels
+    def __init__(self, win_stride=(4, 4), padding=(8, 8), scale=1.05, hit_threshold=0.0, resize=1.0):
+        self.win_stride = tuple(win_stride)
+        self.padding = tuple(padding)
+        self.scale = scale
+        self.hit_threshold = hit_threshold
+        self.resize = resize
+        # One HOGDescriptor per thread, so pool workers never share one
+        self._local = threading.local()
+
+    def _descriptor(self):
+        hog = getattr(self._local, 'hog', None)
+        if hog is None:
+            hog = self._local.hog = cv2.HOGDescriptor()
+            hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+        return hog
+
+    def detect(self, image):
+        with HOG_SECONDS.time():
+            if self.resize != 1.0:
+                image = cv2.resize(image, None, fx=self.resize, fy=self.resize)
+            rects, weights = self._descriptor().detectMultiScale(
+                image, hitThreshold=self.hit_threshold, winStride=self.win_stride,
+                padding=self.padding, scale=self.scale)
+        return ([tuple(int(round(v / self.resize)) for v in r) for r in rects],
+                [float(w) for w in np.ravel(weights)])
+
+
+class DnnDetector(Detector):
+    # SSD-style cv2.dnn model (Caffe or ONNX) whose output is the standard
+    # DetectionOutput blob of [image_id, label, confidence, x1, y1, x2, y2]
+    # rows with normalized coordinates. Defaults match MobileNet-SSD (VOC).
+    name = 'dnn'
+    batching = True
+
+    def __init__(self, model, config=None, input_size=(300, 300), scale=0.007843,
+                 mean=(127.5, 127.5, 127.5), swap_rb=False, person_class=15, confidence=0.5):
+        self.net = cv2.dnn.readNet(model, config) if config else cv2.dnn.readNet(model)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.input_size = tuple(input_size)
+        self.scale = scale
+        self.mean = tuple(mean)
+        self.swap_rb = swap_rb
+        self.person_class = person_class
+        self.confidence = confidence
+        # cv2.dnn.Net keeps per-forward state and is not thread safe
+        self._lock = threading.Lock()
+
+    def detect(self, image):
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, images):
+        if not images:
+            return []
+        blob = cv2.dnn.blobFromImages(images, self.scale, self.input_size, self.mean,
+                                      swapRB=self.swap_rb, crop=False)
+        with self._lock, DNN_SECONDS.time():
+            self.net.setInput(blob)
+            output = self.net.forward()
+
+        results = [([], []) for _ in images]
+        for image_id, label, confidence, x1, y1, x2, y2 in output.reshape(-1, 7):
+            if int(label) != self.person_class or confidence < self.confidence:
+                continue
+            index = int(image_id)
+            if index < 0 or index >= len(images):
+                continue
+            height, width = images[index].shape[:2]
+            x0, y0 = int(max(0.0, x1) * width), int(max(0.0, y1) * height)
+            x3, y3 = int(min(1.0, x2) * width), int(min(1.0, y2) * height)
+            results[index][0].append((x0, y0, x3 - x0, y3 - y0))
+            results[index][1].append(float(confidence))
+        return results
+
+
+BACKENDS = {
+    'hog': HogDetector,
+    'dnn': DnnDetector,
+}
+
+
+def load_tuned(path, size=None):
+    # Detector settings written by tune_hog.py; relative paths are next to
+    # this file. A missing file means "not tuned yet": use the defaults. So
+    # does a file tuned for another image size than `size` (width, height),
+    # since stride, padding and scale only hold at the size they were swept at.
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        data = json.load(f)
+    base_size = data.get('base_size')
+    if size is not None and base_size is not None and tuple(base_size) != tuple(size):
+        print(f"[DETECTOR] Ignoring {os.path.basename(path)}: tuned for "
+              f"{base_size[0]}x{base_size[1]} images, not {size[0]}x{size[1]}")
+        return {}
+    tuned = data['detector']
+    print(f"Detector settings from {os.path.basename(path)}:", tuned)
+    return tuned
+
+
+def create_detector(config, size=None):
+    # config: {'backend': 'hog' | 'dnn', ...constructor arguments}; with
+    # 'tuned': <path>, settings in that file (if it exists and was tuned at
+    # the analysis `size`) override the rest
+    config = dict(config or {'backend': 'hog'})
+    tuned = config.pop('tuned', None)
+    if tuned:
+        config.update(load_tuned(tuned, size))
+    backend = config.pop('backend', 'hog')
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown detector backend {backend!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[backend](**config)
@@ -0,0 +1,80 @@
+import json
+import threading
+
+from metrics import METRICS
+
+
+# --- State push channel ---
+# The monitoring loop publishes each room's small state dict; only a change
+# bumps the version and wakes subscribers. Each subscriber is a Server-Sent
+# Events stream: a snapshot of every room on connect, then one compact JSON
+# message per changed room, and a comment line every `keepalive` seconds so
+# proxies don't drop idle connections. A client that falls behind just gets
+# the latest state of each room it missed, never a backlog.
+class StateChannel:
+    def __init__(self, keepalive=15.0):
+        self.keepalive = keepalive
+        self._cond = threading.Condition()
+        self._version = 0
+        self._closed = False
+        self._states = {}    # room -> state dict
+        self._versions = {}  # room -> version of its last change
+        self.subscribers = 0
+
+    def publish(self, room, **state):
+        room = str(room)
+        with self._cond:
+            if self._states.get(room) == state:
+                return False
+            self._version += 1
+            self._states[room] = state
+            self._versions[room] = self._version
+            self._cond.notify_all()
+            return True
+
+    def register_metrics(self, **labels):
+        METRICS.gauge('events_subscribers', lambda: self.subscribers, "Connected /events clients", **labels)
+
+    def state(self, room):
+        with self._cond:
+            return self._states.get(str(room))
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _changes(self, seen, room):
+        # Called with the lock held: [(version, room, state)] newer than seen
+        rooms = [room] if room is not None else list(self._states)
+        changes = [(self._versions[r], r, self._states[r]) for r in rooms
+                   if r in self._versions and self._versions[r] > seen]
+        return sorted(changes, key=lambda change: change[0])
+
+    def stream(self, room=None, last_event_id=None):
+        # SSE generator; pass the Last-Event-ID header to resume after a reconnect
+        room = None if room is None else str(room)
+        seen = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+        with self._cond:
+            self.subscribers += 1
+            if seen > self._version:
+                seen = 0  # server restarted since: send everything again
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                with self._cond:
+                    self._cond.wait_for(
+                        lambda: self._closed or self._changes(seen, room), self.keepalive)
+                    if self._closed:
+                        return
+                    changes = self._changes(seen, room)
+                if not changes:
+                    yield ": keepalive\n\n"
+                    continue
+                for version, changed_room, state in changes:
+                    data = json.dumps(dict(state, room=changed_room), separators=(',', ':'))
+                    yield f"id: {version}\nevent: state\ndata: {data}\n\n"
+                    seen = max(seen, version)
+        finally:
+            with self._cond:
+                self.subscribers -= 1
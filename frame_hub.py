@@ -0,0 +1,295 @@
+import collections
+import random
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from metrics import METRICS, stage
+
+
+# --- Latest-frame hub ---
+# One producer publishes, any number of consumers read the newest frame.
+# Consumers never take frames away from each other: each one remembers the
+# last sequence number it saw and waits for a newer one.
+class FrameHub:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._frame = None
+        self._timestamp = None
+        self._closed = False
+
+    def publish(self, frame):
+        with self._cond:
+            self._seq += 1
+            self._frame = frame
+            self._timestamp = time.time()
+            self._cond.notify_all()
+            return self._seq
+
+    def latest(self):
+        with self._cond:
+            return self._seq, self._frame
+
+    def wait(self, after_seq=0, timeout=None):
+        # Returns (seq, frame). seq == after_seq means the wait timed out,
+        # frame is None once the hub is closed.
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq or self._closed, timeout)
+            if self._closed:
+                return self._seq, None
+            return self._seq, self._frame
+
+    @property
+    def timestamp(self):
+        return self._timestamp
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+# --- Compressed frames ---
+# With MJPEG capture the hub carries the camera's own JPEG bytes. Viewers can
+# forward them untouched; analysis decodes on demand, optionally at 1/2, 1/4
+# or 1/8 scale (libjpeg scales during the IDCT, so that is cheaper still).
+# Each scale is decoded at most once per frame however many consumers ask.
+_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+_REDUCED_GRAY_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+class JpegFrame:
+    __slots__ = ('data', '_decoded', '_lock')
+
+    def __init__(self, data):
+        self.data = data
+        self._decoded = {}
+        self._lock = threading.Lock()
+
+    def decode(self, reduce=1):
+        return self._decode(reduce, _REDUCED_FLAGS)
+
+    def decode_gray(self, reduce=1):
+        # Only the Y component is decoded
+        return self._decode(reduce, _REDUCED_GRAY_FLAGS)
+
+    def _decode(self, reduce, flags):
+        key = (flags[reduce], reduce)
+        with self._lock:
+            image = self._decoded.get(key)
+            if image is None:
+                image = cv2.imdecode(np.frombuffer(self.data, np.uint8), flags[reduce])
+                self._decoded[key] = image
+            return image
+
+
+def as_image(frame, reduce=1):
+    # BGR image for any hub frame: MJPEG is decoded, raw YUYV (HxWx2) converted
+    if isinstance(frame, JpegFrame):
+        return frame.decode(reduce)
+    if frame.ndim == 3 and frame.shape[2] == 2:
+        frame = cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_YUYV)
+        if reduce > 1:
+            frame = frame[::reduce, ::reduce]
+    return frame
+
+
+def _compressed(frame):
+    # With CAP_PROP_CONVERT_RGB off, V4L2 MJPEG read() returns a 1xN byte row
+    return (frame.ndim <= 2 and frame.shape[0] == 1 and frame.size > 2
+            and frame.flat[0] == 0xFF and frame.flat[1] == 0xD8)
+
+
+# --- Capture thread ---
+# The only code that touches the VideoCapture device.
+def open_camera(source, api_preference=None, width=None, height=None, fourcc=None):
+    # fourcc 'MJPG' keeps the camera's compressed frames, 'YUYV' its raw
+    # YUV 4:2:2 (HxWx2, luma in channel 0); neither is converted to BGR.
+    if api_preference is None:
+        camera = cv2.VideoCapture(source)
+    else:
+        camera = cv2.VideoCapture(source, api_preference)
+    if fourcc:
+        camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+        camera.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+    if width:
+        camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    if height:
+        camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    return camera
+
+
+CAPTURE_SECONDS = stage('capture')
+FRAMES_CAPTURED = METRICS.counter('frames_captured_total', "Frames read from cameras")
+CAPTURE_FAILURES = METRICS.counter('capture_failures_total', "Failed camera reads")
+CAPTURE_RECONNECTS = METRICS.counter('capture_reconnects_total', "Camera reopen attempts")
+
+CaptureHealth = collections.namedtuple(
+    'CaptureHealth', ['state', 'since', 'frame_age', 'failures', 'reconnects', 'error'])
+
+# Capture states: frames arriving, no frame for stall_timeout, device lost and
+# being reopened, thread stopped
+CAPTURE_OK = 'ok'
+CAPTURE_STALLED = 'stalled'
+CAPTURE_RECONNECTING = 'reconnecting'
+CAPTURE_STOPPED = 'stopped'
+
+
+# Reads frames into the hub. After max_failures failed reads in a row, or one
+# read that blocked longer than stall_timeout, the device is released and
+# reopened with reopen() (a callable returning a new VideoCapture, e.g.
+# functools.partial(open_camera, 0, cv2.CAP_V4L2)), with capped exponential
+# backoff and jitter between attempts. Without reopen the same device is just
+# retried on that schedule. Waiting is done on an Event, so a missing camera
+# costs no CPU; consumers keep waiting on the hub and resume with the first
+# new frame.
+#
+# health() is cheap to poll; on_health(health) is called on every state
+# change, from the capture thread or, for stalls, from a watchdog thread that
+# only looks at timestamps (a read blocked in the driver can't be interrupted
+# safely, so a stalled device is reopened once that read returns).
+class CaptureThread(threading.Thread):
+    def __init__(self, camera, hub, retry_delay=0.1, reopen=None, max_failures=5,
+                 stall_timeout=5.0, base_backoff=1.0, max_backoff=30.0, on_health=None):
+        super().__init__(daemon=True)
+        self.camera = camera
+        self.hub = hub
+        self.retry_delay = retry_delay
+        self.reopen = reopen
+        self.max_failures = max_failures
+        self.stall_timeout = stall_timeout
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.on_health = on_health
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._state = CAPTURE_OK
+        self._since = time.monotonic()
+        self._last_frame = None
+        self._failures = 0
+        self._attempts = 0  # reopen attempts since the last good frame
+        self.reconnects = 0
+        self._error = None
+        self._watchdog = threading.Thread(target=self._watch, daemon=True)
+
+    def start(self):
+        super().start()
+        self._watchdog.start()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            if self.camera is None or not self.camera.isOpened():
+                self._reconnect(self._error or "camera not opened")
+                continue
+            started = time.monotonic()
+            with CAPTURE_SECONDS.time():
+                try:
+                    success, frame = self.camera.read()
+                except cv2.error as e:
+                    success, frame, self._error = False, None, str(e)
+            if not success:
+                CAPTURE_FAILURES.inc()
+                self._failures += 1
+                if self._failures >= self.max_failures:
+                    self._reconnect(self._error or f"{self._failures} failed reads")
+                else:
+                    self._stop_event.wait(self.retry_delay)
+                continue
+            if time.monotonic() - started > self.stall_timeout:
+                # The driver returned eventually; don't trust the device
+                self._reconnect(f"read blocked for {time.monotonic() - started:.1f}s")
+                continue
+            if _compressed(frame):
+                frame = JpegFrame(frame.tobytes())
+            self.hub.publish(frame)
+            FRAMES_CAPTURED.inc()
+            self._last_frame = time.monotonic()
+            if self._failures or self._attempts or self._state != CAPTURE_OK:
+                self._failures = self._attempts = 0
+                self._error = None
+                self._set_state(CAPTURE_OK)
+        self._set_state(CAPTURE_STOPPED)
+
+    def _reconnect(self, reason):
+        self._error = reason
+        delay = min(self.max_backoff, self.base_backoff * (2 ** self._attempts))
+        delay *= random.uniform(0.5, 1.0)
+        self._attempts += 1
+        self._failures = 0
+        self._set_state(CAPTURE_RECONNECTING)
+        print(f"[CAPTURE] {reason}; reopening in {delay:.1f}s")
+        if self.reopen is not None and self.camera is not None:
+            self.camera.release()
+            self.camera = None
+        if self._stop_event.wait(delay):
+            return
+        CAPTURE_RECONNECTS.inc()
+        self.reconnects += 1
+        if self.reopen is None:
+            return  # just try reading the same device again
+        try:
+            self.camera = self.reopen()
+            if not self.camera.isOpened():
+                self._error = "camera did not reopen"
+        except Exception as e:
+            self._error = f"reopen failed: {e}"
+
+    def _watch(self):
+        while not self._stop_event.wait(self.stall_timeout / 2):
+            with self._lock:
+                last = self._last_frame or self._since
+                stalled = (self._state == CAPTURE_OK
+                           and time.monotonic() - last > self.stall_timeout)
+            if stalled:
+                self._set_state(CAPTURE_STALLED)
+
+    def _set_state(self, state):
+        with self._lock:
+            if state == self._state:
+                return
+            self._state = state
+            self._since = time.monotonic()
+        if self.on_health is not None:
+            try:
+                self.on_health(self.health())
+            except Exception as e:
+                print("[CAPTURE] Health callback error:", e)
+
+    def health(self):
+        with self._lock:
+            now = time.monotonic()
+            frame_age = now - self._last_frame if self._last_frame is not None else None
+            return CaptureHealth(self._state, now - self._since, frame_age,
+                                 self._failures, self.reconnects, self._error)
+
+    def register_metrics(self, **labels):
+        METRICS.gauge('capture_healthy', lambda: self.health().state == CAPTURE_OK,
+                      "1 while frames arrive", **labels)
+        METRICS.gauge('frame_age_seconds', lambda: time.time() - self.hub.timestamp,
+                      "Age of the newest camera frame", **labels)
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+        if self.reopen is not None and self.camera is not None:
+            self.camera.release()  # may be a reopened device the caller never saw
+        self.hub.close()
+
@@ -0,0 +1,188 @@
+import glob
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+# --- Simulated clock ---
+# Stands in for time.time/time.monotonic/time.sleep. Replay sources advance it
+# by one frame interval per frame, so anything timed against it (motion-gated
+# full refreshes, occupancy countdowns) behaves as if the recording played in
+# real time, however fast it is actually processed.
+class SimulatedClock:
+    def __init__(self, start=None):
+        self._now = time.time() if start is None else start
+        self._lock = threading.Lock()
+
+    def time(self):
+        return self._now
+
+    def monotonic(self):
+        return self._now
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        with self._lock:
+            self._now += max(0.0, seconds)
+            return self._now
+
+
+# --- Replay source ---
+# Drop-in for cv2.VideoCapture (read/grab/retrieve/isOpened/get/set/release)
+# that plays a video file or a directory of images, so CaptureThread and
+# everything behind it run without a camera. With mjpeg, frames come out the
+# way V4L2 MJPEG capture returns them (a 1xN row of JPEG bytes, wrapped into a
+# JpegFrame by CaptureThread); image directories of .jpg files are then
+# passed through without re-encoding.
+#
+# realtime paces read() at the recording's fps against the wall clock;
+# otherwise it returns as fast as frames can be produced, and `clock` (if
+# given) is advanced one frame interval per frame.
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class ReplaySource:
+    def __init__(self, path, fps=None, size=None, loop=False, mjpeg=False, realtime=False,
+                 clock=None, quality=90, preload=True):
+        self.path = path
+        self.size = tuple(size) if size else None
+        self.loop = loop
+        self.mjpeg = mjpeg
+        self.realtime = realtime
+        self.clock = clock
+        self.params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        self.frames_read = 0
+        self._capture = None
+        self._files = None
+        self._cache = None
+        self._index = 0
+        self._next_at = None
+        self._pending = None
+
+        if os.path.isdir(path):
+            self._files = sorted(p for p in glob.glob(os.path.join(path, '*'))
+                                 if p.lower().endswith(IMAGE_EXTENSIONS))
+            self.fps = fps or 15.0
+            if preload:
+                # Keep decoding/disk reads out of the measured capture stage
+                self._cache = [self._load(p) for p in self._files]
+        else:
+            self._capture = cv2.VideoCapture(path)
+            self.fps = fps or self._capture.get(cv2.CAP_PROP_FPS) or 15.0
+            if preload and self._capture.isOpened():
+                self._cache = []
+                while True:
+                    ok, frame = self._capture.read()
+                    if not ok:
+                        break
+                    self._cache.append(self._convert(frame))
+                self._capture.release()
+                self._capture = None
+
+    # --- VideoCapture interface ---
+    def isOpened(self):
+        if self._cache is not None:
+            return len(self._cache) > 0
+        if self._files is not None:
+            return len(self._files) > 0
+        return self._capture is not None and self._capture.isOpened()
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def grab(self):
+        frame = self._next()
+        if frame is None:
+            return False
+        self._pace()
+        self._pending = frame
+        self.frames_read += 1
+        return True
+
+    def retrieve(self, image=None):
+        frame, self._pending = self._pending, None
+        if frame is None:
+            return False, None
+        if image is not None and not self.mjpeg and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self._index
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self._cache or self._files or [])
+        return 0.0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self._index = int(value)
+            return True
+        return False  # resolution, fourcc etc. are fixed by the recording
+
+    def release(self):
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+
+    def __len__(self):
+        return len(self._cache if self._cache is not None else self._files or [])
+
+    # --- Internals ---
+    def _load(self, path):
+        if self.mjpeg and self.size is None and path.lower().endswith(('.jpg', '.jpeg')):
+            with open(path, 'rb') as f:
+                return np.frombuffer(f.read(), np.uint8).reshape(1, -1)
+        return self._convert(cv2.imread(path))
+
+    def _convert(self, frame):
+        if frame is None:
+            return None
+        if self.size and frame.shape[1::-1] != self.size:
+            frame = cv2.resize(frame, self.size)
+        if self.mjpeg:
+            return cv2.imencode('.jpg', frame, self.params)[1].reshape(1, -1)
+        return frame
+
+    def _next(self):
+        while True:
+            if self._cache is not None:
+                total = len(self._cache)
+                frame = self._cache[self._index] if self._index < total else None
+            elif self._files is not None:
+                total = len(self._files)
+                frame = self._load(self._files[self._index]) if self._index < total else None
+            else:
+                ok, frame = self._capture.read() if self._capture is not None else (False, None)
+                total = None
+                frame = self._convert(frame) if ok else None
+            if frame is not None:
+                self._index += 1
+                return frame
+            if not self.loop or total == 0:
+                return None
+            self._index = 0
+            if self._capture is not None:
+                self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def _pace(self):
+        interval = 1.0 / self.fps
+        if self.clock is not None:
+            self.clock.advance(interval)
+        if self.realtime:
+            now = time.monotonic()
+            if self._next_at is None:
+                self._next_at = now
+            elif self._next_at > now:
+                time.sleep(self._next_at - now)
+            self._next_at = max(self._next_at, now) + interval
@@ -0,0 +1,137 @@
+import argparse
+import asyncio
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+
+# --- MJPEG load test ---
+# Opens N concurrent /video_feed connections, counts the frames each receives
+# for --duration seconds and samples the server process's CPU time from
+# /proc, for each N in --viewers. With --spawn the server is started here on
+# a synthetic source, so async and Flask modes can be compared on one box:
+#
+#   python loadtest_stream.py --spawn async --viewers 1,10,100,500
+#   python loadtest_stream.py --spawn flask --viewers 1,10,100
+#   python loadtest_stream.py --url http://pi:5000/video_feed --pid 1234
+
+BOUNDARY = b'--frame'
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def process_cpu_seconds(pid):
+    # utime + stime of the process, from /proc/<pid>/stat
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+async def viewer(host, port, path, deadline, counts, index):
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        counts[index] = -1
+        return
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+    tail = b''
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                chunk = await asyncio.wait_for(reader.read(65536), remaining)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            data = tail + chunk
+            counts[index] += data.count(BOUNDARY)
+            tail = data[-(len(BOUNDARY) - 1):]
+    finally:
+        writer.close()
+
+
+async def run_level(url, viewers, duration, ramp=2.0):
+    parts = urlsplit(url)
+    host, port, path = parts.hostname, parts.port or 80, parts.path or '/'
+    counts = [0] * viewers
+    deadline = time.monotonic() + ramp + duration
+    tasks = []
+    for i in range(viewers):
+        tasks.append(asyncio.create_task(viewer(host, port, path, deadline, counts, i)))
+        if viewers > 1:
+            await asyncio.sleep(ramp / viewers)
+    # Only count frames once everyone is connected
+    await asyncio.sleep(max(0.0, deadline - duration - time.monotonic()))
+    start_counts = list(counts)
+    await asyncio.gather(*tasks)
+    return [max(0, end - start) if end >= 0 else -1 for start, end in zip(start_counts, counts)]
+
+
+def measure(url, viewers, duration, pid):
+    cpu_before = process_cpu_seconds(pid) if pid else None
+    started = time.monotonic()
+    counts = asyncio.run(run_level(url, viewers, duration))
+    elapsed = time.monotonic() - started
+    cpu = None
+    if pid:
+        cpu = 100.0 * (process_cpu_seconds(pid) - cpu_before) / elapsed
+    connected = [c for c in counts if c >= 0]
+    fps = np.array(connected, dtype=float) / duration if connected else np.zeros(1)
+    return {
+        'viewers': viewers,
+        'connected': len(connected),
+        'fps_mean': float(fps.mean()),
+        'fps_min': float(fps.min()),
+        'fps_p5': float(np.percentile(fps, 5)),
+        'server_cpu_percent': cpu,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure MJPEG viewers vs server CPU")
+    parser.add_argument('--url', default='http://127.0.0.1:5099/video_feed')
+    parser.add_argument('--viewers', default='1,10,50,100', help="comma-separated viewer counts")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds measured per level")
+    parser.add_argument('--pid', type=int, help="server process to sample CPU from")
+    parser.add_argument('--spawn', choices=['async', 'flask'],
+                        help="start async_server.py on a synthetic source in this mode")
+    parser.add_argument('--server-args', default='', help="extra arguments for the spawned server")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    server = None
+    pid = args.pid
+    if args.spawn:
+        port = urlsplit(args.url).port or 80
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'async_server.py'),
+                   '--mode', args.spawn, '--port', str(port)] + shlex.split(args.server_args)
+        server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        pid = server.pid
+        time.sleep(2.0)
+
+    results = []
+    try:
+        print(f"{'viewers':>7} {'conn':>5} {'fps mean':>9} {'fps min':>8} {'fps p5':>7} {'cpu %':>7}")
+        for viewers in (int(v) for v in args.viewers.split(',')):
+            result = measure(args.url, viewers, args.duration, pid)
+            results.append(result)
+            cpu = result['server_cpu_percent']
+            print(f"{viewers:>7} {result['connected']:>5} {result['fps_mean']:>9.1f} "
+                  f"{result['fps_min']:>8.1f} {result['fps_p5']:>7.1f} "
+                  f"{'-' if cpu is None else format(cpu, '.1f'):>7}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
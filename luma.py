@@ -0,0 +1,51 @@
+from collections import namedtuple
+
+import numpy as np
+
+from frame_hub import JpegFrame
+
+
+# --- Luma-only analysis ---
+# Brightness and motion only need the Y (luma) plane, and only a coarse grid
+# of it. luma_view() gets there without a full-frame conversion:
+#   - raw YUYV capture (HxWx2): Y is channel 0, returned as a strided view
+#   - grayscale frames: a strided view
+#   - MJPEG frames: libjpeg decodes only the Y component, scaled in the IDCT
+#   - BGR frames: Rec.601 luma computed on the subsampled grid only
+# `step` keeps every step-th pixel in each direction, so a step of 2 on
+# 320x240 analyses 160x120 samples.
+_BGR_LUMA = np.array([29, 150, 77], np.uint16)  # Rec.601 weights * 256, BGR order
+
+Brightness = namedtuple('Brightness', ['mean', 'peak'])
+
+
+def luma_view(frame, step=1):
+    if isinstance(frame, JpegFrame):
+        reduce = next(r for r in (8, 4, 2, 1) if step % r == 0)
+        gray = frame.decode_gray(reduce)
+        step //= reduce
+        return gray[::step, ::step] if step > 1 else gray
+    if frame.ndim == 2:
+        return frame[::step, ::step]
+    if frame.shape[2] == 2:
+        return frame[::step, ::step, 0]
+    return ((frame[::step, ::step] @ _BGR_LUMA) >> 8).astype(np.uint8)
+
+
+def brightness(luma, patch=10):
+    # One pass over the luma grid: overall mean, and the mean of the
+    # brightest patch x patch block (a lamp or window, not the room average).
+    # Note YUYV luma is limited range (16-235) while decoded frames are 0-255.
+    mean = float(luma.mean())
+    rows, cols = luma.shape[0] // patch, luma.shape[1] // patch
+    if not rows or not cols:
+        return Brightness(mean, mean)
+    blocks = luma[:rows * patch, :cols * patch].reshape(rows, patch, cols, patch)
+    return Brightness(mean, float(blocks.mean(axis=(1, 3)).max()))
+
+
+def changed_pixels(prev, luma, threshold=25):
+    # Number of grid samples whose luma moved by more than threshold
+    if prev is None or prev.shape != luma.shape:
+        return 0
+    return int(np.count_nonzero(np.abs(luma.astype(np.int16) - prev) > threshold))
@@ -0,0 +1,321 @@
+import bisect
+import collections
+import os
+import sys
+import threading
+import time
+import weakref
+
+
+# --- Metrics ---
+# Counters and latency histograms cheap enough to leave on in production.
+# Past a thread's first use, recording takes no lock: every thread writes its
+# own shard (a plain list), and a scrape sums the shards. When a thread exits
+# its shard is folded into a shared base, so short-lived threads (one per
+# MJPEG viewer) don't pile up shards. A scrape may miss an increment that is
+# happening at that moment, never one that already happened. Gauges are
+# callables read at scrape time (viewer counts, queue depths). render()
+# returns the Prometheus text format.
+#
+#   CAPTURE_SECONDS = METRICS.histogram('stage_seconds', "Pipeline stage latency", stage='capture')
+#   with CAPTURE_SECONDS.time():
+#       ok, frame = camera.read()
+
+# Seconds, 100us to 5s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+class _ThreadToken:
+    # Lives in a thread's local storage; collected when the thread exits
+    pass
+
+
+class _Sharded:
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        # Taken on a thread's first use, on its exit and by scrapes, never
+        # per increment. Reentrant: a retire can run from the garbage
+        # collector while this thread is inside _totals().
+        self._lock = threading.RLock()
+        self._shards = {}  # id(shard) -> shard, one per live thread
+        self._base = [0] * size  # what exited threads recorded
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = [0] * self._size
+            token = self._local.token = _ThreadToken()
+            with self._lock:
+                self._shards[id(shard)] = shard
+            weakref.finalize(token, self._retire, shard)
+            return shard
+
+    def _retire(self, shard):
+        with self._lock:
+            for i, value in enumerate(shard):
+                self._base[i] += value
+            del self._shards[id(shard)]
+
+    def _totals(self):
+        with self._lock:
+            totals = list(self._base)
+            shards = list(self._shards.values())
+        for shard in shards:
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+
+class Counter(_Sharded):
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount=1):
+        self._shard()[0] += amount
+
+    @property
+    def value(self):
+        return self._totals()[0]
+
+
+class _Timer:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class Histogram(_Sharded):
+    # Shard layout: one count per bucket, one for +Inf, then the sum
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(len(self.buckets) + 2)
+
+    def observe(self, value):
+        shard = self._shard()
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def time(self):
+        return _Timer(self)
+
+    def snapshot(self):
+        # (cumulative bucket counts incl. +Inf, count, sum)
+        totals = self._totals()
+        cumulative, running = [], 0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, running, totals[-1]
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        cumulative, count, _ = self.snapshot()
+        if not count:
+            return None
+        rank = q * count
+        for bound, seen in zip(self.buckets + (float('inf'),), cumulative):
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Registry:
+    def __init__(self, prefix='roommon_'):
+        self.prefix = prefix
+        self._lock = threading.Lock()  # creation and registration only
+        self._families = collections.OrderedDict()  # name -> (type, help, {labels: metric})
+
+    def _get(self, kind, name, help, labels, factory):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = (kind, help, collections.OrderedDict())
+            elif family[0] != kind:
+                raise ValueError(f"metric {name!r} is already a {family[0]}")
+            metrics = family[2]
+            if key not in metrics:
+                metrics[key] = factory()
+            return metrics[key]
+
+    def counter(self, name, help='', **labels):
+        return self._get('counter', name, help, labels, Counter)
+
+    def histogram(self, name, help='', buckets=LATENCY_BUCKETS, **labels):
+        return self._get('histogram', name, help, labels, lambda: Histogram(buckets))
+
+    def gauge(self, name, read, help='', **labels):
+        # read() is called on every scrape; registering again replaces it
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, ('gauge', help, collections.OrderedDict()))
+            family[2][key] = read
+
+    def render(self):
+        with self._lock:
+            families = [(name, kind, help, list(metrics.items()))
+                        for name, (kind, help, metrics) in self._families.items()]
+        lines = []
+        for name, kind, help, metrics in families:
+            full_name = self.prefix + name
+            if help:
+                lines.append(f'# HELP {full_name} {help}')
+            lines.append(f'# TYPE {full_name} {kind}')
+            for labels, metric in metrics:
+                if kind == 'counter':
+                    lines.append(f'{full_name}{_label_text(labels)} {metric.value}')
+                elif kind == 'gauge':
+                    try:
+                        value = float(metric())
+                    except Exception:
+                        continue  # the thing being measured is gone or not ready
+                    lines.append(f'{full_name}{_label_text(labels)} {value}')
+                else:
+                    cumulative, count, total = metric.snapshot()
+                    bounds = [repr(b) for b in metric.buckets] + ['+Inf']
+                    for bound, seen in zip(bounds, cumulative):
+                        lines.append(f'{full_name}_bucket{_label_text(labels + (("le", bound),))} {seen}')
+                    lines.append(f'{full_name}_sum{_label_text(labels)} {total}')
+                    lines.append(f'{full_name}_count{_label_text(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _resident_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+# Process-wide registry shared by every module
+METRICS = Registry()
+METRICS.gauge('process_resident_bytes', _resident_bytes, "Resident set size")
+METRICS.gauge('process_threads', threading.active_count, "Live Python threads")
+
+
+def stage(name):
+    # Latency histogram of one pipeline stage
+    return METRICS.histogram('stage_seconds', "Pipeline stage latency in seconds", stage=name)
+
+
+# --- Sampling profiler ---
+# Off unless asked for. While running, a thread snapshots every other
+# thread's Python stack each `interval` seconds and counts identical stacks;
+# folded() returns them in the collapsed format flamegraph.pl and speedscope
+# read ("outer;inner;leaf count"). Cost while off is zero, while on roughly
+# one stack walk per thread per interval.
+class SamplingProfiler:
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._stacks = collections.Counter()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self.samples = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return False
+            self._stacks.clear()
+            self.samples = 0
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True, name='profiler')
+            self._thread.start()
+            return True
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(2.0)
+        return self.folded()
+
+    def profile(self, seconds):
+        # Blocking: sample for `seconds`, return the folded stacks
+        if not self.start():
+            raise RuntimeError("profiler is already running")
+        self._stop_event.wait(seconds)
+        return self.stop()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            names.update((t.ident, t.name) for t in threading.enumerate())
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                with self._lock:
+                    self._stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self, limit=None):
+        with self._lock:
+            stacks = self._stacks.most_common(limit)
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks)
+
+
+PROFILER = SamplingProfiler()
+
+
+# --- HTTP routes ---
+# GET /metrics is the Prometheus scrape. GET /metrics/profile samples for
+# ?seconds= (default 10, at most PROFILE_MAX_SECONDS, since it holds a
+# request thread) and returns folded stacks for flamegraph.pl / speedscope.
+# For longer profiles, ?action=start returns at once and ?action=stop
+# returns everything sampled since.
+PROFILE_MAX_SECONDS = 30.0
+
+
+def register_routes(app, registry=METRICS, profiler=PROFILER):
+    from flask import Response, request
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/metrics/profile')
+    def metrics_profile():
+        action = request.args.get('action')
+        if action == 'start':
+            if not profiler.start():
+                return Response("profiler is already running", status=409, mimetype='text/plain')
+            return Response("started\n", status=202, mimetype='text/plain')
+        if action == 'stop':
+            if not profiler.running:
+                return Response("profiler is not running", status=409, mimetype='text/plain')
+            return Response(profiler.stop(), mimetype='text/plain')
+        if action is not None:
+            return Response("action must be start or stop", status=400, mimetype='text/plain')
+        seconds = min(request.args.get('seconds', 10.0, type=float), PROFILE_MAX_SECONDS)
+        try:
+            return Response(profiler.profile(seconds), mimetype='text/plain')
+        except RuntimeError as e:
+            return Response(str(e), status=409, mimetype='text/plain')
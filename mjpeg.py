@@ -0,0 +1,105 @@
+import threading
+import time
+
+import cv2
+
+from frame_hub import JpegFrame, as_image
+from metrics import METRICS, stage
+
+
+BOUNDARY = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+
+
+IMENCODE_SECONDS = stage('imencode')
+
+
+def mjpeg_part(frame_bytes):
+    return BOUNDARY + frame_bytes + b'\r\n'
+
+
+# --- Encode-once MJPEG broadcaster ---
+# Each hub frame is rendered and JPEG-encoded at most once, by whichever
+# viewer asks for it first; every other viewer gets the same bytes object.
+# Viewers always jump to the newest frame, so a slow client drops frames
+# instead of queueing them, and with no viewers nothing is encoded at all.
+#
+# Frames captured as MJPEG are forwarded as the camera's own bytes whenever
+# no overlay is needed: always without a render function, otherwise whenever
+# passthrough() says the overlay would be empty.
+class MjpegBroadcaster:
+    def __init__(self, hub, render=None, quality=None, max_fps=None, passthrough=None):
+        self.hub = hub
+        self.render = render
+        self.passthrough = passthrough
+        self.params = [int(cv2.IMWRITE_JPEG_QUALITY), quality] if quality else []
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self._lock = threading.Lock()
+        self._encoded_seq = 0
+        self._encoded = None
+        self._stats_lock = threading.Lock()
+        self.viewers = 0
+        self.encoded_frames = 0
+        self.passthrough_frames = 0
+        self.dropped_frames = 0
+
+    def frame_bytes(self, seq, frame):
+        with self._lock:
+            if self._encoded_seq != seq:
+                if isinstance(frame, JpegFrame) and (
+                        self.render is None or (self.passthrough and self.passthrough())):
+                    self._encoded = frame.data
+                    self._encoded_seq = seq
+                    self.passthrough_frames += 1
+                    return self._encoded
+                image = as_image(frame)
+                if self.render:
+                    image = self.render(image)
+                with IMENCODE_SECONDS.time():
+                    ok, buffer = cv2.imencode('.jpg', image, self.params)
+                if not ok:
+                    return self._encoded
+                self._encoded = buffer.tobytes()
+                self._encoded_seq = seq
+                self.encoded_frames += 1
+            return self._encoded
+
+    def add_viewer(self):
+        # Returns the viewer count including the new one
+        with self._stats_lock:
+            self.viewers += 1
+            return self.viewers
+
+    def remove_viewer(self):
+        with self._stats_lock:
+            self.viewers -= 1
+            return self.viewers
+
+    def register_metrics(self, **labels):
+        METRICS.gauge('stream_viewers', lambda: self.viewers, "Connected MJPEG viewers", **labels)
+        METRICS.gauge('stream_dropped_frames', lambda: self.dropped_frames,
+                      "Frames skipped by slow viewers", **labels)
+
+    def gen_frames(self):
+        self.add_viewer()
+        try:
+            seq = 0
+            while True:
+                started = time.monotonic()
+                newest, frame = self.hub.wait(seq)
+                if frame is None:
+                    break
+                if seq and newest - seq > 1:
+                    with self._stats_lock:
+                        self.dropped_frames += newest - seq - 1
+                seq = newest
+                frame_bytes = self.frame_bytes(seq, frame)
+                if frame_bytes is None:
+                    continue
+                yield mjpeg_part(frame_bytes)
+
+                if self.min_interval:
+                    remaining = self.min_interval - (time.monotonic() - started)
+                    if remaining > 0:
+                        time.sleep(remaining)
+        finally:
+            self.remove_viewer()
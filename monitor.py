@@ -0,0 +1,117 @@
+import time
+
+from luma import luma_view, brightness as luma_brightness, changed_pixels
+from metrics import stage
+from occupancy import SignalRule
+from schedule_cache import UNKNOWN
+
+
+HUMAN_MIN_DWELL = 2.0  # seconds one tracked person must stay before Human counts
+LUMA_STEP = 2  # light and motion checks sample every 2nd pixel of the Y plane
+MOTION_AREA = 500  # changed pixels (at capture size) that count as motion
+LIGHT_ON = 110  # brightest-patch level that counts as lights on
+BUZZ_SECONDS = 5
+
+BRIGHTNESS_SECONDS = stage('brightness')
+
+
+def occupancy_rules(human_min_dwell=HUMAN_MIN_DWELL):
+    # Human flags once one tracked person has stayed human_min_dwell seconds,
+    # motion and light once they have lasted 60s; each re-arms when the signal
+    # goes away. Light turns off only below 100.
+    return {
+        'Human': SignalRule(0, on=human_min_dwell),
+        'Motion': SignalRule(60, on=MOTION_AREA),
+        'Light': SignalRule(60, on=LIGHT_ON, off=100),
+    }
+
+
+# --- Room monitor ---
+# The body of test.py's monitoring loop, called once per detection interval
+# with the newest detection and frame: brightness and motion from the frame's
+# luma, the schedule status, the occupancy rules, the LCD text, telemetry,
+# flags and the /events state. Everything that reaches hardware or the
+# network is passed in -- `actuators` (an ActuatorService over RPi.GPIO and
+# the CharLCD, or FakeGPIO/FakeLCD), schedule_status() and flag(signal) -- so
+# bench_pipeline.py replays recordings through this same code.
+class RoomMonitor:
+    def __init__(self, room, occupancy, tracker, actuators, schedule_status, flag,
+                 telemetry=None, state_channel=None, camera_state=None,
+                 luma_step=LUMA_STEP, clock=time.time):
+        self.room = room
+        self.occupancy = occupancy
+        self.tracker = tracker
+        self.actuators = actuators
+        self.schedule_status = schedule_status
+        self.flag = flag
+        self.telemetry = telemetry
+        self.state_channel = state_channel
+        self.camera_state = camera_state
+        self.luma_step = luma_step
+        self.clock = clock
+        self.prev_luma = None
+        self.flagged_at = None
+
+    def update(self, detection, frame):
+        # One pass; returns the occupancy events it produced
+        step = self.luma_step
+        with BRIGHTNESS_SECONDS.time():
+            luma = luma_view(frame, step)
+            # Brightest 20x20 patch
+            brightness = luma_brightness(luma, patch=20 // step).peak
+
+        status = self.schedule_status()
+
+        # Motion Detection (changed samples scaled back to capture pixels)
+        motion_area = 0
+        if self.prev_luma is not None:
+            motion_area = changed_pixels(self.prev_luma, luma, 25) * step ** 2
+        self.prev_luma = luma
+
+        # If occupied (or the schedule is unknown), skip flagging
+        if status in ("Occupied", UNKNOWN):
+            self.occupancy.reset(self.room)
+            events = []
+        else:
+            events = self.occupancy.observe_all(self.room, {
+                'Human': self.tracker.longest_dwell(),
+                'Motion': motion_area,
+                'Light': brightness,
+            })
+        human_detected = len(detection.rects) > 0
+        motion_detected = motion_area > MOTION_AREA
+        light_on = self.occupancy.active(self.room, 'Light') or brightness > LIGHT_ON
+
+        # --- LCD status ---
+        if status == "Occupied":
+            self.actuators.show("Occupied...")
+        elif human_detected:
+            self.actuators.show("Human detected")
+        elif motion_detected:
+            self.actuators.show("Motion detected")
+        elif light_on:
+            self.actuators.show("Light detected")
+        else:
+            self.actuators.show("Monitoring...")
+
+        if self.telemetry is not None:
+            self.telemetry.record(self.room, brightness=brightness, motion_area=motion_area,
+                                  humans=len(detection.rects), status=status)
+
+        for event in events:
+            if event.kind != 'flagged':
+                continue
+            if event.signal != 'Human':
+                print(f"[ALERT] {event.signal} > 60s. Flagging schedule...")
+            self.flag(event.signal)
+            self.actuators.buzz(BUZZ_SECONDS, message="Buzzing!")
+            self.flagged_at = int(self.clock())
+
+        # Dashboards on /events only hear about changes
+        if self.state_channel is not None:
+            self.state_channel.publish(
+                self.room, human=human_detected, motion=motion_detected, light=light_on,
+                status=status, flagged_at=self.flagged_at,
+                people=sorted(track.id for track in self.tracker.tracks),
+                camera=self.camera_state() if self.camera_state else None)
+        return events
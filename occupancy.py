@@ -0,0 +1,248 @@
+import collections
+import math
+import threading
+import time
+
+
+# --- Timer wheel ---
+# Hashed timing wheel: timers land in slot (tick % slots) and are checked only
+# when the wheel reaches that slot, so scheduling and cancelling are O(1)
+# however many rooms have countdowns running. The wheel has no thread of its
+# own; whoever owns it calls advance(now), and callbacks run there.
+class _Timer:
+    __slots__ = ('tick', 'at', 'callback')
+
+    def __init__(self, tick, at, callback):
+        self.tick = tick
+        self.at = at
+        self.callback = callback
+
+
+class TimerWheel:
+    def __init__(self, tick=0.5, slots=256, now=0.0):
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.current = int(now // tick)
+        self.pending = 0
+
+    def schedule(self, at, callback):
+        # callback(at) runs on the first advance() at or after `at`
+        tick = max(int(math.ceil(at / self.tick)), self.current + 1)
+        timer = _Timer(tick, at, callback)
+        self.slots[tick % len(self.slots)].append(timer)
+        self.pending += 1
+        return timer
+
+    def cancel(self, timer):
+        if timer is not None and timer.callback is not None:
+            timer.callback = None
+            self.pending -= 1
+
+    def advance(self, now):
+        target = int(now // self.tick)
+        while self.current < target:
+            if not self.pending:
+                self.current = target
+                break
+            self.current += 1
+            bucket = self.slots[self.current % len(self.slots)]
+            due = [t for t in bucket if t.callback is not None and t.tick <= self.current]
+            bucket[:] = [t for t in bucket if t.callback is not None and t.tick > self.current]
+            for timer in due:
+                callback, timer.callback = timer.callback, None
+                self.pending -= 1
+                callback(timer.at)
+
+
+# --- Occupancy engine ---
+# One state machine per (room, signal):
+#
+#   idle --active--> pending --flag_after--> flagged --repeat--> flagged ...
+#     ^                 |                       |
+#     +---cancelled-----+-----cleared-----------+
+#
+# Observations go in with observe(); 'started', 'flagged', 'cancelled' and
+# 'cleared' events come out, both as the return value and through on_event.
+# Hysteresis works two ways: numeric signals turn on above `on` and only off
+# below `off`, and with clear_after a signal has to stay inactive that long
+# before a pending countdown is cancelled or a flag cleared.
+#
+# All timers live in one TimerWheel, driven by observe()/advance() against an
+# injectable clock, so the engine needs no threads and replays exactly.
+IDLE = 'idle'
+PENDING = 'pending'
+FLAGGED = 'flagged'
+CLEARING = 'clearing'
+
+OccupancyEvent = collections.namedtuple('OccupancyEvent', ['room', 'signal', 'kind', 'at'])
+
+
+class SignalRule:
+    def __init__(self, flag_after=60.0, on=None, off=None, clear_after=0.0, repeat=None):
+        self.flag_after = flag_after
+        self.on = on
+        self.off = on if off is None else off
+        self.clear_after = clear_after
+        self.repeat = repeat
+
+    def is_active(self, value, was_active):
+        if self.on is None:
+            return bool(value)
+        return value > (self.off if was_active else self.on)
+
+
+class _Track:
+    __slots__ = ('state', 'active', 'resume', 'due', 'deadline', 'timer', 'clear_timer')
+
+    def __init__(self):
+        self.state = IDLE
+        self.active = False
+        self.resume = None
+        self.due = False
+        self.deadline = None
+        self.timer = None
+        self.clear_timer = None
+
+
+class OccupancyEngine:
+    def __init__(self, rules=None, clock=time.monotonic, tick=0.5, slots=256, on_event=None):
+        self.rules = dict(rules or {})
+        self.room_rules = {}
+        self.clock = clock
+        self.on_event = on_event
+        self.wheel = TimerWheel(tick, slots, clock())
+        self._tracks = {}
+        self._events = []
+        self._lock = threading.RLock()
+
+    def set_rules(self, room, rules):
+        with self._lock:
+            self.room_rules[room] = dict(rules)
+
+    def rule(self, room, signal):
+        rules = self.room_rules.get(room, self.rules)
+        return rules[signal]
+
+    # --- Inputs ---
+    def observe(self, room, signal, value, now=None):
+        return self.observe_all(room, {signal: value}, now)
+
+    def observe_all(self, room, values, now=None):
+        with self._lock:
+            now = self.clock() if now is None else now
+            self.wheel.advance(now)
+            for signal, value in values.items():
+                track = self._track(room, signal)
+                track.active = self.rule(room, signal).is_active(value, track.active)
+                if track.active:
+                    self._on_active(room, signal, track, now)
+                else:
+                    self._on_inactive(room, signal, track, now)
+            events, self._events = self._events, []
+        return self._notify(events)
+
+    def advance(self, now=None):
+        with self._lock:
+            self.wheel.advance(self.clock() if now is None else now)
+            events, self._events = self._events, []
+        return self._notify(events)
+
+    def reset(self, room):
+        # Back to idle without events, e.g. while the room is booked
+        with self._lock:
+            for (track_room, _), track in self._tracks.items():
+                if track_room == room:
+                    self.wheel.cancel(track.timer)
+                    self.wheel.cancel(track.clear_timer)
+                    track.__init__()
+
+    def call_later(self, delay, callback):
+        with self._lock:
+            return self.wheel.schedule(self.clock() + delay, lambda at: callback())
+
+    # --- Queries ---
+    def state(self, room, signal):
+        track = self._tracks.get((room, signal))
+        return track.state if track else IDLE
+
+    def active(self, room, signal):
+        track = self._tracks.get((room, signal))
+        return bool(track and track.active)
+
+    def remaining(self, room, signal, now=None):
+        # Seconds until the next flag, or None if no countdown is running
+        track = self._tracks.get((room, signal))
+        if track is None or track.deadline is None:
+            return None
+        return max(0.0, track.deadline - (self.clock() if now is None else now))
+
+    # --- Transitions ---
+    def _track(self, room, signal):
+        track = self._tracks.get((room, signal))
+        if track is None:
+            track = self._tracks[(room, signal)] = _Track()
+        return track
+
+    def _on_active(self, room, signal, track, now):
+        if track.state == IDLE:
+            track.state = PENDING
+            self._emit(room, signal, 'started', now)
+            flag_after = self.rule(room, signal).flag_after
+            if flag_after <= 0:
+                self._flag(room, signal, track, now)
+            else:
+                self._schedule_flag(room, signal, track, now + flag_after)
+        elif track.state == CLEARING:
+            self.wheel.cancel(track.clear_timer)
+            track.clear_timer = None
+            track.state, track.resume = track.resume, None
+            if track.due:
+                self._flag(room, signal, track, now)
+
+    def _on_inactive(self, room, signal, track, now):
+        if track.state not in (PENDING, FLAGGED):
+            return
+        clear_after = self.rule(room, signal).clear_after
+        if clear_after > 0:
+            track.resume, track.state = track.state, CLEARING
+            track.clear_timer = self.wheel.schedule(
+                now + clear_after, lambda at: self._clear(room, signal, track, at))
+        else:
+            track.resume = track.state
+            self._clear(room, signal, track, now)
+
+    def _schedule_flag(self, room, signal, track, at):
+        track.deadline = at
+        track.timer = self.wheel.schedule(at, lambda at: self._flag_due(room, signal, track, at))
+
+    def _flag_due(self, room, signal, track, at):
+        track.timer = None
+        if track.state == CLEARING:
+            track.due = True  # flag on resume if the signal comes back in time
+        else:
+            self._flag(room, signal, track, at)
+
+    def _flag(self, room, signal, track, at):
+        track.state = FLAGGED
+        track.due = False
+        track.deadline = None
+        self._emit(room, signal, 'flagged', at)
+        repeat = self.rule(room, signal).repeat
+        if repeat:
+            self._schedule_flag(room, signal, track, at + repeat)
+
+    def _clear(self, room, signal, track, at):
+        kind = 'cancelled' if track.resume == PENDING else 'cleared'
+        self.wheel.cancel(track.timer)
+        track.__init__()
+        self._emit(room, signal, kind, at)
+
+    def _emit(self, room, signal, kind, at):
+        self._events.append(OccupancyEvent(room, signal, kind, at))
+
+    def _notify(self, events):
+        # Outside the lock, so a slow handler never holds up other rooms
+        if self.on_event:
+            for event in events:
+                self.on_event(event)
+        return events
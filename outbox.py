@@ -0,0 +1,248 @@
+import collections
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+from metrics import METRICS, stage
+
+
+OutboxEvent = collections.namedtuple(
+    'OutboxEvent', ['id', 'event_id', 'kind', 'payload', 'created_at', 'attempts'])
+
+
+# --- Durable outbox ---
+# Events are committed to a local SQLite WAL database before anything is sent,
+# so a flag survives backend outages and process restarts. Each event carries
+# an event_id that receivers use as an idempotency key. Events that keep
+# failing are moved to the `dead` table, where they stay for inspection.
+class Outbox:
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS outbox_due ON outbox (next_attempt_at)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS dead (
+                id INTEGER PRIMARY KEY,
+                event_id TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                attempts INTEGER NOT NULL,
+                died_at REAL NOT NULL,
+                last_error TEXT
+            )
+        """)
+
+    def put(self, kind, payload):
+        event_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO outbox (event_id, kind, payload, created_at, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (event_id, kind, json.dumps(payload), now, now))
+        self._wakeup.set()
+        return event_id
+
+    def due(self, limit, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, event_id, kind, payload, created_at, attempts FROM outbox "
+                "WHERE next_attempt_at <= ? ORDER BY id LIMIT ?", (now, limit)).fetchall()
+        return [OutboxEvent(r[0], r[1], r[2], json.loads(r[3]), r[4], r[5]) for r in rows]
+
+    def next_due_at(self):
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(next_attempt_at) FROM outbox").fetchone()
+        return row[0]
+
+    def ack(self, ids):
+        if not ids:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+            self._conn.execute("COMMIT")
+
+    def retry_later(self, failures):
+        # failures: iterable of (id, next_attempt_at, error)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? "
+                "WHERE id = ?",
+                [(at, str(error)[:500], i) for i, at, error in failures])
+            self._conn.execute("COMMIT")
+
+    def defer(self, deferrals):
+        # deferrals: iterable of (id, next_attempt_at); not counted as attempts
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE outbox SET next_attempt_at = ? WHERE id = ?",
+                [(at, i) for i, at in deferrals])
+            self._conn.execute("COMMIT")
+
+    def bury(self, failures):
+        # failures: iterable of (id, error); moves the events to `dead`
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            for i, error in failures:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO dead "
+                    "(id, event_id, kind, payload, created_at, attempts, died_at, last_error) "
+                    "SELECT id, event_id, kind, payload, created_at, attempts + 1, ?, ? "
+                    "FROM outbox WHERE id = ?", (now, str(error)[:500], i))
+                self._conn.execute("DELETE FROM outbox WHERE id = ?", (i,))
+            self._conn.execute("COMMIT")
+
+    def dead_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM dead").fetchone()[0]
+
+    def pending(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def register_metrics(self, **labels):
+        METRICS.gauge('queue_depth', self.pending, "Queued work items", queue='outbox', **labels)
+
+    def wait(self, timeout):
+        self._wakeup.wait(timeout)
+        self._wakeup.clear()
+
+    def notify(self):
+        self._wakeup.set()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# One delivery is a flag POST (test.py, supervisor) or DB write (app.py)
+DELIVERY_SECONDS = stage('flag_delivery')
+
+
+class PermanentError(Exception):
+    # Raised by a handler for an event that can never be delivered, e.g. a
+    # payload the receiver rejects; the event is buried instead of retried
+    pass
+
+
+def is_permanent(error):
+    # Failures that will repeat on every retry: PermanentError and 4xx answers
+    # (requests.HTTPError carries the response), except timeout/rate-limit
+    # ones. Timeouts, refused connections, 5xx and an open circuit are not.
+    if isinstance(error, PermanentError):
+        return True
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status is not None and 400 <= status < 500 and status not in (408, 429)
+
+
+# --- Background sender ---
+# handlers maps an event kind to a callable(event) that raises on failure.
+# Delivered events are deleted in one transaction per batch. Transient
+# failures are retried for as long as it takes, with exponential backoff
+# capped at max_delay and jitter, so no flag is lost to an outage however
+# long; only permanent ones (see is_permanent, or no handler for the kind)
+# are moved to `dead`. Events skipped because their receiver just failed are
+# pushed back without using up an attempt.
+class OutboxSender(threading.Thread):
+    def __init__(self, outbox, handlers, batch_size=20, base_delay=1.0,
+                 max_delay=300.0, poll_interval=30.0):
+        super().__init__(daemon=True)
+        self.outbox = outbox
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+
+    def backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * (2 ** min(attempts, 32)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            events = self.outbox.due(self.batch_size)
+            if not events:
+                next_due = self.outbox.next_due_at()
+                timeout = self.poll_interval
+                if next_due is not None:
+                    timeout = max(0.0, min(timeout, next_due - time.time()))
+                self.outbox.wait(timeout)
+                continue
+            self.send_batch(events)
+
+    def send_batch(self, events):
+        delivered = []
+        failures = []
+        deferred = []
+        dead = []
+        failed_kinds = set()
+        for event in events:
+            if self._stop_event.is_set():
+                break
+            if event.kind in failed_kinds:
+                # The receiver for this kind just failed; don't hammer it again
+                deferred.append((event.id, time.time() + self.backoff(event.attempts)))
+                continue
+            handler = self.handlers.get(event.kind)
+            try:
+                if handler is None:
+                    raise PermanentError(f"no handler for outbox event kind {event.kind!r}")
+                with DELIVERY_SECONDS.time():
+                    handler(event)
+                delivered.append(event.id)
+                METRICS.counter('outbox_delivered_total', "Outbox events delivered", kind=event.kind).inc()
+            except Exception as e:
+                METRICS.counter('outbox_failures_total', "Failed outbox deliveries", kind=event.kind).inc()
+                print(f"[OUTBOX] {event.kind} {event.event_id} failed (attempt {event.attempts + 1}): {e}")
+                if is_permanent(e):
+                    # The receiver answered; it will answer the same next time
+                    print(f"[OUTBOX] Giving up on {event.kind} {event.event_id}")
+                    METRICS.counter('outbox_dead_total', "Outbox events given up on", kind=event.kind).inc()
+                    dead.append((event.id, e))
+                else:
+                    failed_kinds.add(event.kind)
+                    failures.append((event.id, time.time() + self.backoff(event.attempts), e))
+        self.outbox.ack(delivered)
+        if failures:
+            self.outbox.retry_later(failures)
+        if deferred:
+            self.outbox.defer(deferred)
+        if dead:
+            self.outbox.bury(dead)
+        return len(delivered)
+
+    def stop(self, timeout=5.0):
+        self._stop_event.set()
+        self.outbox.notify()
+        if self.is_alive():
+            self.join(timeout)
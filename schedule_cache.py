@@ -0,0 +1,176 @@
+import bisect
+import collections
+import datetime
+import threading
+import time
+
+from metrics import stage
+
+
+ScheduleEntry = collections.namedtuple('ScheduleEntry', ['start', 'end', 'status', 'schedule_id'])
+
+
+def get_day_number(when=None):
+    when = when or datetime.datetime.now()
+    return (when.weekday() + 1) % 7 or 7
+
+
+def to_seconds(value):
+    # Seconds since midnight from a MySQL TIME (timedelta), datetime.time or "HH:MM:SS"
+    if isinstance(value, datetime.timedelta):
+        return int(value.total_seconds())
+    if isinstance(value, (datetime.time, datetime.datetime)):
+        return value.hour * 3600 + value.minute * 60 + value.second
+    parts = [int(float(p)) for p in str(value).split(':')]
+    parts += [0] * (3 - len(parts))
+    return parts[0] * 3600 + parts[1] * 60 + parts[2]
+
+
+# --- Interval index ---
+# Entries sorted by start time plus a running maximum of end times, so a
+# lookup is one bisect and only walks back over intervals that can still
+# contain t (none, for a room whose schedules do not overlap).
+class ScheduleIndex:
+    def __init__(self, entries):
+        self.entries = sorted(entries, key=lambda e: (e.start, e.end))
+        self._starts = [e.start for e in self.entries]
+        self._max_end = []
+        max_end = -1
+        for e in self.entries:
+            max_end = max(max_end, e.end)
+            self._max_end.append(max_end)
+
+    def lookup(self, seconds):
+        i = bisect.bisect_right(self._starts, seconds) - 1
+        while i >= 0 and self._max_end[i] >= seconds:
+            entry = self.entries[i]
+            if entry.end >= seconds:
+                return entry
+            i -= 1
+        return None
+
+    def __len__(self):
+        return len(self.entries)
+
+
+SCHEDULE_LOOKUP_SECONDS = stage('schedule_lookup')
+
+# status() when today's schedule could not be loaded and no fallback answered;
+# callers must not flag a room on it
+UNKNOWN = 'Unknown'
+
+
+# --- Schedule cache ---
+# loader(room_id, schedule_day) returns rows of
+# (schedule_id, schedule_time, end_time, status) for that room and day.
+# With an executor, expired entries keep answering while a reload runs in the
+# background, so lookups only wait on the loader when there is nothing for
+# the day yet (the first lookup, or the first after midnight).
+# fallback(room_id, when), if given, answers status() directly while no
+# schedule is loaded for the day (e.g. a backend without the per-day
+# endpoint). Its answer, or its failure, is reused for retry_delay seconds,
+# the same pace at which the loader is retried.
+class ScheduleCache:
+    def __init__(self, loader, ttl=300, retry_delay=30, executor=None, fallback=None):
+        self.loader = loader
+        self.ttl = ttl
+        self.retry_delay = retry_delay
+        self.executor = executor
+        self.fallback = fallback
+        self._lock = threading.Lock()
+        self._rooms = {}  # room_id -> (schedule_day, index, expires_at)
+        self._generations = {}  # room_id -> bumped on every invalidate()
+        self._refreshing = set()
+        self._fallbacks = {}  # room_id -> (when, status, expires_at)
+
+    def lookup(self, room_id, when=None):
+        when = when or datetime.datetime.now()
+        index = self._index_for(room_id, get_day_number(when))
+        if index is None:
+            return None
+        return index.lookup(to_seconds(when))
+
+    def status(self, room_id, when=None):
+        # The status at `when`, None if no schedule covers it, UNKNOWN if
+        # today's schedule is not known
+        when = when or datetime.datetime.now()
+        with SCHEDULE_LOOKUP_SECONDS.time():
+            index = self._index_for(room_id, get_day_number(when))
+            if index is not None:
+                entry = index.lookup(to_seconds(when))
+                return entry.status if entry else None
+        if self.fallback is None:
+            return UNKNOWN
+        return self._fallback_status(room_id, when)
+
+    def invalidate(self, room_id=None):
+        with self._lock:
+            rooms = list(self._rooms) if room_id is None else [room_id]
+            for room in rooms:
+                self._generations[room] = self._generations.get(room, 0) + 1
+                cached = self._rooms.get(room)
+                if cached:
+                    self._rooms[room] = (cached[0], cached[1], 0)
+                self._fallbacks.pop(room, None)
+
+    def _fallback_status(self, room_id, when):
+        with self._lock:
+            cached = self._fallbacks.get(room_id)
+        if (cached and time.monotonic() < cached[2]
+                and abs((when - cached[0]).total_seconds()) < self.retry_delay):
+            return cached[1]
+        try:
+            status = self.fallback(room_id, when)
+        except Exception as e:
+            print("Schedule fallback error:", e)
+            status = UNKNOWN
+        with self._lock:
+            self._fallbacks[room_id] = (when, status, time.monotonic() + self.retry_delay)
+        return status
+
+    def _index_for(self, room_id, day):
+        with self._lock:
+            cached = self._rooms.get(room_id)
+            current = cached[1] if cached and cached[0] == day else None
+            if cached and cached[0] == day and time.monotonic() < cached[2]:
+                return current
+            if self.executor is not None and current is not None:
+                if room_id not in self._refreshing:
+                    self._refreshing.add(room_id)
+                    self.executor.submit(self._refresh, room_id, day)
+                return current
+        return self._load(room_id, day)
+
+    def _refresh(self, room_id, day):
+        try:
+            self._load(room_id, day)
+        finally:
+            with self._lock:
+                self._refreshing.discard(room_id)
+
+    def _load(self, room_id, day):
+        with self._lock:
+            generation = self._generations.get(room_id, 0)
+        try:
+            rows = self.loader(room_id, day)
+            # Rows without an end_time (e.g. temporary flagged inserts) cannot match a time
+            index = ScheduleIndex(
+                ScheduleEntry(to_seconds(start), to_seconds(end), status, schedule_id)
+                for schedule_id, start, end, status in rows
+                if start is not None and end is not None)
+            expires_at = time.monotonic() + self.ttl
+        except Exception as e:
+            print("Schedule load error:", e)
+            index = None
+            expires_at = time.monotonic() + self.retry_delay
+
+        with self._lock:
+            cached = self._rooms.get(room_id)
+            if index is None:
+                # Keep answering from the last good index for the same day
+                index = cached[1] if cached and cached[0] == day else None
+            elif self._generations.get(room_id, 0) != generation:
+                # Invalidated while loading; this result may predate the change
+                expires_at = 0
+            self._rooms[room_id] = (day, index, expires_at)
+            return index
@@ -0,0 +1,365 @@
+import argparse
+import multiprocessing as mp
+import os
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+from flask import Flask, Response
+
+from detectors import create_detector
+from mjpeg import mjpeg_part
+
+
+def _pid_alive(pid):
+    # Anything that is not a plausible pid (an unknown layout) counts as gone
+    if pid <= 0 or pid > 2 ** 22:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # alive, another user's
+    return True
+
+
+# --- Shared-memory ring ---
+# A fixed number of preallocated slots in one shared memory segment, laid out
+# as NumPy arrays. A slot's sequence number is set to -1 while it is being
+# written and to the frame's sequence number once it is complete, so readers
+# take a view of the newest slot by index (no pickling, no copy) and check
+# afterwards that the writer has not lapped them.
+#
+# The header also holds the creator's pid. Creating a ring whose name is
+# already taken replaces the old segment only if that pid is gone (a run
+# killed before stop()); a live owner is a second pipeline started under the
+# same name, and raises FileExistsError.
+class SharedRing:
+    def __init__(self, name, slots, shape, dtype=np.uint8, create=False):
+        self.name = name
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        meta_bytes = 16 + 8 * 3 * slots  # owner pid, latest seq + per-slot seq, time, length
+        payload_bytes = int(np.prod(self.shape)) * self.dtype.itemsize * slots
+
+        if create:
+            size = meta_bytes + payload_bytes
+            try:
+                self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                self._replace_stale(name)
+                self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            # Spawned children share the parent's resource tracker, so the
+            # segment stays registered once and is unlinked by the creator.
+            self._shm = shared_memory.SharedMemory(name=name)
+
+        buf = self._shm.buf
+        self.owner = np.ndarray((1,), np.int64, buf, 0)
+        self.latest = np.ndarray((1,), np.int64, buf, 8)
+        self.slot_seq = np.ndarray((slots,), np.int64, buf, 16)
+        self.slot_time = np.ndarray((slots,), np.float64, buf, 16 + 8 * slots)
+        self.slot_len = np.ndarray((slots,), np.int64, buf, 16 + 16 * slots)
+        self.payload = np.ndarray((slots,) + self.shape, self.dtype, buf, meta_bytes)
+        if create:
+            self.owner[0] = os.getpid()
+            self.latest[0] = 0
+            self.slot_seq[:] = -1
+            self.slot_len[:] = 0
+
+    @staticmethod
+    def _replace_stale(name):
+        stale = shared_memory.SharedMemory(name=name)
+        try:
+            owner = int(np.frombuffer(bytes(stale.buf[:8]), np.int64)[0]) if stale.size >= 8 else 0
+        finally:
+            stale.close()
+        if _pid_alive(owner):
+            raise FileExistsError(
+                f"shared memory segment {name} belongs to running process {owner}; "
+                f"stop it or pick another name")
+        print(f"[SHM] Removing stale shared memory segment {name} (owner {owner or 'unknown'} is gone)")
+        stale.unlink()
+
+    def spec(self):
+        return {'name': self.name, 'slots': self.slots, 'shape': self.shape, 'dtype': self.dtype.str}
+
+    @classmethod
+    def attach(cls, spec):
+        return cls(spec['name'], spec['slots'], spec['shape'], spec['dtype'])
+
+    # --- Writer side (one writer per ring) ---
+    def begin_write(self):
+        seq = int(self.latest[0]) + 1
+        slot = seq % self.slots
+        self.slot_seq[slot] = -1
+        return seq, self.payload[slot]
+
+    def commit(self, seq, length=0):
+        slot = seq % self.slots
+        self.slot_time[slot] = time.time()
+        self.slot_len[slot] = length
+        self.slot_seq[slot] = seq
+        self.latest[0] = seq
+
+    # --- Reader side ---
+    def newest(self):
+        return int(self.latest[0])
+
+    def read(self, seq):
+        # View of slot `seq`, or None if it was overwritten or is being written
+        slot = seq % self.slots
+        if seq <= 0 or self.slot_seq[slot] != seq:
+            return None
+        return self.payload[slot]
+
+    def length(self, seq):
+        return int(self.slot_len[seq % self.slots])
+
+    def valid(self, seq):
+        return self.slot_seq[seq % self.slots] == seq
+
+    def close(self):
+        self.owner = self.latest = self.slot_seq = self.slot_time = self.slot_len = self.payload = None
+        self._shm.close()
+
+    def unlink(self):
+        self._shm.unlink()
+
+
+def wait_newer(ring, cond, seq, timeout=1.0):
+    with cond:
+        cond.wait_for(lambda: ring.newest() > seq, timeout)
+    return ring.newest()
+
+
+def publish(ring, cond, seq, length=0):
+    ring.commit(seq, length)
+    with cond:
+        cond.notify_all()
+
+
+MAX_BOXES = 32
+
+
+# --- Pipeline processes ---
+def capture_process(frames_spec, frames_cond, source, api, stop):
+    frames = SharedRing.attach(frames_spec)
+    height, width = frames.shape[:2]
+    camera = cv2.VideoCapture(source, api) if api is not None else cv2.VideoCapture(source)
+    camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    try:
+        while not stop.is_set():
+            seq, slot = frames.begin_write()
+            # read() decodes straight into the shared slot when the size matches
+            ok, frame = camera.read(slot)
+            if not ok:
+                print("Failed to grab frame")
+                stop.wait(0.1)
+                continue
+            if frame.shape != slot.shape:
+                cv2.resize(frame, (width, height), dst=slot)
+            elif not np.shares_memory(frame, slot):
+                np.copyto(slot, frame)
+            publish(frames, frames_cond, seq)
+    finally:
+        camera.release()
+        frames.close()
+
+
+def detection_process(frames_spec, frames_cond, boxes_spec, boxes_cond, detector_config,
+                      size, interval, stop):
+    frames = SharedRing.attach(frames_spec)
+    boxes = SharedRing.attach(boxes_spec)
+    detector = create_detector(detector_config, size)
+    seq = 0
+    try:
+        while not stop.is_set():
+            started = time.monotonic()
+            newest = wait_newer(frames, frames_cond, seq)
+            frame = frames.read(newest)
+            if frame is None or newest == seq:
+                continue
+            seq = newest
+            image = cv2.resize(frame, size)
+            if not frames.valid(seq):
+                continue  # lapped by the capture process while resizing
+            rects, weights = detector.detect(image)
+
+            out_seq, out = boxes.begin_write()
+            count = min(len(rects), MAX_BOXES)
+            for i in range(count):
+                x, y, w, h = rects[i]
+                out[i] = (x, y, w, h, int(weights[i] * 1000))
+            publish(boxes, boxes_cond, out_seq, count)
+
+            remaining = interval - (time.monotonic() - started)
+            if remaining > 0:
+                stop.wait(remaining)
+    finally:
+        frames.close()
+        boxes.close()
+
+
+def encode_process(frames_spec, frames_cond, boxes_spec, jpeg_spec, jpeg_cond, size, quality,
+                   viewers, stop):
+    frames = SharedRing.attach(frames_spec)
+    boxes = SharedRing.attach(boxes_spec)
+    jpegs = SharedRing.attach(jpeg_spec)
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+    seq = 0
+    try:
+        while not stop.is_set():
+            if viewers.value == 0:
+                # Nobody is watching: don't encode at all
+                stop.wait(0.1)
+                continue
+            newest = wait_newer(frames, frames_cond, seq)
+            frame = frames.read(newest)
+            if frame is None or newest == seq:
+                continue
+            seq = newest
+            image = cv2.resize(frame, size)
+            if not frames.valid(seq):
+                continue
+
+            box_seq = boxes.newest()
+            found = boxes.read(box_seq)
+            if found is not None:
+                for x, y, w, h, _ in found[:boxes.length(box_seq)]:
+                    cv2.rectangle(image, (int(x), int(y)), (int(x + w), int(y + h)), (0, 255, 0), 2)
+
+            ok, buffer = cv2.imencode('.jpg', image, params)
+            if not ok:
+                continue
+            data = buffer.reshape(-1)
+            out_seq, out = jpegs.begin_write()
+            if data.size > out.size:
+                print(f"JPEG of {data.size} bytes does not fit a {out.size} byte slot")
+                continue
+            out[:data.size] = data
+            publish(jpegs, jpeg_cond, out_seq, data.size)
+    finally:
+        frames.close()
+        boxes.close()
+        jpegs.close()
+
+
+# --- Pipeline ---
+class Pipeline:
+    def __init__(self, source, api=None, capture_size=(640, 480), size=(320, 240),
+                 detector_config=None, interval=1.0, quality=70, slots=16, name='monitoring'):
+        ctx = mp.get_context('spawn')
+        width, height = capture_size
+        self.frames = SharedRing(f"{name}_frames", slots, (height, width, 3), create=True)
+        self.boxes = SharedRing(f"{name}_boxes", 4, (MAX_BOXES, 5), np.int32, create=True)
+        self.jpegs = SharedRing(f"{name}_jpegs", 4, (width * height,), create=True)
+        self.frames_cond = ctx.Condition()
+        self.boxes_cond = ctx.Condition()
+        self.jpeg_cond = ctx.Condition()
+        self.stop_event = ctx.Event()
+        self.viewers = ctx.Value('i', 0)
+        size = tuple(size)
+        self.processes = [
+            ctx.Process(target=capture_process, name='capture', daemon=True, args=(
+                self.frames.spec(), self.frames_cond, source, api, self.stop_event)),
+            ctx.Process(target=detection_process, name='detect', daemon=True, args=(
+                self.frames.spec(), self.frames_cond, self.boxes.spec(), self.boxes_cond,
+                detector_config, size, interval, self.stop_event)),
+            ctx.Process(target=encode_process, name='encode', daemon=True, args=(
+                self.frames.spec(), self.frames_cond, self.boxes.spec(), self.jpegs.spec(),
+                self.jpeg_cond, size, quality, self.viewers, self.stop_event)),
+        ]
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def stop(self):
+        self.stop_event.set()
+        for cond in (self.frames_cond, self.boxes_cond, self.jpeg_cond):
+            with cond:
+                cond.notify_all()
+        for process in self.processes:
+            process.join(2.0)
+            if process.is_alive():
+                process.terminate()
+        for ring in (self.frames, self.boxes, self.jpegs):
+            ring.close()
+            ring.unlink()
+
+    def latest_boxes(self):
+        seq = self.boxes.newest()
+        found = self.boxes.read(seq)
+        if found is None:
+            return []
+        rects = [tuple(int(v) for v in row[:4]) for row in found[:self.boxes.length(seq)]]
+        return rects if self.boxes.valid(seq) else []
+
+    def gen_frames(self):
+        with self.viewers.get_lock():
+            self.viewers.value += 1
+        try:
+            seq = 0
+            while not self.stop_event.is_set():
+                newest = wait_newer(self.jpegs, self.jpeg_cond, seq)
+                data = self.jpegs.read(newest)
+                if data is None or newest == seq:
+                    continue
+                seq = newest
+                frame_bytes = data[:self.jpegs.length(seq)].tobytes()
+                if not self.jpegs.valid(seq):
+                    continue
+                yield mjpeg_part(frame_bytes)
+        finally:
+            with self.viewers.get_lock():
+                self.viewers.value -= 1
+
+
+def create_app(pipeline):
+    app = Flask(__name__)
+
+    @app.route('/video_feed')
+    def video_feed():
+        return Response(pipeline.gen_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+    @app.route('/')
+    def index():
+        return """
+        <html>
+            <body>
+                <h1>Live Camera</h1>
+                <img src="/video_feed" />
+            </body>
+        </html>
+        """
+
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Capture, detection and encoding in separate processes")
+    parser.add_argument('--source', default='0', help="device index, URL or file")
+    parser.add_argument('--v4l2', action='store_true', help="open the device with CAP_V4L2")
+    parser.add_argument('--capture-size', default='640x480')
+    parser.add_argument('--size', default='320x240', help="analysis and stream size")
+    parser.add_argument('--interval', type=float, default=1.0, help="seconds between detections")
+    parser.add_argument('--quality', type=int, default=70)
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    pipeline = Pipeline(
+        source, cv2.CAP_V4L2 if args.v4l2 else None,
+        capture_size=tuple(int(v) for v in args.capture_size.split('x')),
+        size=tuple(int(v) for v in args.size.split('x')),
+        interval=args.interval, quality=args.quality)
+    pipeline.start()
+    try:
+        create_app(pipeline).run(host='0.0.0.0', port=args.port, threaded=True)
+    finally:
+        pipeline.stop()
@@ -0,0 +1,422 @@
+import argparse
+import atexit
+import datetime
+import functools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+from flask import Flask, Response, abort, request
+
+from frame_hub import FrameHub, CaptureThread, open_camera, as_image
+from luma import luma_view, brightness as luma_brightness
+from detection import Detection, EMPTY_DETECTION, MotionGatedDetector
+from detectors import create_detector
+from tracking import IouTracker
+from schedule_cache import ScheduleCache, UNKNOWN
+from outbox import Outbox, OutboxSender
+from backend_client import BackendClient
+from mjpeg import MjpegBroadcaster
+from occupancy import OccupancyEngine, SignalRule
+from clips import ClipIndex, ClipRecorder
+from telemetry import TelemetryStore
+from events import StateChannel
+from metrics import METRICS, register_routes, stage
+
+
+# --- Multi-room supervisor ---
+# One capture thread per room; detection for every room shares one bounded
+# worker pool sized to the core count. Each room keeps at most one detection
+# job in flight, so a slow room can never queue up work for the others.
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+CAPTURE_APIS = {
+    'any': None,
+    'v4l2': cv2.CAP_V4L2,
+    'ffmpeg': cv2.CAP_FFMPEG,
+    'gstreamer': cv2.CAP_GSTREAMER,
+}
+
+ROOM_DEFAULTS = {
+    'api': 'v4l2',
+    'width': None,
+    'height': None,
+    'mjpeg': False,
+    'decode_reduce': 1,
+    'analysis_size': [320, 240],
+    'light_threshold': 110,
+    'light_hysteresis': 10,  # light counts as off only below threshold - hysteresis
+    'motion_area': 500,
+    'flag_after': {'Human': 0, 'Motion': 60, 'Light': 60},
+}
+
+BRIGHTNESS_SECONDS = stage('brightness')
+
+def measure_brightness(frame, step=2, patch=10):
+    # Mean of the brightest patch x patch block of a luma grid of the frame
+    with BRIGHTNESS_SECONDS.time():
+        return luma_brightness(luma_view(frame, step), patch).peak
+
+
+class RoomPipeline:
+    def __init__(self, config, supervisor):
+        self.config = dict(ROOM_DEFAULTS, **config)
+        self.config['flag_after'] = dict(ROOM_DEFAULTS['flag_after'], **config.get('flag_after', {}))
+        self.code = self.config['code']
+        self.supervisor = supervisor
+        self.room_id = self.config.get('room_id')
+        self._room_id_future = None
+
+        self.hub = FrameHub()
+        open_capture = functools.partial(open_camera, self.config['source'],
+                                         CAPTURE_APIS[self.config['api']],
+                                         self.config['width'], self.config['height'],
+                                         fourcc='MJPG' if self.config['mjpeg'] else None)
+        camera = open_capture()
+        if not camera.isOpened():
+            print(f"[{self.code}] Error: Camera failed to open.")
+        # Reopened with backoff when it drops or stalls; the room's stream and
+        # occupancy logic resume with the first new frame
+        self.capture = CaptureThread(camera, self.hub, reopen=open_capture,
+                                     on_health=self.camera_health)
+        # Evidence clip around every flag raised for this room
+        self.recorder = ClipRecorder(self.hub, supervisor.clip_index, os.path.join(DATA_DIR, 'clips'))
+        self.broadcaster = MjpegBroadcaster(self.hub, render=self.render, quality=70,
+                                            passthrough=lambda: len(self.detection.rects) == 0)
+
+        self.size = tuple(self.config['analysis_size'])
+        self.detector = MotionGatedDetector(supervisor.detector, size=self.size,
+                                            min_area=self.config['motion_area'])
+        # NMS and stable ids across this room's detections (no optical flow
+        # in between: rooms are only analysed every detection_interval)
+        self.tracker = IouTracker()
+        # Each signal flags once it has been active for its flag_after seconds
+        # and re-arms when it goes inactive
+        supervisor.occupancy.set_rules(self.code, {
+            'Human': SignalRule(self.config['flag_after']['Human']),
+            'Motion': SignalRule(self.config['flag_after']['Motion'], on=self.config['motion_area']),
+            'Light': SignalRule(self.config['flag_after']['Light'], on=self.config['light_threshold'],
+                                off=self.config['light_threshold'] - self.config['light_hysteresis']),
+        })
+
+        # Read on every /metrics scrape
+        for component in (self.broadcaster, self.capture, self.recorder):
+            component.register_metrics(room=self.code)
+        METRICS.gauge('detection_age_seconds', lambda: time.time() - self.detection.timestamp,
+                      "Age of the newest detection result", room=self.code)
+
+        self.detection = EMPTY_DETECTION
+        self.state = {'human': False, 'motion': False, 'light': False, 'status': None,
+                      'camera': 'ok', 'people': []}
+        self.flagged_at = None
+        self.last_seq = 0
+        self.last_run = 0.0
+        self.busy = False
+
+    def start(self):
+        self.capture.start()
+        self.recorder.start()
+
+    def stop(self):
+        self.capture.stop()
+        self.recorder.stop()
+
+    def camera_health(self, health):
+        print(f"[{self.code}] Camera {health.state}" + (f": {health.error}" if health.error else ""))
+        self.state = dict(self.state, camera=health.state)
+        self.supervisor.state_channel.publish(self.code, flagged_at=self.flagged_at, **self.state)
+
+    def resolve_room_id(self):
+        if self.room_id is not None:
+            return
+        if self._room_id_future is not None and not self._room_id_future.done():
+            return
+        backend = self.supervisor.backend
+        self._room_id_future = backend.submit(backend.get_room_id, self.code)
+        self._room_id_future.add_done_callback(self._set_room_id)
+
+    def _set_room_id(self, future):
+        try:
+            self.room_id = future.result()
+            print(f"[{self.code}] Room ID:", self.room_id)
+        except Exception as e:
+            print(f"[{self.code}] Error getting room_id:", e)
+
+    def analyse(self, seq, frame):
+        try:
+            frame = as_image(frame, self.config['decode_reduce'])
+            rects, weights = self.detector(frame)
+            self.update(seq, frame, rects, weights)
+        except Exception as e:
+            print(f"[{self.code}] Analysis error:", e)
+        finally:
+            self.busy = False
+
+    def update(self, seq, frame, rects, weights):
+        tracks = self.tracker.update(rects, weights, time.monotonic())
+        rects, weights = [t.rect for t in tracks], [t.weight for t in tracks]
+        self.detection = Detection(seq, time.time(), rects, weights)
+
+        # Luma grid of about half the analysis size, straight from the frame;
+        # the patch stays 20x20 analysis-size pixels
+        scale = frame.shape[1] / self.size[0]
+        step = max(1, int(2 * scale))
+        brightness = measure_brightness(frame, step, max(1, round(20 * scale / step)))
+        self.resolve_room_id()
+        status = UNKNOWN
+        if self.room_id is not None:
+            status = self.supervisor.schedule_cache.status(self.room_id)
+
+        occupancy = self.supervisor.occupancy
+        # Never flag a room whose schedule is unknown
+        if status in ("Occupied", UNKNOWN):
+            occupancy.reset(self.code)
+            events = []
+        else:
+            events = occupancy.observe_all(self.code, {
+                'Human': len(rects) > 0,
+                'Motion': self.detector.motion_area,
+                'Light': brightness,
+            })
+        self.supervisor.telemetry.record(self.code, brightness=brightness,
+                                         motion_area=self.detector.motion_area,
+                                         humans=len(rects), status=status)
+        self.state = {'human': len(rects) > 0,
+                      'motion': self.detector.motion_area > self.config['motion_area'],
+                      'light': brightness > self.config['light_threshold'],
+                      'status': status,
+                      'camera': self.capture.health().state,
+                      'people': sorted(t.id for t in tracks)}
+
+        for event in events:
+            if event.kind == 'flagged':
+                print(f"[{self.code}] [ALERT] {event.signal}. Flagging schedule...")
+                self.supervisor.flag(self, event.signal)
+                self.flagged_at = int(time.time())
+        self.supervisor.state_channel.publish(self.code, flagged_at=self.flagged_at, **self.state)
+
+    def render(self, frame):
+        frame = cv2.resize(frame, self.size)
+        for (x, y, w, h) in self.detection.rects:
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        return frame
+
+    def gen_frames(self):
+        return self.broadcaster.gen_frames()
+
+
+class Supervisor:
+    def __init__(self, config):
+        self.config = config
+        self.interval = config.get('detection_interval', 1.0)
+        self.detector = create_detector(*self._detector_config(config))
+        self.backend = BackendClient(config['backend_url'])
+        # One engine and timer wheel for every room's countdowns
+        self.occupancy = OccupancyEngine()
+        self.schedule_cache = ScheduleCache(self.backend.get_schedule,
+                                            ttl=config.get('schedule_ttl', 300),
+                                            executor=self.backend.executor,
+                                            fallback=self.backend.check_schedule)
+        self.outbox = Outbox(os.path.join(DATA_DIR, 'supervisor_outbox.db'))
+        self.outbox_sender = OutboxSender(self.outbox, {'flag_schedule': self.deliver_flag})
+        self.clip_index = ClipIndex(os.path.join(DATA_DIR, 'clips', 'index.db'))
+        self.telemetry = TelemetryStore(os.path.join(DATA_DIR, 'telemetry'))
+        self.state_channel = StateChannel()
+        self.pool = ThreadPoolExecutor(max_workers=config.get('workers') or os.cpu_count() or 1,
+                                       thread_name_prefix='detect')
+        self.rooms = {}
+        for room_config in config['rooms']:
+            room = RoomPipeline(room_config, self)
+            self.rooms[room.code] = room
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self.dispatch_loop, daemon=True)
+        self.outbox.register_metrics()
+        self.state_channel.register_metrics()
+        METRICS.gauge('queue_depth', lambda: sum(room.busy for room in self.rooms.values()), queue='detection')
+
+    @staticmethod
+    def _detector_config(config):
+        # (detector config, analysis size) for create_detector(). The one
+        # detector is shared, so tuned settings apply only if every room is
+        # analysed at the size they were tuned for.
+        detector = config.get('detector')
+        sizes = {tuple(room.get('analysis_size', ROOM_DEFAULTS['analysis_size']))
+                 for room in config['rooms']}
+        if len(sizes) == 1:
+            return detector, sizes.pop()
+        if detector and detector.get('tuned'):
+            print("[SUPERVISOR] Rooms use different analysis sizes; ignoring the tuned detector settings")
+            detector = {k: v for k, v in detector.items() if k != 'tuned'}
+        return detector, None
+
+    def start(self):
+        for room in self.rooms.values():
+            room.start()
+        self.outbox_sender.start()
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self.state_channel.close()
+        for room in self.rooms.values():
+            room.stop()
+        self.pool.shutdown(wait=False)
+        self.outbox_sender.stop()
+        self.clip_index.close()
+        self.telemetry.close()
+        self.backend.close()
+
+    def dispatch_loop(self):
+        # Hands each room's newest frame to the pool once its interval has
+        # passed and its previous job has finished. With a batching backend
+        # all ready rooms go to one job and share a single forward pass.
+        while not self._stop_event.wait(0.05):
+            now = time.monotonic()
+            ready = []
+            for room in self.rooms.values():
+                if room.busy or now - room.last_run < self.interval:
+                    continue
+                seq, frame = room.hub.latest()
+                if frame is None or seq == room.last_seq:
+                    continue
+                room.busy = True
+                room.last_seq = seq
+                room.last_run = now
+                ready.append((room, seq, frame))
+
+            if not ready:
+                continue
+            if self.detector.batching:
+                self.pool.submit(self.analyse_batch, ready)
+            else:
+                for room, seq, frame in ready:
+                    self.pool.submit(room.analyse, seq, frame)
+
+    def analyse_batch(self, ready):
+        # A failing room is reported and skipped; the others still run
+        try:
+            plans = []
+            for room, seq, frame in ready:
+                try:
+                    frame = as_image(frame, room.config['decode_reduce'])
+                    plans.append((room, seq, frame) + room.detector.prepare(frame))
+                except Exception as e:
+                    print(f"[{room.code}] Analysis error:", e)
+            # Whole-image backends ignore motion ROIs: any room with motion (or
+            # due a refresh) joins the batch, static rooms keep their boxes.
+            batch = [plan for plan in plans if plan[4] is not None]
+            if batch:
+                try:
+                    results = self.detector.detect_batch([image for _, _, _, image, _ in batch])
+                    for (room, _, _, _, _), (rects, weights) in zip(batch, results):
+                        room.detector.finish(rects, weights, full=True)
+                except Exception as e:
+                    # Every room keeps its previous boxes for this round
+                    print("[SUPERVISOR] Batch detection error:", e)
+            for room, seq, frame, _, _ in plans:
+                try:
+                    room.update(seq, frame, room.detector.rects, room.detector.weights)
+                except Exception as e:
+                    print(f"[{room.code}] Analysis error:", e)
+        finally:
+            for room, _, _ in ready:
+                room.busy = False
+
+    def flag(self, room, detection):
+        room.recorder.trigger(room.code, detection)
+        self.outbox.put('flag_schedule', {
+            'room_id': room.room_id,
+            'room_code': room.code,
+            'detection': detection,
+            'detected_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+
+    def deliver_flag(self, event):
+        data = self.backend.flag_schedule(event.payload, event.event_id)
+        print(f"[{event.payload.get('room_code')}] Flagged schedule:", data.get('message'))
+        self.schedule_cache.invalidate(event.payload['room_id'])
+
+
+def create_app(supervisor):
+    app = Flask(__name__)
+    register_routes(app)
+
+    @app.route('/')
+    def index():
+        items = ''.join(
+            f'<li><h2>{code}</h2><img src="/rooms/{code}/video_feed" /></li>'
+            for code in supervisor.rooms)
+        return f"""
+        <html>
+            <body>
+                <h1>Room Monitoring</h1>
+                <ul>{items}</ul>
+            </body>
+        </html>
+        """
+
+    @app.route('/rooms/<code>/video_feed')
+    def video_feed(code):
+        room = supervisor.rooms.get(code)
+        if room is None:
+            abort(404)
+        return Response(room.gen_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+    @app.route('/rooms/<code>/status')
+    def status(code):
+        room = supervisor.rooms.get(code)
+        if room is None:
+            abort(404)
+        return dict(room.state, code=code, room_id=room.room_id,
+                    tracks=[track.as_dict() for track in room.tracker.visible()])
+
+    @app.route('/events')
+    def events():
+        # Every room, or one with ?room=<code>
+        room = request.args.get('room')
+        if room is not None and room not in supervisor.rooms:
+            abort(404)
+        return Response(supervisor.state_channel.stream(room, request.headers.get('Last-Event-ID')),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    @app.route('/rooms/<code>/utilization')
+    def utilization(code):
+        # ?since=&until= as UNIX timestamps; default is everything recorded
+        if code not in supervisor.rooms:
+            abort(404)
+        since = request.args.get('since', type=float)
+        until = request.args.get('until', type=float)
+        return dict(supervisor.telemetry.utilization(code, since, until), code=code)
+
+    @app.route('/rooms/<code>/clips')
+    def clips(code):
+        if code not in supervisor.rooms:
+            abort(404)
+        since = request.args.get('since', type=float)
+        until = request.args.get('until', type=float)
+        return {'clips': [record._asdict() for record in
+                          supervisor.clip_index.find(code, since, until)]}
+
+    return app
+
+
+def load_config(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Monitor several rooms from one process")
+    parser.add_argument('config', help="JSON room list, see rooms.example.json")
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+
+    supervisor = Supervisor(load_config(args.config))
+    atexit.register(supervisor.stop)
+    supervisor.start()
+    create_app(supervisor).run(host='0.0.0.0', port=args.port, threaded=True)
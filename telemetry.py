@@ -0,0 +1,326 @@
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+
+# --- Telemetry store ---
+# Per room, three append-only logs of fixed-width records, each a memory-mapped
+# NumPy structured array behind a small header:
+#   raw.bin     one record per observation
+#   minute.bin  one aggregate per minute that had observations
+#   hour.bin    one aggregate per hour
+# Appending writes one record into the mapping; rollups are folded in as
+# records arrive, so hour rows over months of data are a few thousand records
+# and a query only touches the pages of the time range it asks for (records
+# are in time order, so ranges are found with a binary search).
+#
+# Raw records are kept for raw_retention seconds (7 days by default, about
+# 12 MB per room at one record a second); older ones survive only in the
+# minute and hour rollups. Expired records are cut off about once a day, when
+# an hour closes, by rewriting raw.bin without them.
+
+STATUS_CODES = {None: 0, 'Available': 1, 'Using': 2, 'Occupied': 3, 'Flagged': 4, 'Unknown': 5}
+STATUS_OTHER = 255
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+OCCUPIED_STATUSES = (STATUS_CODES['Using'], STATUS_CODES['Occupied'])
+
+RAW_DTYPE = np.dtype([
+    ('t', '<f8'),
+    ('brightness', '<f4'),
+    ('motion_area', '<u4'),
+    ('humans', '<u2'),
+    ('status', 'u1'),
+    ('pad', 'u1'),
+])
+
+ROLLUP_DTYPE = np.dtype([
+    ('t', '<f8'),              # bucket start
+    ('samples', '<u4'),
+    ('human_samples', '<u4'),  # samples with at least one person
+    ('occupied_samples', '<u4'),  # samples while the schedule said Using/Occupied
+    ('motion_samples', '<u4'),  # samples with any motion
+    ('brightness_mean', '<f4'),
+    ('brightness_max', '<f4'),
+    ('motion_mean', '<f4'),
+    ('motion_max', '<u4'),
+    ('humans_max', '<u2'),
+    ('pad', '<u2'),
+])
+
+_MAGIC = b'TLOG0001'
+_HEADER = 16  # magic + record count
+
+
+class MappedLog:
+    # Append-only array of `dtype` records in a memory-mapped file; the file
+    # grows by doubling, and the record count in the header is written after
+    # the record, so a crash loses at most the record being appended.
+    def __init__(self, path, dtype, initial=4096):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(_MAGIC + np.int64(0).tobytes())
+                f.truncate(_HEADER + initial * self.dtype.itemsize)
+        self._map()
+        if bytes(self._header[:8]) != _MAGIC:
+            raise ValueError(f"{path} is not a telemetry log")
+
+    def _map(self):
+        size = os.path.getsize(self.path)
+        self.capacity = (size - _HEADER) // self.dtype.itemsize
+        self._header = np.memmap(self.path, np.uint8, 'r+', 0, _HEADER)
+        self._count = np.ndarray((1,), np.int64, self._header, 8)
+        self._records = np.memmap(self.path, self.dtype, 'r+', _HEADER, (self.capacity,))
+
+    def __len__(self):
+        return int(self._count[0])
+
+    @property
+    def records(self):
+        return self._records[:len(self)]
+
+    def append(self, record):
+        count = len(self)
+        if count == self.capacity:
+            self._grow()
+        self._records[count] = record
+        self._count[0] = count + 1
+
+    def _grow(self):
+        self.flush()
+        self._records = self._header = self._count = None
+        with open(self.path, 'r+b') as f:
+            f.truncate(_HEADER + 2 * self.capacity * self.dtype.itemsize)
+        self._map()
+
+    def last(self):
+        count = len(self)
+        return self._records[count - 1] if count else None
+
+    def range(self, start=None, end=None):
+        # View of the records with start <= t < end
+        records = self.records
+        times = records['t']
+        lo = 0 if start is None else int(np.searchsorted(times, start, 'left'))
+        hi = len(records) if end is None else int(np.searchsorted(times, end, 'left'))
+        return records[lo:hi]
+
+    def drop_before(self, t):
+        # Rewrites the log without the records older than t, into a new file
+        # swapped in with os.replace, so a crash leaves the old log or the new
+        # one and never a mix. Returns the number of records dropped.
+        records = self.records
+        drop = int(np.searchsorted(records['t'], t, 'left'))
+        if not drop:
+            return 0
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_MAGIC + np.int64(len(records) - drop).tobytes())
+            f.write(records[drop:].tobytes())
+            f.truncate(_HEADER + self.capacity * self.dtype.itemsize)
+            f.flush()
+            os.fsync(f.fileno())
+        records = None
+        self.flush()
+        self._records = self._header = self._count = None
+        os.replace(tmp, self.path)
+        self._map()
+        return drop
+
+    def flush(self):
+        if self._records is not None:
+            self._records.flush()
+            self._header.flush()
+
+
+class _Rollup:
+    # Running aggregate of one bucket
+    def __init__(self, period):
+        self.period = period
+        self.start = None
+        self.reset()
+
+    def reset(self):
+        self.samples = self.human_samples = self.occupied_samples = self.motion_samples = 0
+        self.brightness_sum = self.motion_sum = 0.0
+        self.brightness_max = self.motion_max = self.humans_max = 0
+
+    def bucket(self, t):
+        return t - t % self.period
+
+    def add_raw(self, r):
+        self.samples += 1
+        self.human_samples += r['humans'] > 0
+        self.occupied_samples += r['status'] in OCCUPIED_STATUSES
+        self.motion_samples += r['motion_area'] > 0
+        self.brightness_sum += float(r['brightness'])
+        self.brightness_max = max(self.brightness_max, float(r['brightness']))
+        self.motion_sum += float(r['motion_area'])
+        self.motion_max = max(self.motion_max, int(r['motion_area']))
+        self.humans_max = max(self.humans_max, int(r['humans']))
+
+    def add_rollup(self, r):
+        samples = int(r['samples'])
+        self.samples += samples
+        self.human_samples += int(r['human_samples'])
+        self.occupied_samples += int(r['occupied_samples'])
+        self.motion_samples += int(r['motion_samples'])
+        self.brightness_sum += float(r['brightness_mean']) * samples
+        self.brightness_max = max(self.brightness_max, float(r['brightness_max']))
+        self.motion_sum += float(r['motion_mean']) * samples
+        self.motion_max = max(self.motion_max, int(r['motion_max']))
+        self.humans_max = max(self.humans_max, int(r['humans_max']))
+
+    def row(self):
+        n = max(self.samples, 1)
+        return (self.start, self.samples, self.human_samples, self.occupied_samples,
+                self.motion_samples, self.brightness_sum / n, self.brightness_max,
+                self.motion_sum / n, self.motion_max, self.humans_max, 0)
+
+
+RAW_RETENTION = 7 * 86400
+PRUNE_EVERY = 86400
+
+
+class RoomTelemetry:
+    def __init__(self, directory, raw_retention=RAW_RETENTION):
+        os.makedirs(directory, exist_ok=True)
+        # Raw records are only dropped once their hour has been rolled up
+        self.raw_retention = max(raw_retention, 3600)
+        self.raw = MappedLog(os.path.join(directory, 'raw.bin'), RAW_DTYPE)
+        self.minute = MappedLog(os.path.join(directory, 'minute.bin'), ROLLUP_DTYPE)
+        self.hour = MappedLog(os.path.join(directory, 'hour.bin'), ROLLUP_DTYPE)
+        self._minute = _Rollup(60)
+        self._hour = _Rollup(3600)
+        self._lock = threading.Lock()
+        self._recover()
+
+    def _recover(self):
+        # Rebuild the open buckets from records not yet rolled up: the open
+        # hour from minute rows first, then the open minute(s) from raw
+        last_hour = self.hour.last()
+        since = last_hour['t'] + 3600 if last_hour is not None else None
+        for r in self.minute.range(since):
+            self._fold_hour(r)
+        last_minute = self.minute.last()
+        since = last_minute['t'] + 60 if last_minute is not None else None
+        for r in self.raw.range(since):
+            self._fold_minute(r)
+
+    def _fold_minute(self, r):
+        bucket = self._minute.bucket(float(r['t']))
+        if self._minute.start is not None and bucket != self._minute.start:
+            row = self._minute.row()
+            self.minute.append(row)
+            self._fold_hour(np.array(row, ROLLUP_DTYPE))
+            self._minute.reset()
+        self._minute.start = bucket
+        self._minute.add_raw(r)
+
+    def _fold_hour(self, r):
+        bucket = self._hour.bucket(float(r['t']))
+        if self._hour.start is not None and bucket != self._hour.start:
+            self.hour.append(self._hour.row())
+            self._hour.reset()
+            self._prune_raw(bucket)
+        self._hour.start = bucket
+        self._hour.add_rollup(r)
+
+    def _prune_raw(self, now):
+        if not len(self.raw):
+            return
+        cutoff = now - self.raw_retention
+        # Rewriting raw.bin costs a full copy, so let a day's worth pile up first
+        if float(self.raw.records['t'][0]) < cutoff - PRUNE_EVERY:
+            self.raw.drop_before(cutoff)
+
+    def record(self, t, brightness, motion_area, humans, status):
+        code = STATUS_CODES.get(status, STATUS_OTHER)
+        with self._lock:
+            last = self.raw.last()
+            if last is not None and t < last['t']:
+                t = float(last['t'])  # keep the log in time order if the clock steps back
+            record = np.array((t, brightness, motion_area, humans, code, 0), RAW_DTYPE)
+            self.raw.append(record)
+            self._fold_minute(record)
+
+    def query(self, start=None, end=None, resolution='raw'):
+        log = {'raw': self.raw, 'minute': self.minute, 'hour': self.hour}[resolution]
+        with self._lock:
+            return log.range(start, end).copy()
+
+    def utilization(self, start=None, end=None):
+        # Whole closed hours come from the hour log, the ragged edges and the
+        # open hour from minutes, the open minute from its accumulator
+        with self._lock:
+            total = _Rollup(1)
+            first_hour = None if start is None else -(-start // 3600) * 3600
+            last_hour = None if end is None else end - end % 3600
+            if self._hour.start is not None:
+                last_hour = self._hour.start if last_hour is None else min(last_hour, self._hour.start)
+            if first_hour is not None and last_hour is not None and last_hour < first_hour:
+                minute_spans = [(start, end)]
+            else:
+                for r in self.hour.range(first_hour, last_hour):
+                    total.add_rollup(r)
+                minute_spans = [(last_hour, end)]
+                if start is not None:
+                    minute_spans.append((start, first_hour))
+            for lo, hi in minute_spans:
+                for r in self.minute.range(lo, hi):
+                    total.add_rollup(r)
+            bucket = self._minute.start
+            if bucket is not None and (start is None or bucket >= start) and (end is None or bucket < end):
+                total.add_rollup(np.array(self._minute.row(), ROLLUP_DTYPE))
+        n = total.samples
+        return {
+            'samples': n,
+            'human_fraction': total.human_samples / n if n else 0.0,
+            'occupied_fraction': total.occupied_samples / n if n else 0.0,
+            'motion_fraction': total.motion_samples / n if n else 0.0,
+            'brightness_mean': total.brightness_sum / n if n else 0.0,
+            'brightness_max': total.brightness_max,
+            'humans_max': total.humans_max,
+        }
+
+    def flush(self):
+        with self._lock:
+            for log in (self.raw, self.minute, self.hour):
+                log.flush()
+
+
+class TelemetryStore:
+    def __init__(self, directory, clock=time.time, raw_retention=RAW_RETENTION):
+        self.directory = directory
+        self.clock = clock
+        self.raw_retention = raw_retention
+        self._rooms = {}
+        self._lock = threading.Lock()
+
+    def room(self, room):
+        room = str(room)
+        with self._lock:
+            telemetry = self._rooms.get(room)
+            if telemetry is None:
+                path = os.path.join(self.directory, re.sub(r'[^\w.-]', '_', room))
+                telemetry = self._rooms[room] = RoomTelemetry(path, self.raw_retention)
+            return telemetry
+
+    def record(self, room, brightness=0.0, motion_area=0, humans=0, status=None, t=None):
+        self.room(room).record(self.clock() if t is None else t, brightness,
+                               motion_area, humans, status)
+
+    def query(self, room, start=None, end=None, resolution='raw'):
+        return self.room(room).query(start, end, resolution)
+
+    def utilization(self, room, start=None, end=None):
+        return self.room(room).utilization(start, end)
+
+    def close(self):
+        with self._lock:
+            for telemetry in self._rooms.values():
+                telemetry.flush()
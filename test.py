@@ -1,13 +1,30 @@
 import cv2
+import functools
+import os
 import time
 import threading
 import RPi.GPIO as GPIO
 from RPLCD.i2c import CharLCD
-import requests
 import datetime
-from flask import Flask, Response
+from flask import Flask, Response, request
 import atexit
 import numpy as np
+from frame_hub import FrameHub, CaptureThread, open_camera
+from detection import DetectionWorker, MotionGatedDetector
+from tracking import TrackingDetector
+from detectors import create_detector
+from schedule_cache import ScheduleCache, UNKNOWN
+from outbox import Outbox, OutboxSender
+from backend_client import BackendClient
+from mjpeg import MjpegBroadcaster
+from actuators import ActuatorService
+from occupancy import OccupancyEngine
+from monitor import RoomMonitor, HUMAN_MIN_DWELL, occupancy_rules
+from clips import ClipIndex, ClipRecorder
+from telemetry import TelemetryStore
+from events import StateChannel
+from async_server import AsyncStreamServer
+from metrics import register_routes
 
 # --- GPIO and LCD setup ---
 BUZZER_PIN = 18
@@ -17,213 +34,214 @@ GPIO.setup(BUZZER_PIN, GPIO.OUT)
 lcd = CharLCD('PCF8574', 0x27)
 lcd.clear()
 
+# Buzzer and LCD are driven from their own thread; nothing here blocks on I2C
+actuators = ActuatorService(GPIO, lcd, BUZZER_PIN)
+
 # --- Flask App and Camera ---
 app = Flask(__name__)
-camera = cv2.VideoCapture(0, cv2.CAP_V4L2)
-camera_lock = threading.Lock()
-
-# --- HOG Human Detector Setup ---
-hog = cv2.HOGDescriptor()
-hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+# MJPEG capture: viewers get the camera's own JPEGs whenever there are no
+# boxes to draw; frames are decoded only for analysis.
+MJPEG_CAPTURE = True
+open_capture = functools.partial(open_camera, 0, cv2.CAP_V4L2, 320, 240,
+                                 fourcc='MJPG' if MJPEG_CAPTURE else None)
+camera = open_capture()
+frame_hub = FrameHub()
+# A dropped or stalled camera is reopened with backoff; see CaptureThread
+capture_thread = CaptureThread(camera, frame_hub, reopen=open_capture)
+
+# Serve /, /video, /video_feed, /events and /metrics from one asyncio loop
+# instead of Flask's thread per viewer (no /metrics/profile in that mode)
+SERVE_ASYNC = False
+
+# --- Human Detector Setup ---
+# Backend is chosen by config: 'hog' (default people detector) or 'dnn'
+# (cv2.dnn SSD model, e.g. {'backend': 'dnn', 'model': 'MobileNetSSD.caffemodel',
+# 'config': 'MobileNetSSD.prototxt'}).
+# Settings from `python tune_hog.py <clips> --base 320x240` override these
+# once hog_tuned.json exists.
+DETECTOR = {'backend': 'hog', 'win_stride': [4, 4], 'padding': [8, 8], 'scale': 1.02,
+            'tuned': 'hog_tuned.json'}
+person_detector = create_detector(DETECTOR, size=(320, 240))
+
+DETECTION_INTERVAL = 1.0  # seconds between HOG runs; also paces the monitoring loop
+TRACK_INTERVAL = 0.2  # boxes are moved by optical flow this often between HOG runs
+MOTION_GATED = True  # skip HOG on static frames, search only changed regions otherwise
+FULL_REFRESH = 30.0  # seconds between full-frame HOG passes in motion-gated mode
+
+def detect_people(frame):
+    frame_resized = cv2.resize(frame, (320, 240))
+    return person_detector.detect(frame_resized)
+
+if MOTION_GATED:
+    detector = MotionGatedDetector(person_detector, size=(320, 240), full_refresh=FULL_REFRESH)
+else:
+    detector = detect_people
+# HOG every DETECTION_INTERVAL, tracked in between; NMS-merged boxes with ids
+tracker = TrackingDetector(detector, size=(320, 240),
+                           every=round(DETECTION_INTERVAL / TRACK_INTERVAL))
+detection_worker = DetectionWorker(frame_hub, tracker, interval=TRACK_INTERVAL)
 
 # --- Control Variables ---
 room_id = None
-prev_gray = None
-motion_timer_start = None
-motion_flagged = False
-last_lcd_status = ""
-motion_timer_start = None
-motion_flagged = False
-light_timer_start = None
-light_flagged = False
+
+# --- Occupancy rules ---
+# Human after HUMAN_MIN_DWELL seconds of one tracked person, motion and light
+# after 60s; see monitor.occupancy_rules
+occupancy = OccupancyEngine(occupancy_rules(HUMAN_MIN_DWELL))
 
 # --- LCD display update ---
 def set_lcd_status(text):
-    global last_lcd_status
-    if text != last_lcd_status:
-        lcd.clear()
-        lcd.write_string(text)
-        print("[LCD] " + text)
-        last_lcd_status = text
+    actuators.show(text)
+
+# --- Backend Client ---
+# Keep-alive session with timeouts and a circuit breaker; lookups run on its
+# thread pool so the monitoring loop keeps detecting while they are in flight.
+BACKEND_URL = 'http://192.168.104.190/monitoring'
+ROOM_CODE = 'RM123MB'
+backend = BackendClient(BACKEND_URL)
 
 # --- Room ID ---
+room_id_future = None
+
 def get_room_id_by_stream_url():
+    global room_id_future
+    if room_id_future is not None and not room_id_future.done():
+        return
+    room_id_future = backend.submit(backend.get_room_id, ROOM_CODE)
+    room_id_future.add_done_callback(set_room_id)
+
+def set_room_id(future):
     global room_id
     try:
-        res = requests.get('http://192.168.104.190/monitoring/ajax/get_room_id.php', params={
-            'code': 'RM123MB'
-        })
-        if res.status_code == 200:
-            room_id = res.json().get('room_id')
-            print("Room ID:", room_id)
+        room_id = future.result()
+        print("Room ID:", room_id)
     except Exception as e:
         print("Error getting room_id:", e)
 
-# --- Check Schedule Status ---
+# --- Schedule Cache ---
+# Today's schedule is fetched once and answered locally; it is reloaded every
+# SCHEDULE_TTL seconds and right after this process flags a schedule. Until it
+# loads, check_schedule.php answers each lookup as before; if neither answers
+# the status is UNKNOWN and the room is not flagged.
+SCHEDULE_TTL = 300
+
+schedule_cache = ScheduleCache(backend.get_schedule, ttl=SCHEDULE_TTL, executor=backend.executor,
+                               fallback=backend.check_schedule)
+
 def check_schedule_status(room_id):
-    now = datetime.datetime.now()
-    current_day = (now.weekday() + 1) % 7 or 7
-    current_time = now.strftime("%H:%M:%S")
-    try:
-        res = requests.get('http://192.168.104.190/monitoring/ajax/check_schedule.php', params={
-            'room_id': room_id,
-            'schedule_day': current_day,
-            'current_time': current_time
-        })
-        data = res.json()
-        if data['success']:
-            return data['status']
-    except Exception as e:
-        print("Schedule check error:", e)
-    return None
+    if room_id is None:
+        return UNKNOWN
+    return schedule_cache.status(room_id)
 
 # --- Flag Schedule ---
-def flag_schedule(detection):
-    try:
-        res = requests.post('http://192.168.104.190/monitoring/ajax/flag_schedule.php', json={'room_id': room_id, 'detection':detection})
-        print("Flagged schedule:", res.json().get('message') if res.ok else res.status_code)
-    except Exception as e:
-        print("Error flagging schedule:", e)
+# Flags go to a local outbox and are posted by a background sender, so the
+# monitoring loop never waits on the backend and no flag is lost while it is down.
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+outbox = Outbox(os.path.join(DATA_DIR, 'test_outbox.db'))
 
-# --- Buzzer Alert ---
-def buzzer_alert():
-    GPIO.output(BUZZER_PIN, GPIO.HIGH)
-    set_lcd_status("Buzzing!")
-    time.sleep(5)
-    GPIO.output(BUZZER_PIN, GPIO.LOW)
+# Room state for /events subscribers
+state_channel = StateChannel()
+
+# Per-second signals go to a binary log instead of stdout
+telemetry = TelemetryStore(os.path.join(DATA_DIR, 'telemetry'))
+
+# Last 10s and next 5s of video are saved with every flag
+clip_index = ClipIndex(os.path.join(DATA_DIR, 'clips', 'index.db'))
+recorder = ClipRecorder(frame_hub, clip_index, os.path.join(DATA_DIR, 'clips'))
+
+def flag_schedule(detection):
+    recorder.trigger(ROOM_CODE, detection)
+    outbox.put('flag_schedule', {
+        'room_id': room_id,
+        'detection': detection,
+        'detected_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    })
+
+def deliver_flag(event):
+    data = backend.flag_schedule(event.payload, event.event_id)
+    print("Flagged schedule:", data.get('message'))
+    schedule_cache.invalidate(event.payload['room_id'])
+
+outbox_sender = OutboxSender(outbox, {'flag_schedule': deliver_flag})
+
+# --- Camera health ---
+# Called by the capture thread when the camera drops, stalls or comes back
+def camera_health(health):
+    if health.state in ('stalled', 'reconnecting'):
+        set_lcd_status("Camera lost")
+    elif health.state == 'ok':
+        set_lcd_status("Monitoring...")
+    state = dict(state_channel.state(ROOM_CODE) or {}, camera=health.state)
+    state_channel.publish(ROOM_CODE, **state)
+
+capture_thread.on_health = camera_health
 
 # --- Monitoring Thread ---
-def monitoring_loop():
-    global prev_gray, motion_timer_start, motion_flagged
-    global light_timer_start, light_flagged
+# The checks themselves live in monitor.RoomMonitor; the LCD and buzzer go
+# through the actuator thread, flags through the outbox
+monitor = RoomMonitor(ROOM_CODE, occupancy, tracker, actuators,
+                      schedule_status=lambda: check_schedule_status(room_id),
+                      flag=flag_schedule, telemetry=telemetry, state_channel=state_channel,
+                      camera_state=lambda: capture_thread.health().state)
 
+def monitoring_loop():
     get_room_id_by_stream_url()
     set_lcd_status("Monitoring...")
 
-    while True:
-        with camera_lock:
-            ret, frame = camera.read()
-        if not ret:
+    detection_seq = 0
+    last_update = 0.0
+    while not detection_worker.stopped:
+        detection = detection_worker.wait(detection_seq)
+        if detection.seq == detection_seq:
             continue
-
-        frame_resized = cv2.resize(frame, (320, 240))
-        gray = cv2.cvtColor(frame_resized, cv2.COLOR_BGR2GRAY)
-        blurred = cv2.GaussianBlur(gray, (11, 11), 0)
-        
-        # Find brightest point
-        (minVal, maxVal, minLoc, maxLoc) = cv2.minMaxLoc(blurred)
-        
-        # Get brightness of a 20x20 patch around brightest point
-        x, y = maxLoc
-        patch = gray[max(0, y-10):y+10, max(0, x-10):x+10]
-        brightness = patch.mean() if patch.size > 0 else 0
-        
-        status = check_schedule_status(room_id)
-        light_on = brightness > 110
-        motion_detected = False
-        human_detected = False
-
-        # Motion Detection
-        if prev_gray is not None:
-            diff = cv2.absdiff(gray, prev_gray)
-            _, thresh = cv2.threshold(diff, 25, 255, cv2.THRESH_BINARY)
-            motion_area = cv2.countNonZero(thresh)
-            motion_detected = motion_area > 500
-        prev_gray = gray
-
-        # Human Detection
-        rects, weights = hog.detectMultiScale(frame_resized, winStride=(4,4), padding=(8,8), scale=1.02)
-        human_detected = len(rects) > 0
-        
-        # rects, weights = hog.detectMultiScale(
-        #     frame,
-        #     winStride=(8, 8),
-        #     padding=(16, 16),
-        #     scale=1.05
-        # )
-
-        # filtered_rects = []
-        # for i, (x, y, w, h) in enumerate(rects):
-        #     if weights[i] > 0.6:  # Adjust threshold based on test (0.5–0.7 usually works well)
-        #         filtered_rects.append((x, y, w, h))
-        # human_detected = len(filtered_rects) > 0
-
-        # --- Print & LCD status logic ---
-        if human_detected:
-            set_lcd_status("Human detected")
-        elif motion_detected:
-            set_lcd_status("Motion detected")
-        elif light_on:
-            set_lcd_status("Light detected")
-        else:
-            set_lcd_status("Monitoring...")
-
-        print(f"[INFO] Motion: {motion_detected}, Light: {light_on}, Status: {status}")
-
-        # If occupied, skip flagging
-        if status == "Occupied":
-            set_lcd_status("Occupied...")
-            time.sleep(1)
+        detection_seq = detection.seq
+        # Tracked boxes arrive every TRACK_INTERVAL; the checks below keep
+        # their DETECTION_INTERVAL pace
+        if time.monotonic() - last_update < DETECTION_INTERVAL - TRACK_INTERVAL / 2:
             continue
+        last_update = time.monotonic()
 
-        # If human detected, flag immediately
-        if human_detected:
-            flag_schedule("Human")
-            buzzer_alert()
-            # time.sleep(5)
-            continue
+        if room_id is None:
+            get_room_id_by_stream_url()
 
-        # Motion consistency logic
-        if motion_detected:
-            if not motion_timer_start:
-                motion_timer_start = time.time()
-            elif time.time() - motion_timer_start >= 60 and not motion_flagged:
-                motion_flagged = True
-                print("[ALERT] Motion > 60s. Flagging schedule...")
-                flag_schedule("Motion")
-                buzzer_alert()
-        else:
-            motion_timer_start = None
-            motion_flagged = False
-
-        # Light consistency logic
-        if light_on:
-            if not light_timer_start:
-                light_timer_start = time.time()
-            elif time.time() - light_timer_start >= 60 and not light_flagged:
-                light_flagged = True
-                print("[ALERT] Light > 60s. Flagging schedule...")
-                flag_schedule("Light")
-                buzzer_alert()
-        else:
-            light_timer_start = None
-            light_flagged = False
-
-        time.sleep(1)
+        _, frame = frame_hub.latest()
+        monitor.update(detection, frame)
 
 # --- Video Feed with Human Boxes ---
-def gen_frames():
-    while True:
-        with camera_lock:
-            success, frame = camera.read()
-        if not success:
-            break
+def render_boxes(frame):
+    frame = cv2.resize(frame, (320, 240))
 
-        frame = cv2.resize(frame, (320, 240))
+    # Tracked people from the latest cached result, with their ids
+    for track in tracker.tracks:
+        x, y, w, h = track.rect
+        cv2.rectangle(frame, (x, y), (x+w, y+h), (0,255,0), 2)
+        cv2.putText(frame, f"#{track.id} {int(track.dwell)}s", (x, max(12, y - 4)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
+    return frame
 
-        # Human detection boxes
-        rects, _ = hog.detectMultiScale(frame, winStride=(8,8), padding=(8,8), scale=1.05)
-        for (x, y, w, h) in rects:
-            cv2.rectangle(frame, (x, y), (x+w, y+h), (0,255,0), 2)
+broadcaster = MjpegBroadcaster(frame_hub, render=render_boxes, quality=70, max_fps=10,
+                               passthrough=lambda: len(detection_worker.latest().rects) == 0)
 
-        ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 70])
-        yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-        time.sleep(0.1)
+def gen_frames():
+    return broadcaster.gen_frames()
+
+# --- Metrics ---
+# Stage latencies are recorded where the work happens; these are read on scrape
+for component in (broadcaster, capture_thread, detection_worker, outbox, actuators, recorder,
+                  state_channel):
+    component.register_metrics()
+register_routes(app)
 
 @app.route('/video_feed')
 def video_feed():
     return Response(gen_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/events')
+def events():
+    return Response(state_channel.stream(ROOM_CODE, request.headers.get('Last-Event-ID')),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/')
 def index():
     return """
@@ -238,11 +256,26 @@ def index():
 # --- Cleanup ---
 @atexit.register
 def cleanup():
-    lcd.clear()
-    camera.release()
+    state_channel.close()
+    actuators.stop()
+    detection_worker.stop()
+    outbox_sender.stop()
+    backend.close()
+    capture_thread.stop()
+    recorder.stop()
+    telemetry.close()
     GPIO.cleanup()
 
 # --- Run ---
 if __name__ == '__main__':
+    actuators.start()
+    capture_thread.start()
+    detection_worker.start()
+    recorder.start()
+    outbox_sender.start()
     threading.Thread(target=monitoring_loop, daemon=True).start()
-    app.run(host='0.0.0.0', port=5000)
+    if SERVE_ASYNC:
+        AsyncStreamServer(broadcaster, index(), port=5000,
+                          state_channel=state_channel, events_room=ROOM_CODE).run()
+    else:
+        app.run(host='0.0.0.0', port=5000)
@@ -1,22 +1,24 @@
 import cv2
+import functools
 from flask import Flask, Response
-import time
 import atexit
+from frame_hub import FrameHub, CaptureThread, open_camera
+from mjpeg import MjpegBroadcaster
 
 app = Flask(__name__)
-camera = cv2.VideoCapture(0, cv2.CAP_V4L2)
+# MJPEG at 320x240: frames go to viewers exactly as the camera compressed them
+open_capture = functools.partial(open_camera, 0, cv2.CAP_V4L2, 320, 240, fourcc='MJPG')
+
+frame_hub = FrameHub()
+# Reopened with backoff if the camera drops; viewers resume on their own
+capture_thread = CaptureThread(open_capture(), frame_hub, reopen=open_capture)
+
+# Resize to reduce load, lower quality; encoded once per frame for all viewers
+broadcaster = MjpegBroadcaster(frame_hub, render=lambda frame: cv2.resize(frame, (320, 240)),
+                               quality=70, max_fps=10, passthrough=lambda: True)
 
 def gen_frames():
-    while True:
-        success, frame = camera.read()
-        if not success:
-            break
-        frame = cv2.resize(frame, (320, 240))  # Resize to reduce load
-        ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 70])  # Lower quality
-        frame_bytes = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        time.sleep(0.1)
+    return broadcaster.gen_frames()
 
 @app.route('/video_feed')
 def video_feed():
@@ -37,7 +39,8 @@ def index():
 
 @atexit.register
 def cleanup():
-    camera.release()
+    capture_thread.stop()
 
 if __name__ == '__main__':
+    capture_thread.start()
     app.run(host='0.0.0.0', port=5000)
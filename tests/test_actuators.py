@@ -0,0 +1,124 @@
+import time
+
+import pytest
+
+from actuators import ActuatorService, FakeGPIO, FakeLCD
+
+BUZZER_PIN = 18
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_service(min_redraw=0.5):
+    clock = Clock()
+    gpio = FakeGPIO(clock=clock)
+    lcd = FakeLCD(clock=clock)
+    service = ActuatorService(gpio, lcd, BUZZER_PIN, min_redraw=min_redraw, clock=clock)
+    return service, gpio, lcd, clock
+
+
+def pump(service):
+    # One pass of the actuator thread: apply everything queued, then advance
+    while service.pending:
+        service._apply(*service._commands.get_nowait())
+    service._advance()
+
+
+def levels(gpio):
+    return [(t, level) for t, pin, level in gpio.history if pin == BUZZER_PIN]
+
+
+def test_queued_texts_are_coalesced():
+    service, gpio, lcd, clock = make_service()
+    for text in ("Monitoring...", "Motion detected", "Human detected"):
+        service.show(text)
+    pump(service)
+    assert lcd.text == "Human detected"
+    assert [text for _, text in lcd.history] == ["Human detected"]
+    assert service.redraws == 1
+
+
+def test_unchanged_text_is_not_redrawn():
+    service, gpio, lcd, clock = make_service()
+    service.show("Monitoring...")
+    pump(service)
+    clock.now += 5
+    service.show("Monitoring...")
+    pump(service)
+    assert service.redraws == 1
+
+
+def test_redraws_wait_for_min_redraw():
+    service, gpio, lcd, clock = make_service(min_redraw=0.5)
+    service.show("Monitoring...")
+    pump(service)
+    clock.now += 0.2
+    service.show("Motion detected")
+    pump(service)
+    assert lcd.text == "Monitoring..."
+    assert service._next_deadline() == pytest.approx(0.3)
+    clock.now += 0.3
+    pump(service)
+    assert lcd.text == "Motion detected"
+    assert service.redraws == 2
+
+
+def test_buzz_pattern_steps_and_message():
+    service, gpio, lcd, clock = make_service(min_redraw=0)
+    service.show("Monitoring...")
+    service.buzz([(0.2, 0.1), (0.2, 0)], message="Buzzing!")
+    pump(service)
+    assert gpio.pins[BUZZER_PIN] == FakeGPIO.HIGH
+    assert lcd.text == "Buzzing!"
+    for step in (0.2, 0.1, 0.2):
+        clock.now += step
+        pump(service)
+    assert [level for _, level in levels(gpio)] == [1, 0, 1, 0]
+    assert [t for t, _ in levels(gpio)] == pytest.approx([100.0, 100.2, 100.3, 100.5])
+    # The show() text comes back once the pattern is over
+    assert lcd.text == "Monitoring..."
+
+
+def test_buzz_duration_is_one_step():
+    service, gpio, lcd, clock = make_service()
+    service.buzz(5)
+    pump(service)
+    assert gpio.pins[BUZZER_PIN] == FakeGPIO.HIGH
+    assert service._next_deadline() == pytest.approx(5)
+    clock.now += 5
+    pump(service)
+    assert gpio.pins[BUZZER_PIN] == FakeGPIO.LOW
+
+
+def test_silence_stops_the_pattern():
+    service, gpio, lcd, clock = make_service(min_redraw=0)
+    service.show("Monitoring...")
+    service.buzz(5, message="Buzzing!")
+    pump(service)
+    clock.now += 1
+    service.silence()
+    pump(service)
+    assert gpio.pins[BUZZER_PIN] == FakeGPIO.LOW
+    assert lcd.text == "Monitoring..."
+
+
+def test_stop_turns_everything_off():
+    gpio, lcd = FakeGPIO(), FakeLCD()
+    service = ActuatorService(gpio, lcd, BUZZER_PIN, min_redraw=0)
+    service.start()
+    service.show("Monitoring...")
+    service.buzz(10, message="Buzzing!")
+    deadline = time.monotonic() + 2
+    while gpio.pins.get(BUZZER_PIN) != FakeGPIO.HIGH and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert gpio.pins[BUZZER_PIN] == FakeGPIO.HIGH
+    service.stop()
+    assert not service.is_alive()
+    assert gpio.pins[BUZZER_PIN] == FakeGPIO.LOW
+    assert lcd.text == ''
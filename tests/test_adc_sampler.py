@@ -0,0 +1,108 @@
+import time
+
+import pytest
+
+from adc_sampler import FakeSpi, Mcp3008Sampler
+
+
+class Levels:
+    # FakeSpi source: the next value per channel, set by the test
+    def __init__(self, **values):
+        self.values = {int(k[2:]): v for k, v in values.items()}
+
+    def __call__(self, channel):
+        return self.values.get(channel, 0)
+
+
+def test_fake_spi_speaks_mcp3008():
+    spi = FakeSpi(lambda channel: 1000 + channel)
+    sampler = Mcp3008Sampler(spi, channels=(0, 5))
+    assert sampler.read_channels() == [1000, 1005]
+    assert spi.transfers == 2
+
+
+def test_ring_keeps_the_newest_window():
+    values = iter(range(100))
+    sampler = Mcp3008Sampler(FakeSpi(lambda channel: next(values)), rate=10, window=0.5)
+    assert sampler.slots == 5
+    assert sampler.latest(0) is None
+    assert sampler.mean(0) is None
+    for _ in range(3):
+        sampler.sample()
+    assert list(sampler.window(0)) == [0, 1, 2]
+    for _ in range(5):
+        sampler.sample()
+    assert sampler.count == 8
+    assert sampler.latest(0) == 7
+    assert list(sampler.window(0)) == [3, 4, 5, 6, 7]
+    assert list(sampler.window(0, seconds=0.2)) == [6, 7]
+    assert sampler.mean(0) == pytest.approx(5.0)
+    assert sampler.median(0, seconds=0.3) == 6.0
+
+
+def test_channels_are_separate_columns():
+    levels = Levels(ch0=100, ch3=900)
+    sampler = Mcp3008Sampler(FakeSpi(levels), channels=(0, 3))
+    sampler.sample()
+    levels.values[0] = 200
+    sampler.sample()
+    assert list(sampler.window(0)) == [100, 200]
+    assert list(sampler.window(3)) == [900, 900]
+
+
+def test_median_ignores_single_spikes():
+    levels = Levels(ch0=100)
+    sampler = Mcp3008Sampler(FakeSpi(levels), rate=10, debounce=0.5,
+                             thresholds={0: (600, 400)})
+    for _ in range(5):
+        sampler.sample()
+    levels.values[0] = 1023
+    sampler.sample()
+    levels.values[0] = 100
+    sampler.sample()
+    assert not sampler.state(0)
+
+
+def test_state_turns_on_above_on_and_off_below_off():
+    levels = Levels(ch0=100)
+    sampler = Mcp3008Sampler(FakeSpi(levels), rate=10, debounce=0.3,
+                             thresholds={0: (600, 400)})
+    sampler.sample()
+    assert not sampler.state(0)
+
+    levels.values[0] = 700
+    sampler.sample()
+    assert not sampler.state(0)  # median of [100, 700]
+    sampler.sample()
+    assert sampler.state(0)
+
+    # Between off and on: stays on
+    levels.values[0] = 500
+    for _ in range(3):
+        sampler.sample()
+    assert sampler.state(0)
+
+    levels.values[0] = 300
+    sampler.sample()
+    assert sampler.state(0)
+    sampler.sample()
+    assert not sampler.state(0)
+
+    # ...and does not come back on until the median passes `on`
+    levels.values[0] = 500
+    for _ in range(3):
+        sampler.sample()
+    assert not sampler.state(0)
+
+
+def test_run_samples_until_stopped():
+    sampler = Mcp3008Sampler(FakeSpi(lambda channel: 512), rate=200)
+    sampler.start()
+    deadline = time.monotonic() + 2
+    while sampler.count < 10 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    sampler.stop()
+    assert not sampler.is_alive()
+    assert sampler.count >= 10
+    assert sampler.errors == 0
+    assert sampler.latest(0) == 512
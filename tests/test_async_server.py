@@ -0,0 +1,142 @@
+import asyncio
+
+import numpy as np
+
+from async_server import AsyncStreamServer
+from events import StateChannel
+from frame_hub import FrameHub
+from mjpeg import MjpegBroadcaster
+
+
+class StuckTransport:
+    # A client that never reads: the write buffer only grows
+    def __init__(self):
+        self.buffered = 0
+        self.aborted = False
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+    def is_closing(self):
+        return self.aborted
+
+    def abort(self):
+        self.aborted = True
+
+
+class StuckWriter:
+    def __init__(self):
+        self.transport = StuckTransport()
+        self.closed = False
+
+    def write(self, data):
+        self.transport.buffered += len(data)
+
+    async def drain(self):
+        await asyncio.Event().wait()  # never drains
+
+    def close(self):
+        self.closed = True
+
+
+class Reader:
+    def __init__(self, request):
+        self.lines = request.splitlines(keepends=True)
+
+    async def readline(self):
+        return self.lines.pop(0) if self.lines else b''
+
+
+def test_stalled_viewer_is_aborted_without_draining():
+    broadcaster = MjpegBroadcaster(FrameHub())
+    server = AsyncStreamServer(broadcaster, 'index', max_buffer=10, stall_timeout=0.05)
+
+    async def run():
+        server._loop = asyncio.get_running_loop()
+        server._frame_event = asyncio.Event()
+        writer = StuckWriter()
+        handler = asyncio.create_task(
+            server._handle(Reader(b'GET /video_feed HTTP/1.1\r\n\r\n'), writer))
+        await asyncio.sleep(0.01)
+        assert broadcaster.viewers == 1
+        for _ in range(100):
+            if handler.done():
+                break
+            server._publish(b'x' * 100)
+            await asyncio.sleep(0.01)
+        await asyncio.wait_for(handler, 1.0)
+        return writer
+
+    writer = asyncio.run(run())
+    assert writer.transport.aborted
+    assert writer.closed
+    assert broadcaster.viewers == 0
+    assert server.viewers == 0
+    assert server.dropped_frames > 0
+
+
+def test_broadcaster_counts_viewers():
+    hub = FrameHub()
+    broadcaster = MjpegBroadcaster(hub)
+    hub.publish(np.zeros((8, 8, 3), np.uint8))
+    frames = broadcaster.gen_frames()
+    next(frames)
+    assert broadcaster.viewers == 1
+    assert broadcaster.add_viewer() == 2
+    assert broadcaster.remove_viewer() == 1
+    frames.close()
+    assert broadcaster.viewers == 0
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.transport = StuckTransport()
+        self.data = b''
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.transport.abort()
+
+
+def test_events_are_served_from_the_state_channel():
+    channel = StateChannel(keepalive=0.05)
+    channel.publish('A101', human=True)
+    channel.publish('A101', human=False)
+    channel.publish('B202', human=True)
+    server = AsyncStreamServer(MjpegBroadcaster(FrameHub()), 'index',
+                               state_channel=channel, events_room='A101')
+
+    async def run():
+        server._loop = asyncio.get_running_loop()
+        writer = RecordingWriter()
+        handler = asyncio.create_task(server._handle(
+            Reader(b'GET /events HTTP/1.1\r\nLast-Event-ID: 1\r\n\r\n'), writer))
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if b'keepalive' in writer.data:
+                break
+        assert server.event_streams == 1
+        channel.close()
+        await asyncio.wait_for(handler, 1.0)
+        return writer.data.decode()
+
+    data = asyncio.run(run())
+    assert data.startswith('HTTP/1.1 200 OK\r\nContent-Type: text/event-stream')
+    assert 'id: 2\nevent: state\ndata: {"human":false,"room":"A101"}\n\n' in data
+    assert 'B202' not in data and 'id: 1\n' not in data
+    assert ': keepalive' in data
+    assert server.event_streams == 0
+    assert channel.subscribers == 0
+
+
+def test_events_beyond_the_limit_are_refused():
+    server = AsyncStreamServer(MjpegBroadcaster(FrameHub()), 'index',
+                               state_channel=StateChannel(), max_event_streams=0)
+    writer = RecordingWriter()
+    asyncio.run(server._handle(Reader(b'GET /events HTTP/1.1\r\n\r\n'), writer))
+    assert writer.data.startswith(b'HTTP/1.1 503')
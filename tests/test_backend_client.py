@@ -0,0 +1,169 @@
+import datetime
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+
+from backend_client import BackendClient, CircuitBreaker, CircuitOpenError
+from outbox import Outbox, OutboxSender
+
+
+class StubBackend:
+    # Local HTTP server answering from `responses` {path: [(status, body), ...]};
+    # the last response of a path repeats. Every request is kept in `requests`.
+    def __init__(self):
+        self.responses = {}
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _answer(self):
+                url = urlparse(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                stub.requests.append({
+                    'method': self.command,
+                    'path': url.path,
+                    'query': {k: v[0] for k, v in parse_qs(url.query).items()},
+                    'headers': dict(self.headers),
+                    'json': json.loads(body) if body else None,
+                })
+                queued = stub.responses.get(url.path) or [(404, {'success': False})]
+                status, payload = queued.pop(0) if len(queued) > 1 else queued[0]
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _answer
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/monitoring'
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+
+    def hits(self, path):
+        return [r for r in self.requests if r['path'] == '/monitoring/' + path]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def stub():
+    stub = StubBackend()
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def client(stub, clock):
+    client = BackendClient(stub.url, timeout=(1.0, 2.0),
+                           breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock))
+    yield client
+    client.close()
+
+
+def test_get_schedule(stub, client):
+    stub.responses['/monitoring/ajax/get_schedule.php'] = [(200, {'success': True, 'schedules': [
+        {'schedule_id': 3, 'schedule_time': '08:00:00', 'end_time': '10:00:00', 'status': 'Using'}]})]
+    assert client.get_schedule(7, 2) == [(3, '08:00:00', '10:00:00', 'Using')]
+    assert stub.hits('ajax/get_schedule.php')[0]['query'] == {'room_id': '7', 'schedule_day': '2'}
+
+
+def test_check_schedule_fallback(stub, client):
+    stub.responses['/monitoring/ajax/check_schedule.php'] = [(200, {'success': True, 'status': 'Occupied'})]
+    assert client.check_schedule(7, datetime.datetime(2026, 10, 19, 9, 30)) == 'Occupied'
+    assert stub.hits('ajax/check_schedule.php')[0]['query'] == {
+        'room_id': '7', 'schedule_day': '1', 'current_time': '09:30:00'}
+
+
+def test_circuit_opens_after_server_errors_and_recovers(stub, client, clock):
+    path = '/monitoring/ajax/get_room_id.php'
+    stub.responses[path] = [(500, {}), (500, {}), (200, {'room_id': 7})]
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            client.get_room_id('cam1')
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    # Open: fails without touching the backend
+    with pytest.raises(CircuitOpenError):
+        client.get_room_id('cam1')
+    assert len(stub.hits('ajax/get_room_id.php')) == 2
+
+    # Half-open after reset_timeout: one trial call, which closes it again
+    clock.now += 30
+    assert client.get_room_id('cam1') == 7
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_trial_reopens_the_circuit(stub, client, clock):
+    stub.responses['/monitoring/ajax/get_room_id.php'] = [(500, {})]
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            client.get_room_id('cam1')
+    clock.now += 30
+    with pytest.raises(requests.HTTPError):
+        client.get_room_id('cam1')
+    assert client.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        client.get_room_id('cam1')
+
+
+def test_client_errors_do_not_open_the_circuit(stub, client):
+    stub.responses['/monitoring/ajax/get_room_id.php'] = [(404, {})]
+    for _ in range(3):
+        with pytest.raises(requests.HTTPError):
+            client.get_room_id('cam1')
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_unreachable_backend_counts_as_failure(clock):
+    client = BackendClient('http://127.0.0.1:9', timeout=(0.5, 0.5),
+                           breaker=CircuitBreaker(failure_threshold=1, clock=clock))
+    with pytest.raises(requests.ConnectionError):
+        client.get_room_id('cam1')
+    assert client.breaker.state == CircuitBreaker.OPEN
+    client.close()
+
+
+def test_flag_retries_reuse_the_idempotency_key(stub, client, tmp_path):
+    path = '/monitoring/ajax/flag_schedule.php'
+    stub.responses[path] = [(503, {}), (200, {'success': True, 'message': 'ok'})]
+    outbox = Outbox(str(tmp_path / 'outbox.db'))
+    event_id = outbox.put('flag_schedule', {'room_id': 7, 'detection': 'Motion'})
+    sender = OutboxSender(outbox, {
+        'flag_schedule': lambda event: client.flag_schedule(event.payload, event.event_id)})
+
+    assert sender.send_batch(outbox.due(10)) == 0
+    assert sender.send_batch(outbox.due(10, now=float('inf'))) == 1
+    assert outbox.pending() == 0
+
+    posts = stub.hits('ajax/flag_schedule.php')
+    assert len(posts) == 2
+    for post in posts:
+        assert post['headers']['Idempotency-Key'] == event_id
+        assert post['json'] == {'room_id': 7, 'detection': 'Motion', 'event_id': event_id}
+    outbox.close()
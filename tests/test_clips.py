@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+from clips import ClipIndex, ClipRecorder
+from frame_hub import FrameHub, JpegFrame
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = ClipIndex(str(tmp_path / 'index.db'))
+    yield index
+    index.close()
+
+
+def jpeg(n):
+    # Stand-in JPEG bytes; the recorder only stores and concatenates them
+    return JpegFrame(b'\xff\xd8' + n.to_bytes(4, 'big') + b'\xff\xd9')
+
+
+def publish(hub, count, interval):
+    for n in range(count):
+        hub.publish(jpeg(n))
+        time.sleep(interval)
+
+
+def test_index_queries(index):
+    index.add('RM123MB', 'Human', 100.0, 90.0, 105.0, 75, '/a')
+    index.add('RM123MB', 'Light', 200.0, 190.0, 205.0, 75, '/b')
+    index.add('RM124MB', 'Human', 150.0, 140.0, 155.0, 75, '/c')
+    assert [c.path for c in index.find()] == ['/b', '/c', '/a']
+    assert [c.path for c in index.find('RM123MB')] == ['/b', '/a']
+    assert [c.path for c in index.find(since=150.0)] == ['/b', '/c']
+    assert [c.path for c in index.find(until=150.0)] == ['/a']
+    assert [c.path for c in index.find(limit=1)] == ['/b']
+    clip = index.find('RM124MB')[0]
+    assert (clip.room, clip.reason, clip.frames) == ('RM124MB', 'Human', 75)
+
+
+def test_ring_keeps_the_newest_frames_at_the_clip_rate(index, tmp_path):
+    hub = FrameHub()
+    recorder = ClipRecorder(hub, index, str(tmp_path), pre_roll=0.1, post_roll=0.1, fps=50.0,
+                            slot_bytes=64)
+    assert recorder.slots == 10 + 50
+    recorder.start()
+    try:
+        publish(hub, 5, 0.03)
+        hub.publish(JpegFrame(b'x' * 65))  # does not fit a slot
+        time.sleep(0.05)
+    finally:
+        hub.close()
+        recorder.stop()
+    frames = recorder._snapshot(0, time.time())
+    assert [data for _, data in frames] == [jpeg(n).data for n in range(5)]
+    assert recorder.oversized_frames == 1
+
+
+def test_trigger_writes_pre_and_post_roll(index, tmp_path):
+    hub = FrameHub()
+    recorder = ClipRecorder(hub, index, str(tmp_path), pre_roll=0.2, post_roll=0.2, fps=50.0)
+    recorder.start()
+    try:
+        publish(hub, 5, 0.03)
+        at = time.time()
+        recorder.trigger('RM123MB', 'Human', at=at)
+        assert recorder.pending == 1
+        publish(hub, 10, 0.03)
+        deadline = time.time() + 2.0
+        while recorder.clips_written == 0 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        hub.close()
+        recorder.stop()
+
+    clip, = index.find('RM123MB')
+    assert recorder.pending == 0
+    assert clip.reason == 'Human' and clip.triggered_at == at
+    assert at - 0.2 <= clip.start < at < clip.end <= at + 0.2
+    with open(clip.path, 'rb') as f:
+        data = f.read()
+    assert data.count(b'\xff\xd8') == clip.frames
+    assert clip.frames >= 8  # frames from both before and after the trigger
+    assert clip.path.startswith(str(tmp_path / 'RM123MB'))
+
+
+def test_stop_writes_pending_clips_with_what_was_captured(index, tmp_path):
+    hub = FrameHub()
+    recorder = ClipRecorder(hub, index, str(tmp_path), pre_roll=1.0, post_roll=60.0, fps=50.0)
+    recorder.start()
+    publish(hub, 3, 0.03)
+    recorder.trigger('RM123MB', 'Light')
+    hub.close()
+    recorder.stop()
+    clip, = index.find()
+    assert clip.frames == 3
+
+
+def test_nothing_buffered_writes_no_clip(index, tmp_path):
+    recorder = ClipRecorder(FrameHub(), index, str(tmp_path))
+    assert recorder._write_clip('RM123MB', 'Human', time.time()) is None
+    assert index.find() == []
+    assert recorder.min_interval == pytest.approx(0.2)
@@ -0,0 +1,103 @@
+import datetime
+import sqlite3
+
+import pytest
+
+from db import SQLITE, ConnectionPool, MonitoringDB
+
+SCHEMA = """
+    CREATE TABLE tbl_schedule (
+        schedule_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        schedule_day TEXT,
+        schedule_time TEXT,
+        end_time TEXT,
+        duration INTEGER,
+        room_id INTEGER,
+        used_by INTEGER,
+        date_added TEXT,
+        status TEXT,
+        is_permanent TEXT
+    )
+"""
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / 'monitoring.db')
+    conn = sqlite3.connect(path)
+    conn.execute(SCHEMA)
+    conn.execute("INSERT INTO tbl_schedule (schedule_day, schedule_time, end_time, room_id, status, is_permanent) "
+                 "VALUES ('2', '08:00:00', '10:00:00', 7, 'Using', 'Permanent')")
+    conn.commit()
+    conn.close()
+    pool = ConnectionPool(lambda: sqlite3.connect(path, check_same_thread=False), size=2,
+                          dialect=SQLITE)
+    yield MonitoringDB(pool)
+    pool.close()
+
+
+def rows(db):
+    with db.pool.transaction() as conn:
+        return conn.execute(
+            "SELECT schedule_id, schedule_day, schedule_time, room_id, status, is_permanent "
+            "FROM tbl_schedule ORDER BY schedule_id").fetchall()
+
+
+def test_flag_updates_the_running_schedule(db):
+    now = datetime.datetime(2026, 10, 19, 9, 30)
+    assert db.flag_schedule(7, 2, now) == ('updated', 1)
+    assert rows(db) == [(1, '2', '08:00:00', 7, 'Flagged', 'Permanent')]
+
+
+def test_flag_inserts_a_temporary_schedule(db):
+    now = datetime.datetime(2026, 10, 19, 11, 0)
+    action, schedule_id = db.flag_schedule(7, 2, now)
+    assert action == 'inserted'
+    assert rows(db)[-1] == (schedule_id, '2', '11:00:00', 7, 'Flagged', 'Temporary')
+    assert db.schedules_for_day(7, 2)[-1] == (schedule_id, '11:00:00', None, 'Flagged')
+
+
+def test_replayed_flag_finds_the_existing_insert(db):
+    now = datetime.datetime(2026, 10, 19, 11, 0)
+    _, schedule_id = db.flag_schedule(7, 2, now)
+    assert db.flag_schedule(7, 2, now) == ('existing', schedule_id)
+    assert len(rows(db)) == 2
+
+
+def test_failed_transaction_is_rolled_back(db):
+    with pytest.raises(ZeroDivisionError):
+        with db.pool.transaction() as conn:
+            conn.execute("UPDATE tbl_schedule SET status = 'Flagged'")
+            1 / 0
+    assert rows(db)[0][4] == 'Using'
+
+
+class BrokenRollback:
+    def __init__(self):
+        self.closed = False
+
+    def cursor(self):
+        raise AssertionError("not used")
+
+    def rollback(self):
+        raise sqlite3.OperationalError("connection lost")
+
+    def close(self):
+        self.closed = True
+
+
+def test_failed_rollback_drops_the_connection_and_keeps_the_error():
+    connections = []
+
+    def connect():
+        connections.append(BrokenRollback())
+        return connections[-1]
+
+    pool = ConnectionPool(connect, size=1, dialect=SQLITE)
+    with pytest.raises(ValueError, match="query failed"):
+        with pool.connection():
+            raise ValueError("query failed")
+    assert connections[0].closed
+    # The slot was given back and a fresh connection is opened
+    with pool.connection() as pooled:
+        assert pooled.conn is connections[1]
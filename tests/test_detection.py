@@ -0,0 +1,124 @@
+import numpy as np
+
+from detection import MotionGatedDetector
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class StubDetector:
+    # Records the shape of every image it is given and answers with `found`
+    # (a full-frame search) or `found_in_roi` (anything smaller), in image
+    # coordinates
+    def __init__(self, found=(), found_in_roi=()):
+        self.found = list(found)
+        self.found_in_roi = list(found_in_roi)
+        self.shapes = []
+
+    def __call__(self, image):
+        self.shapes.append(image.shape[:2])
+        rects = self.found if image.shape[:2] == (240, 320) else self.found_in_roi
+        return list(rects), [np.array([0.8])] * len(rects)
+
+
+def frame(*blocks):
+    # A flat 320x240 frame with a bright rectangle at each (x, y, w, h)
+    image = np.full((240, 320, 3), 60, np.uint8)
+    for (x, y, w, h) in blocks:
+        image[y:y + h, x:x + w] = 220
+    return image
+
+
+def make(detect, **kwargs):
+    clock = Clock()
+    kwargs.setdefault('full_refresh', 30.0)
+    return MotionGatedDetector(detect, clock=clock, **kwargs), clock
+
+
+def test_prepare_search_finish_cycle():
+    detect = StubDetector(found=[(10, 20, 40, 80)])
+    gated, clock = make(detect)
+    image, plan = gated.prepare(frame())
+    assert plan == gated.FULL
+    assert image.shape == (240, 320, 3)
+    assert gated.search(image, plan) == ([(10, 20, 40, 80)], [0.8])
+    assert (gated.full_runs, gated.last_full) == (1, clock.now)
+
+
+def test_static_frames_skip_the_detector():
+    detect = StubDetector(found=[(10, 20, 40, 80)])
+    gated, clock = make(detect)
+    gated(frame())
+    clock.now += 1.0
+    assert gated(frame()) == ([(10, 20, 40, 80)], [0.8])
+    assert gated.prepare(frame())[1] is None
+    assert len(detect.shapes) == 1
+    assert gated.skipped == 2
+
+
+def test_full_refresh_searches_a_static_frame_again():
+    detect = StubDetector()
+    gated, clock = make(detect, full_refresh=30.0)
+    gated(frame())
+    clock.now += 29.0
+    gated(frame())
+    assert gated.full_runs == 1
+    clock.now += 1.0
+    gated(frame())
+    assert gated.full_runs == 2
+    assert detect.shapes == [(240, 320), (240, 320)]
+
+
+def test_motion_searches_only_the_changed_region():
+    detect = StubDetector(found_in_roi=[(5, 10, 30, 60)])
+    gated, clock = make(detect)
+    gated(frame())
+    clock.now += 1.0
+    rects, weights = gated(frame((200, 60, 30, 30)))
+    assert gated.roi_runs == 1
+    (height, width), = detect.shapes[1:]
+    assert (width, height) != (320, 240)
+    assert width >= 80 and height >= 144  # at least one detection window
+    # ROI boxes come back in frame coordinates
+    (x, y, w, h), = rects
+    assert x > 150 and (w, h) == (30, 60)
+    assert weights == [0.8]
+
+
+def test_nearby_regions_are_merged_into_one_search():
+    detect = StubDetector()
+    gated, clock = make(detect)
+    gated(frame())
+    clock.now += 1.0
+    image, plan = gated.prepare(frame((200, 60, 25, 25), (235, 70, 25, 25), (20, 150, 25, 25)))
+    assert len(plan) == 2
+    for i, a in enumerate(plan):
+        for b in plan[i + 1:]:
+            ax, ay, aw, ah = a
+            bx, by, bw, bh = b
+            assert not (ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah)
+
+
+def test_boxes_away_from_the_regions_survive_an_roi_pass():
+    still = (10, 20, 40, 80)
+    detect = StubDetector(found=[still, (200, 60, 40, 80)])
+    gated, clock = make(detect)
+    gated(frame())
+    clock.now += 1.0
+    # The person at x=200 walks off; the one sitting still at x=10 stays
+    rects, _ = gated(frame((220, 80, 30, 30)))
+    assert gated.roi_runs == 1
+    assert rects == [still]
+
+
+def test_motion_over_most_of_the_frame_runs_a_full_search():
+    detect = StubDetector()
+    gated, clock = make(detect, full_frame_ratio=0.6)
+    gated(frame())
+    clock.now += 1.0
+    assert gated.prepare(frame((0, 0, 320, 200)))[1] == gated.FULL
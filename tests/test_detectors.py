@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+from detectors import HogDetector, create_detector, load_tuned
+
+
+@pytest.fixture
+def tuned_file(tmp_path):
+    path = tmp_path / 'hog_tuned.json'
+    path.write_text(json.dumps({'detector': {'backend': 'hog', 'scale': 1.1, 'win_stride': [8, 8]},
+                                'base_size': [320, 240]}))
+    return str(path)
+
+
+def test_tuned_settings_apply_at_their_base_size(tuned_file):
+    assert load_tuned(tuned_file, (320, 240))['scale'] == 1.1
+    assert load_tuned(tuned_file)['scale'] == 1.1
+
+
+def test_tuned_settings_for_another_size_are_ignored(tuned_file, capsys):
+    assert load_tuned(tuned_file, (640, 480)) == {}
+    assert 'tuned for 320x240 images, not 640x480' in capsys.readouterr().out
+
+
+def test_missing_tuned_file_means_defaults(tmp_path):
+    assert load_tuned(str(tmp_path / 'missing.json'), (320, 240)) == {}
+
+
+def test_create_detector_passes_the_size_on(tuned_file):
+    config = {'backend': 'hog', 'scale': 1.02, 'tuned': tuned_file}
+    assert create_detector(config, (320, 240)).scale == 1.1
+    detector = create_detector(config, (640, 480))
+    assert isinstance(detector, HogDetector)
+    assert detector.scale == 1.02
@@ -0,0 +1,86 @@
+import json
+import threading
+
+from events import StateChannel
+
+
+def messages(stream, count):
+    # The next `count` SSE messages (the retry hint included), as text
+    return [next(stream) for _ in range(count)]
+
+
+def parse(message):
+    fields = dict(line.split(': ', 1) for line in message.strip().splitlines())
+    return int(fields['id']), json.loads(fields['data'])
+
+
+def test_only_changes_are_published():
+    channel = StateChannel()
+    assert channel.publish('A101', human=True, light=False)
+    assert not channel.publish('A101', human=True, light=False)
+    assert channel.publish('A101', human=False, light=False)
+    assert channel.state('A101') == {'human': False, 'light': False}
+    assert channel.state('B202') is None
+
+
+def test_stream_sends_a_snapshot_then_changes():
+    channel = StateChannel()
+    channel.publish('A101', human=True)
+    channel.publish('B202', human=False)
+    stream = channel.stream()
+    retry, first, second = messages(stream, 3)
+    assert retry == "retry: 3000\n\n"
+    assert parse(first) == (1, {'human': True, 'room': 'A101'})
+    assert parse(second) == (2, {'human': False, 'room': 'B202'})
+    assert channel.subscribers == 1
+
+    channel.publish('B202', human=False)  # unchanged: nothing sent
+    channel.publish('A101', human=False)
+    assert parse(next(stream)) == (3, {'human': False, 'room': 'A101'})
+    stream.close()
+    assert channel.subscribers == 0
+
+
+def test_stream_of_one_room():
+    channel = StateChannel()
+    channel.publish('A101', human=True)
+    channel.publish('B202', human=True)
+    stream = channel.stream('B202')
+    assert parse(messages(stream, 2)[1]) == (2, {'human': True, 'room': 'B202'})
+
+
+def test_last_event_id_resumes_after_what_was_seen():
+    channel = StateChannel()
+    for n in range(3):
+        channel.publish('A101', people=n)
+    channel.publish('B202', people=0)
+    stream = channel.stream(last_event_id='2')
+    # A101 moved on since id 2; only its latest state and B202 are sent
+    assert [parse(m) for m in messages(stream, 3)[1:]] == [
+        (3, {'people': 2, 'room': 'A101'}), (4, {'people': 0, 'room': 'B202'})]
+
+
+def test_last_event_id_from_before_a_restart_gets_everything():
+    channel = StateChannel()
+    channel.publish('A101', people=1)
+    stream = channel.stream(last_event_id='99')
+    assert parse(messages(stream, 2)[1]) == (1, {'people': 1, 'room': 'A101'})
+
+
+def test_idle_streams_send_keepalives():
+    channel = StateChannel(keepalive=0.01)
+    stream = channel.stream()
+    assert messages(stream, 2) == ["retry: 3000\n\n", ": keepalive\n\n"]
+
+
+def test_close_ends_every_stream():
+    channel = StateChannel()
+    stream = channel.stream()
+    next(stream)
+    ended = []
+    reader = threading.Thread(target=lambda: ended.append(list(stream)))
+    reader.start()
+    channel.close()
+    reader.join(2.0)
+    assert ended == [[]]
+    assert channel.subscribers == 0
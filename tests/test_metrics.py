@@ -0,0 +1,93 @@
+import gc
+import threading
+
+import pytest
+from flask import Flask
+
+from metrics import Counter, Histogram, Registry, SamplingProfiler, register_routes
+
+
+def run_threads(target, count=8):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_counter_totals_every_thread():
+    counter = Counter()
+
+    def work():
+        for _ in range(10000):
+            counter.inc()
+
+    run_threads(work)
+    counter.inc(5)
+    assert counter.value == 8 * 10000 + 5
+
+
+def test_histogram_totals_every_thread():
+    histogram = Histogram(buckets=(0.1, 1.0))
+
+    def work():
+        for value in (0.05, 0.5, 5.0):
+            for _ in range(1000):
+                histogram.observe(value)
+
+    run_threads(work)
+    cumulative, count, total = histogram.snapshot()
+    assert cumulative == [8000, 16000, 24000]
+    assert count == 24000
+    assert total == pytest.approx(8000 * (0.05 + 0.5 + 5.0))
+    assert histogram.quantile(0.5) == 1.0
+
+
+def test_exited_threads_are_folded_into_the_base():
+    counter = Counter()
+
+    def work():
+        counter.inc(3)
+
+    run_threads(work, count=20)
+    gc.collect()
+    assert counter._shards == {}
+    assert counter._base == [60]
+    assert counter.value == 60
+
+    counter.inc()  # this thread's shard stays live
+    assert len(counter._shards) == 1
+    assert counter.value == 61
+
+
+def test_render_skips_broken_gauges():
+    registry = Registry(prefix='t_')
+    registry.counter('hits_total', "Hits", route='a').inc(2)
+    registry.gauge('queue_depth', lambda: 4, "Queued work items", queue='outbox')
+    registry.gauge('queue_depth', lambda: 1 / 0, queue='clips')
+    text = registry.render()
+    assert 't_hits_total{route="a"} 2' in text
+    assert 't_queue_depth{queue="outbox"} 4.0' in text
+    assert 'queue="clips"' not in text
+
+
+def test_routes():
+    registry = Registry(prefix='t_')
+    registry.gauge('answer', lambda: 42)
+    profiler = SamplingProfiler(interval=0.001)
+    app = Flask(__name__)
+    register_routes(app, registry, profiler)
+    client = app.test_client()
+
+    assert 't_answer 42.0' in client.get('/metrics').get_data(as_text=True)
+    assert client.get('/metrics/profile?seconds=0.05').status_code == 200
+
+    assert client.get('/metrics/profile?action=start').status_code == 202
+    assert profiler.running
+    assert client.get('/metrics/profile?action=start').status_code == 409
+    assert client.get('/metrics/profile?seconds=1').status_code == 409
+    stopped = client.get('/metrics/profile?action=stop')
+    assert stopped.status_code == 200
+    assert not profiler.running
+    assert client.get('/metrics/profile?action=stop').status_code == 409
+    assert client.get('/metrics/profile?action=pause').status_code == 400
@@ -0,0 +1,77 @@
+import numpy as np
+
+from detection import Detection
+from monitor import RoomMonitor, occupancy_rules
+from occupancy import OccupancyEngine
+from schedule_cache import UNKNOWN
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Tracker:
+    tracks = []
+
+    def longest_dwell(self):
+        return 0.0
+
+
+class Actuators:
+    def __init__(self):
+        self.shown = []
+        self.buzzes = []
+
+    def show(self, text):
+        self.shown.append(text)
+
+    def buzz(self, pattern, message=None):
+        self.buzzes.append((pattern, message))
+
+
+def make_monitor(status=None):
+    clock = Clock()
+    actuators = Actuators()
+    flags = []
+    monitor = RoomMonitor('r1', OccupancyEngine(occupancy_rules(), clock=clock), Tracker(),
+                          actuators, schedule_status=lambda: status, flag=flags.append,
+                          clock=clock)
+    return monitor, clock, actuators, flags
+
+
+def frames():
+    # Alternating frames: plenty of motion, bright enough for the light rule
+    a = np.full((240, 320, 3), 150, np.uint8)
+    b = a.copy()
+    b[:120] = 30
+    while True:
+        yield a
+        yield b
+
+
+def run(monitor, clock, seconds):
+    source = frames()
+    for _ in range(seconds):
+        monitor.update(Detection(1, clock.now, [], []), next(source))
+        clock.now += 1
+
+
+def test_motion_and_light_flag_after_a_minute():
+    monitor, clock, actuators, flags = make_monitor()
+    run(monitor, clock, 62)
+    assert sorted(flags) == ['Light', 'Motion']
+    assert len(actuators.buzzes) == 2
+    assert monitor.flagged_at is not None
+    assert actuators.shown[-1] == "Motion detected"
+
+
+def test_occupied_and_unknown_schedules_never_flag():
+    for status in ("Occupied", UNKNOWN):
+        monitor, clock, actuators, flags = make_monitor(status)
+        run(monitor, clock, 62)
+        assert flags == []
+        assert actuators.buzzes == []
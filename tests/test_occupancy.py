@@ -0,0 +1,189 @@
+from occupancy import (FLAGGED, IDLE, PENDING, CLEARING, OccupancyEngine, SignalRule,
+                       TimerWheel)
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def kinds(events):
+    return [(event.signal, event.kind) for event in events]
+
+
+def make_engine(**rules):
+    clock = Clock()
+    received = []
+    engine = OccupancyEngine(rules, clock=clock, on_event=received.append)
+    return engine, clock, received
+
+
+# --- TimerWheel ---
+def test_wheel_runs_callbacks_once_when_due():
+    wheel = TimerWheel(tick=0.5, slots=8)
+    fired = []
+    wheel.schedule(1.2, fired.append)
+    wheel.advance(1.0)
+    assert fired == []
+    wheel.advance(1.5)
+    assert fired == [1.2]
+    wheel.advance(10.0)
+    assert fired == [1.2]
+    assert wheel.pending == 0
+
+
+def test_wheel_handles_timers_further_out_than_one_turn():
+    wheel = TimerWheel(tick=1.0, slots=4)
+    fired = []
+    wheel.schedule(3.0, fired.append)
+    wheel.schedule(10.0, fired.append)
+    wheel.advance(5.0)
+    assert fired == [3.0]
+    wheel.advance(10.0)
+    assert fired == [3.0, 10.0]
+
+
+def test_wheel_cancel():
+    wheel = TimerWheel(tick=0.5)
+    fired = []
+    timer = wheel.schedule(2.0, fired.append)
+    wheel.cancel(timer)
+    wheel.cancel(timer)
+    assert wheel.pending == 0
+    wheel.advance(5.0)
+    assert fired == []
+
+
+# --- OccupancyEngine ---
+def test_flags_after_the_countdown():
+    engine, clock, received = make_engine(Motion=SignalRule(60))
+    assert kinds(engine.observe('r1', 'Motion', True)) == [('Motion', 'started')]
+    assert engine.state('r1', 'Motion') == PENDING
+    assert engine.remaining('r1', 'Motion') == 60
+    clock.now += 59
+    assert engine.observe('r1', 'Motion', True) == []
+    clock.now += 1
+    assert kinds(engine.observe('r1', 'Motion', True)) == [('Motion', 'flagged')]
+    assert engine.state('r1', 'Motion') == FLAGGED
+    assert kinds(received) == [('Motion', 'started'), ('Motion', 'flagged')]
+
+
+def test_inactive_signal_cancels_the_countdown():
+    engine, clock, _ = make_engine(Motion=SignalRule(60))
+    engine.observe('r1', 'Motion', True)
+    clock.now += 30
+    assert kinds(engine.observe('r1', 'Motion', False)) == [('Motion', 'cancelled')]
+    clock.now += 60
+    assert engine.advance() == []
+    assert engine.state('r1', 'Motion') == IDLE
+
+
+def test_numeric_hysteresis():
+    engine, clock, _ = make_engine(Light=SignalRule(60, on=110, off=100))
+    engine.observe('r1', 'Light', 105)
+    assert not engine.active('r1', 'Light')
+    engine.observe('r1', 'Light', 115)
+    assert engine.active('r1', 'Light')
+    # Between off and on: stays on
+    engine.observe('r1', 'Light', 105)
+    assert engine.active('r1', 'Light')
+    assert engine.state('r1', 'Light') == PENDING
+    assert kinds(engine.observe('r1', 'Light', 95)) == [('Light', 'cancelled')]
+    assert not engine.active('r1', 'Light')
+
+
+def test_clear_after_rides_out_short_gaps():
+    engine, clock, _ = make_engine(Human=SignalRule(60, clear_after=10))
+    engine.observe('r1', 'Human', True)
+    clock.now += 20
+    assert engine.observe('r1', 'Human', False) == []
+    assert engine.state('r1', 'Human') == CLEARING
+    clock.now += 5
+    engine.observe('r1', 'Human', True)
+    assert engine.state('r1', 'Human') == PENDING
+    clock.now += 35
+    assert kinds(engine.advance()) == [('Human', 'flagged')]
+
+
+def test_clear_after_cancels_once_the_gap_is_long_enough():
+    engine, clock, _ = make_engine(Human=SignalRule(60, clear_after=10))
+    engine.observe('r1', 'Human', True)
+    clock.now += 20
+    engine.observe('r1', 'Human', False)
+    clock.now += 10
+    assert kinds(engine.advance()) == [('Human', 'cancelled')]
+    assert engine.state('r1', 'Human') == IDLE
+
+
+def test_flag_due_during_a_gap_fires_when_the_signal_returns():
+    engine, clock, _ = make_engine(Human=SignalRule(60, clear_after=10))
+    engine.observe('r1', 'Human', True)
+    clock.now += 55
+    engine.observe('r1', 'Human', False)
+    clock.now += 6
+    assert engine.advance() == []
+    assert kinds(engine.observe('r1', 'Human', True)) == [('Human', 'flagged')]
+
+
+def test_flag_is_cleared_when_the_signal_goes_away():
+    engine, clock, _ = make_engine(Motion=SignalRule(60))
+    engine.observe('r1', 'Motion', True)
+    clock.now += 60
+    engine.advance()
+    assert kinds(engine.observe('r1', 'Motion', False)) == [('Motion', 'cleared')]
+
+
+def test_repeat_flags_again_while_active():
+    engine, clock, _ = make_engine(Presence=SignalRule(300, repeat=300))
+    engine.observe('r1', 'Presence', True)
+    flags = []
+    for _ in range(4):
+        clock.now += 300
+        flags += [e.at for e in engine.observe('r1', 'Presence', True) if e.kind == 'flagged']
+    assert flags == [1300.0, 1600.0, 1900.0, 2200.0]
+
+
+def test_zero_flag_after_flags_at_once():
+    engine, clock, _ = make_engine(Human=SignalRule(0))
+    assert kinds(engine.observe('r1', 'Human', True)) == [('Human', 'started'), ('Human', 'flagged')]
+
+
+def test_reset_drops_countdowns_without_events():
+    engine, clock, received = make_engine(Motion=SignalRule(60), Light=SignalRule(60))
+    engine.observe_all('r1', {'Motion': True, 'Light': True})
+    engine.observe('r2', 'Motion', True)
+    engine.reset('r1')
+    assert engine.state('r1', 'Motion') == IDLE
+    assert engine.remaining('r1', 'Light') is None
+    clock.now += 60
+    assert kinds(engine.advance()) == [('Motion', 'flagged')]
+    assert [e.room for e in received if e.kind == 'flagged'] == ['r2']
+
+
+def test_rooms_can_have_their_own_rules():
+    engine, clock, _ = make_engine(Motion=SignalRule(60))
+    engine.set_rules('lab', {'Motion': SignalRule(10)})
+    engine.observe('lab', 'Motion', True)
+    engine.observe('r1', 'Motion', True)
+    clock.now += 10
+    assert [e.room for e in engine.advance()] == ['lab']
+
+
+def test_call_later_runs_on_the_engine_clock():
+    engine, clock, _ = make_engine()
+    calls = []
+    engine.call_later(5, lambda: calls.append(clock.now))
+    clock.now += 4
+    engine.advance()
+    assert calls == []
+    clock.now += 1
+    engine.advance()
+    assert calls == [1005.0]
+    timer = engine.call_later(5, lambda: calls.append('cancelled'))
+    engine.wheel.cancel(timer)
+    clock.now += 10
+    engine.advance()
+    assert calls == [1005.0]
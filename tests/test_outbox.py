@@ -0,0 +1,123 @@
+import time
+
+import pytest
+import requests
+
+from outbox import Outbox, OutboxSender, PermanentError
+
+FAR_FUTURE = float('inf')
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox.db'))
+    yield outbox
+    outbox.close()
+
+
+class Receiver:
+    # Handler failing with `error` until told otherwise; keeps every event it saw
+    def __init__(self, error=None):
+        self.error = error
+        self.seen = []
+
+    def __call__(self, event):
+        self.seen.append(event)
+        if self.error is not None:
+            raise self.error
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status}", response=response)
+
+
+def test_events_survive_reopening(tmp_path):
+    path = str(tmp_path / 'outbox.db')
+    outbox = Outbox(path)
+    event_id = outbox.put('flag_schedule', {'room_id': 7})
+    outbox.close()
+
+    reopened = Outbox(path)
+    events = reopened.due(10)
+    assert [(e.event_id, e.kind, e.payload, e.attempts) for e in events] == [
+        (event_id, 'flag_schedule', {'room_id': 7}, 0)]
+    reopened.close()
+
+
+def test_delivered_events_are_removed(outbox):
+    receiver = Receiver()
+    outbox.put('flag', {'n': 1})
+    assert OutboxSender(outbox, {'flag': receiver}).send_batch(outbox.due(10)) == 1
+    assert outbox.pending() == 0
+
+
+def test_failures_back_off(outbox):
+    sender = OutboxSender(outbox, {'flag': Receiver(ConnectionError("down"))},
+                          base_delay=10, max_delay=100)
+    outbox.put('flag', {})
+    for attempts in range(6):
+        before = time.time()
+        sender.send_batch(outbox.due(10, now=FAR_FUTURE))
+        delay = min(100, 10 * 2 ** attempts)
+        assert before + delay * 0.5 <= outbox.next_due_at() <= time.time() + delay
+    assert outbox.due(10, now=FAR_FUTURE)[0].attempts == 6
+
+
+def test_deferred_events_keep_their_attempts(outbox):
+    receiver = Receiver(ConnectionError("down"))
+    sender = OutboxSender(outbox, {'flag': receiver})
+    for n in range(3):
+        outbox.put('flag', {'n': n})
+    sender.send_batch(outbox.due(10))
+    # Only the first was tried; the others were pushed back untouched
+    assert len(receiver.seen) == 1
+    attempts = {e.payload['n']: e.attempts for e in outbox.due(10, now=FAR_FUTURE)}
+    assert attempts == {0: 1, 1: 0, 2: 0}
+    assert outbox.next_due_at() > time.time()
+
+
+def test_retries_reuse_the_event_id(outbox):
+    receiver = Receiver(ConnectionError("down"))
+    sender = OutboxSender(outbox, {'flag': receiver})
+    event_id = outbox.put('flag', {})
+    sender.send_batch(outbox.due(10))
+    sender.send_batch(outbox.due(10, now=FAR_FUTURE))
+    receiver.error = None
+    assert sender.send_batch(outbox.due(10, now=FAR_FUTURE)) == 1
+    assert [e.event_id for e in receiver.seen] == [event_id] * 3
+
+
+def test_long_outage_buries_nothing(outbox):
+    errors = [ConnectionError("refused"), requests.Timeout("timed out"), http_error(503),
+              http_error(429)]
+    receiver = Receiver()
+    sender = OutboxSender(outbox, {'flag': receiver}, max_delay=300)
+    outbox.put('flag', {})
+    for attempt in range(2000):
+        receiver.error = errors[attempt % len(errors)]
+        sender.send_batch(outbox.due(10, now=FAR_FUTURE))
+    assert outbox.pending() == 1
+    assert outbox.dead_count() == 0
+    assert outbox.next_due_at() <= time.time() + 300
+    receiver.error = None
+    assert sender.send_batch(outbox.due(10, now=FAR_FUTURE)) == 1
+
+
+@pytest.mark.parametrize('error', [http_error(400), http_error(422), PermanentError("bad payload")])
+def test_permanent_failures_are_buried(outbox, error):
+    sender = OutboxSender(outbox, {'flag': Receiver(error)})
+    outbox.put('flag', {})
+    outbox.put('flag', {})
+    sender.send_batch(outbox.due(10))
+    # A rejected event says nothing about the receiver: the next one is tried too
+    assert outbox.pending() == 0
+    assert outbox.dead_count() == 2
+
+
+def test_unknown_kind_is_buried(outbox):
+    outbox.put('mystery', {})
+    OutboxSender(outbox, {}).send_batch(outbox.due(10))
+    assert outbox.pending() == 0
+    assert outbox.dead_count() == 1
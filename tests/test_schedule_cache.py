@@ -0,0 +1,106 @@
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from schedule_cache import UNKNOWN, ScheduleCache, ScheduleIndex, ScheduleEntry
+
+MONDAY_9 = datetime.datetime(2026, 10, 19, 9, 0)
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=1)
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def test_index_lookup_with_overlaps():
+    index = ScheduleIndex([ScheduleEntry(0, 7200, 'Using', 1),
+                           ScheduleEntry(3600, 3900, 'Occupied', 2),
+                           ScheduleEntry(10000, 11000, 'Available', 3)])
+    assert index.lookup(3700).schedule_id == 2
+    assert index.lookup(5000).schedule_id == 1
+    assert index.lookup(9000) is None
+
+
+def test_first_lookup_waits_for_the_load_with_an_executor(executor):
+    calls = []
+
+    def loader(room_id, day):
+        calls.append((room_id, day, threading.current_thread().name))
+        return [(1, '08:00:00', '10:00:00', 'Occupied')]
+
+    cache = ScheduleCache(loader, executor=executor)
+    assert cache.status(7, MONDAY_9) == 'Occupied'
+    assert calls[0][:2] == (7, 1)
+
+
+def test_expired_entries_answer_while_reloading(executor):
+    release = threading.Event()
+    rows = [[(1, '08:00:00', '10:00:00', 'Using')], [(1, '08:00:00', '10:00:00', 'Flagged')]]
+
+    def loader(room_id, day):
+        if len(rows) == 1:
+            release.wait(2)
+        return rows.pop(0)
+
+    cache = ScheduleCache(loader, executor=executor)
+    assert cache.status(7, MONDAY_9) == 'Using'
+    cache.invalidate(7)
+    # The reload blocks in the background; the old schedule still answers
+    assert cache.status(7, MONDAY_9) == 'Using'
+    release.set()
+    executor.submit(lambda: None).result()
+    assert cache.status(7, MONDAY_9) == 'Flagged'
+
+
+def test_unknown_schedule_uses_the_fallback():
+    def loader(room_id, day):
+        raise IOError("no such endpoint")
+
+    assert ScheduleCache(loader).status(7, MONDAY_9) == UNKNOWN
+    fallback = ScheduleCache(loader, fallback=lambda room_id, when: 'Occupied')
+    assert fallback.status(7, MONDAY_9) == 'Occupied'
+
+
+def test_failed_reload_keeps_the_last_good_schedule():
+    rows = [[(1, '08:00:00', '10:00:00', 'Using')]]
+
+    def loader(room_id, day):
+        if not rows:
+            raise IOError("backend down")
+        return rows.pop(0)
+
+    cache = ScheduleCache(loader)
+    assert cache.status(7, MONDAY_9) == 'Using'
+    cache.invalidate(7)
+    assert cache.status(7, MONDAY_9) == 'Using'
+    assert cache.status(7, MONDAY_9.replace(hour=11)) is None
+
+
+def test_fallback_answer_is_reused_for_the_retry_delay():
+    calls = []
+
+    def loader(room_id, day):
+        raise IOError("no such endpoint")
+
+    def fallback(room_id, when):
+        calls.append(when)
+        if len(calls) == 3:
+            raise IOError("backend down")
+        return 'Occupied'
+
+    cache = ScheduleCache(loader, retry_delay=30, fallback=fallback)
+    for _ in range(5):
+        assert cache.status(7, MONDAY_9) == 'Occupied'
+    assert len(calls) == 1
+    # A time outside the window asks again
+    assert cache.status(7, MONDAY_9.replace(hour=11)) == 'Occupied'
+    assert len(calls) == 2
+    # So does a flag, and a failure is remembered like an answer
+    cache.invalidate(7)
+    assert cache.status(7, MONDAY_9) == UNKNOWN
+    assert cache.status(7, MONDAY_9) == UNKNOWN
+    assert len(calls) == 3
@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from shm_pipeline import SharedRing
+
+NAME = f'roommon_test_{os.getpid()}'
+
+
+def test_ring_round_trip():
+    ring = SharedRing(NAME, 4, (2, 3), create=True)
+    try:
+        reader = SharedRing.attach(ring.spec())
+        seq, slot = ring.begin_write()
+        assert reader.read(seq) is None
+        slot[:] = 7
+        ring.commit(seq, 6)
+        assert reader.newest() == seq
+        assert reader.read(seq).tolist() == [[7, 7, 7], [7, 7, 7]]
+        assert reader.length(seq) == 6
+        reader.close()
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def dead_pid():
+    child = subprocess.Popen([sys.executable, '-c', 'pass'])
+    child.wait()
+    return child.pid
+
+
+@pytest.mark.parametrize('owner', [None, -1])
+def test_stale_segment_from_a_killed_run_is_replaced(owner):
+    stale = shared_memory.SharedMemory(name=NAME, create=True, size=16)
+    stale.buf[:8] = np.int64(dead_pid() if owner is None else owner).tobytes()
+    stale.buf[8:16] = b'\xff' * 8
+    stale.close()
+
+    ring = SharedRing(NAME, 4, (2, 3), create=True)
+    try:
+        assert ring.newest() == 0
+        assert (ring.slot_seq == -1).all()
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def test_segment_of_a_running_owner_is_left_alone():
+    ring = SharedRing(NAME, 4, (2, 3), create=True)
+    try:
+        seq, slot = ring.begin_write()
+        ring.commit(seq)
+        with pytest.raises(FileExistsError, match=str(os.getpid())):
+            SharedRing(NAME, 4, (2, 3), create=True)
+        assert ring.newest() == seq
+    finally:
+        ring.close()
+        ring.unlink()
@@ -0,0 +1,81 @@
+import types
+
+import numpy as np
+
+from supervisor import Supervisor
+
+
+class GatedStub:
+    # Stands in for a room's MotionGatedDetector
+    def __init__(self, fail_prepare=False):
+        self.fail_prepare = fail_prepare
+        self.rects, self.weights = [(1, 2, 3, 4)], [0.5]
+
+    def prepare(self, frame):
+        if self.fail_prepare:
+            raise ValueError("bad frame")
+        return frame, 'full'
+
+    def finish(self, rects, weights, full):
+        self.rects, self.weights = rects, weights
+
+
+class RoomStub:
+    def __init__(self, code, fail_prepare=False, fail_update=False):
+        self.code = code
+        self.config = {'decode_reduce': 1}
+        self.detector = GatedStub(fail_prepare)
+        self.fail_update = fail_update
+        self.busy = True
+        self.updates = []
+
+    def update(self, seq, frame, rects, weights):
+        if self.fail_update:
+            raise RuntimeError("update failed")
+        self.updates.append((seq, rects))
+
+
+class BatchStub:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+
+    def detect_batch(self, images):
+        if self.fail:
+            raise RuntimeError("model error")
+        self.batches.append(len(images))
+        return [([(10, 10, 20, 40)], [0.9])] * len(images)
+
+
+def run_batch(rooms, detector):
+    supervisor = types.SimpleNamespace(detector=detector)
+    frame = np.zeros((24, 32, 3), np.uint8)
+    Supervisor.analyse_batch(supervisor, [(room, 7, frame) for room in rooms])
+
+
+def test_one_failing_room_does_not_stop_the_batch():
+    bad_prepare = RoomStub('A', fail_prepare=True)
+    bad_update = RoomStub('B', fail_update=True)
+    good = RoomStub('C')
+    detector = BatchStub()
+    run_batch([bad_prepare, bad_update, good], detector)
+    assert detector.batches == [2]
+    assert bad_prepare.updates == []
+    assert good.updates == [(7, [(10, 10, 20, 40)])]
+    assert not any(room.busy for room in (bad_prepare, bad_update, good))
+
+
+def test_a_failed_batch_keeps_the_previous_boxes():
+    rooms = [RoomStub('A'), RoomStub('B')]
+    run_batch(rooms, BatchStub(fail=True))
+    assert [room.updates for room in rooms] == [[(7, [(1, 2, 3, 4)])]] * 2
+    assert not any(room.busy for room in rooms)
+
+
+def test_tuned_detector_settings_need_one_analysis_size():
+    detector = {'backend': 'hog', 'tuned': 'hog_tuned.json'}
+    same = {'detector': detector, 'rooms': [{'code': 'A'}, {'code': 'B', 'analysis_size': [320, 240]}]}
+    assert Supervisor._detector_config(same) == (detector, (320, 240))
+    mixed = {'detector': detector, 'rooms': [{'code': 'A'}, {'code': 'B', 'analysis_size': [640, 480]}]}
+    assert Supervisor._detector_config(mixed) == ({'backend': 'hog'}, None)
+    assert detector['tuned'] == 'hog_tuned.json'
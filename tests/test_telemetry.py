@@ -0,0 +1,42 @@
+from telemetry import PRUNE_EVERY, RoomTelemetry, TelemetryStore
+
+DAY = 86400
+START = 1_700_000_000 - 1_700_000_000 % DAY
+
+
+def fill(telemetry, start, seconds, step=60):
+    for t in range(start, start + seconds, step):
+        telemetry.record(t, brightness=120.0, motion_area=10, humans=1, status='Using')
+
+
+def test_raw_records_expire_after_retention(tmp_path):
+    telemetry = RoomTelemetry(str(tmp_path / 'room'), raw_retention=DAY)
+    fill(telemetry, START, 3 * DAY + 2 * 3600)
+    end = START + 3 * DAY + 2 * 3600
+    oldest = float(telemetry.raw.records['t'][0])
+    assert oldest >= end - DAY - PRUNE_EVERY - 3600
+    assert len(telemetry.raw) < 3 * 1440
+    # The rollups still cover everything
+    assert telemetry.utilization(START, end)['samples'] == 3 * 1440 + 120
+    assert telemetry.query(START, START + 3600, 'hour')[0]['samples'] == 60
+
+
+def test_pruned_log_survives_reopening(tmp_path):
+    path = str(tmp_path / 'room')
+    telemetry = RoomTelemetry(path, raw_retention=DAY)
+    fill(telemetry, START, 3 * DAY)
+    kept = telemetry.query(resolution='raw')
+    telemetry.flush()
+
+    reopened = RoomTelemetry(path, raw_retention=DAY)
+    assert (reopened.query(resolution='raw') == kept).all()
+    reopened.record(START + 3 * DAY, brightness=0.0, motion_area=0, humans=0, status=None)
+    assert len(reopened.raw) == len(kept) + 1
+
+
+def test_recent_records_are_kept(tmp_path):
+    store = TelemetryStore(str(tmp_path), raw_retention=7 * DAY)
+    for t in range(START, START + 2 * DAY, 60):
+        store.record('r1', brightness=100.0, t=t)
+    assert len(store.query('r1')) == 2 * 1440
+    store.close()
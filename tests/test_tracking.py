@@ -0,0 +1,129 @@
+import numpy as np
+
+from tracking import IouTracker, TrackingDetector, iou, non_max_suppression
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def ids(tracks):
+    return [track.id for track in tracks]
+
+
+# --- NMS ---
+def test_nms_merges_overlapping_boxes():
+    rects = [(10, 10, 40, 80), (12, 12, 40, 80), (200, 10, 40, 80)]
+    kept, weights = non_max_suppression(rects, [0.5, 0.9, 0.7])
+    assert kept == [(12, 12, 40, 80), (200, 10, 40, 80)]
+    assert weights == [0.9, 0.7]
+    assert non_max_suppression([], []) == ([], [])
+
+
+def test_iou():
+    assert iou((0, 0, 10, 10), (0, 0, 10, 10)) == 1.0
+    assert iou((0, 0, 10, 10), (5, 0, 10, 10)) == 50 / 150
+    assert iou((0, 0, 10, 10), (10, 0, 10, 10)) == 0.0
+
+
+# --- IouTracker ---
+def test_ids_are_stable_across_rounds():
+    tracker = IouTracker()
+    first = tracker.update([(10, 10, 40, 80), (200, 10, 40, 80)], [1.0, 1.0], now=0.0)
+    second = tracker.update([(205, 12, 40, 80), (14, 10, 40, 80)], [1.0, 1.0], now=1.0)
+    assert ids(first) == [1, 2]
+    assert sorted((t.id, t.rect) for t in second) == [(1, (14, 10, 40, 80)), (2, (205, 12, 40, 80))]
+    assert all(t.dwell == 1.0 for t in second)
+
+
+def test_a_fast_mover_keeps_its_id_by_centroid():
+    tracker = IouTracker(max_shift=0.5)
+    tracker.update([(10, 10, 40, 80)], [1.0], now=0.0)
+    # Moved a full box width: no overlap, but the centroid is within 0.5 heights
+    moved = tracker.update([(50, 10, 40, 80)], [1.0], now=1.0)
+    assert ids(moved) == [1]
+    # Too far for either: a new person
+    jumped = tracker.update([(250, 10, 40, 80)], [1.0], now=2.0)
+    assert ids(jumped) == [2]
+
+
+def test_tracks_are_dropped_after_max_misses():
+    tracker = IouTracker(max_misses=2)
+    tracker.update([(10, 10, 40, 80)], [1.0], now=0.0)
+    for now in (1.0, 2.0):
+        assert tracker.update([], [], now) == []
+        assert ids(tracker.tracks) == [1]
+    tracker.update([], [], now=3.0)
+    assert tracker.tracks == []
+    assert ids(tracker.update([(10, 10, 40, 80)], [1.0], now=4.0)) == [2]
+
+
+def test_dwell_carries_over_a_single_missed_round():
+    tracker = IouTracker(max_misses=2)
+    tracker.update([(10, 10, 40, 80)], [1.0], now=0.0)
+    assert tracker.update([], [], now=1.0) == []
+    back = tracker.update([(12, 10, 40, 80)], [1.0], now=2.0)
+    assert ids(back) == [1]
+    assert back[0].dwell == 2.0
+
+
+def test_min_hits_hides_new_tracks():
+    tracker = IouTracker(min_hits=2)
+    assert tracker.update([(10, 10, 40, 80)], [1.0], now=0.0) == []
+    assert ids(tracker.update([(10, 10, 40, 80)], [1.0], now=1.0)) == [1]
+
+
+# --- TrackingDetector ---
+def textured_frame(x):
+    # Grey background with a random-texture block at column x
+    frame = np.full((240, 320, 3), 90, np.uint8)
+    block = np.random.default_rng(7).integers(0, 255, (80, 40), dtype=np.uint8)
+    frame[60:140, x:x + 40] = block[..., None]
+    return frame
+
+
+class StubDetector:
+    def __init__(self, rects):
+        self.rects = rects
+        self.calls = 0
+
+    def __call__(self, image):
+        assert image.shape == (240, 320, 3)
+        self.calls += 1
+        return list(self.rects), [1.0] * len(self.rects)
+
+
+def test_detects_every_nth_call_and_propagates_in_between():
+    detect = StubDetector([(100, 60, 40, 80)])
+    clock = Clock()
+    tracking = TrackingDetector(detect, every=3, clock=clock)
+    for call in range(7):
+        clock.now += 1.0
+        tracking(textured_frame(100 + 2 * call))
+    assert detect.calls == 3  # calls 0, 3 and 6
+    assert (tracking.full_runs, tracking.propagated) == (3, 4)
+    assert [t.id for t in tracking.tracks] == [1]
+    assert tracking.longest_dwell() == 6.0
+
+
+def test_propagation_follows_the_moving_box():
+    detect = StubDetector([(100, 60, 40, 80)])
+    tracking = TrackingDetector(detect, every=10, clock=Clock())
+    tracking(textured_frame(100))
+    rects, weights = tracking(textured_frame(106))
+    assert detect.calls == 1
+    x, y, w, h = rects[0]
+    assert abs(x - 106) <= 1 and abs(y - 60) <= 1
+    assert (w, h) == (40, 80)
+    assert weights == [1.0]
+
+
+def test_frames_are_resized_to_the_analysis_size():
+    detect = StubDetector([])
+    tracking = TrackingDetector(detect, size=(320, 240))
+    assert tracking(np.zeros((480, 640, 3), np.uint8)) == ([], [])
+    assert tracking.longest_dwell() == 0.0
@@ -0,0 +1,209 @@
+import itertools
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+def iou(a, b):
+    # Intersection over union of two (x, y, w, h) boxes
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    w = min(ax + aw, bx + bw) - max(ax, bx)
+    h = min(ay + ah, by + bh) - max(ay, by)
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+def non_max_suppression(rects, weights, overlap=0.5):
+    # Greedy NMS: keeps the highest-weight box of every group overlapping by
+    # more than `overlap` IoU, so one person gives one box
+    if len(rects) == 0:
+        return [], []
+    boxes = np.array(rects, dtype=np.float64).reshape(-1, 4)
+    scores = np.array(weights, dtype=np.float64).ravel() if len(weights) else np.ones(len(boxes))
+    x1, y1 = boxes[:, 0], boxes[:, 1]
+    x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+    order = np.argsort(-scores)
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        w = np.clip(np.minimum(x2[i], x2[order[1:]]) - np.maximum(x1[i], x1[order[1:]]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[order[1:]]) - np.maximum(y1[i], y1[order[1:]]), 0, None)
+        inter = w * h
+        overlaps = inter / (areas[i] + areas[order[1:]] - inter)
+        order = order[1:][overlaps <= overlap]
+    return ([tuple(int(v) for v in boxes[i]) for i in keep],
+            [float(scores[i]) for i in keep])
+
+
+# --- Tracks ---
+class Track:
+    __slots__ = ('id', 'rect', 'weight', 'first_seen', 'last_seen', 'hits', 'misses')
+
+    def __init__(self, track_id, rect, weight, now):
+        self.id = track_id
+        self.rect = rect
+        self.weight = weight
+        self.first_seen = now
+        self.last_seen = now
+        self.hits = 1
+        self.misses = 0
+
+    @property
+    def dwell(self):
+        # Seconds this person has been tracked
+        return self.last_seen - self.first_seen
+
+    def as_dict(self):
+        return {'id': self.id, 'rect': list(self.rect), 'dwell': round(self.dwell, 1)}
+
+
+# --- IoU/centroid tracker ---
+# Matches each round of detections to the existing tracks: greedily by IoU,
+# then by centroid distance (within max_shift box heights) for boxes that
+# moved too far to overlap. Matched tracks keep their id; a track missed by
+# more than max_misses detection rounds is dropped; leftovers start new
+# tracks. Detections are NMS-merged first. Tracks are shown once they have
+# min_hits detections behind them.
+class IouTracker:
+    def __init__(self, iou_threshold=0.3, max_shift=0.5, max_misses=2, min_hits=1,
+                 nms_overlap=0.5):
+        self.iou_threshold = iou_threshold
+        self.max_shift = max_shift
+        self.max_misses = max_misses
+        self.min_hits = min_hits
+        self.nms_overlap = nms_overlap
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def update(self, rects, weights, now):
+        rects, weights = non_max_suppression(rects, weights, self.nms_overlap)
+        tracks = list(self.tracks)
+
+        candidates = []
+        for ti, track in enumerate(tracks):
+            tx, ty, tw, th = track.rect
+            for di, rect in enumerate(rects):
+                overlap = iou(track.rect, rect)
+                if overlap >= self.iou_threshold:
+                    candidates.append((1.0 + overlap, ti, di))
+                    continue
+                x, y, w, h = rect
+                distance = np.hypot((x + w / 2) - (tx + tw / 2), (y + h / 2) - (ty + th / 2))
+                limit = self.max_shift * th
+                if distance <= limit:
+                    candidates.append((1.0 - distance / (limit + 1.0), ti, di))
+
+        matched_tracks, matched_rects = set(), set()
+        for _, ti, di in sorted(candidates, reverse=True):
+            if ti in matched_tracks or di in matched_rects:
+                continue
+            matched_tracks.add(ti)
+            matched_rects.add(di)
+            track = tracks[ti]
+            track.rect, track.weight = rects[di], weights[di]
+            track.last_seen = now
+            track.hits += 1
+            track.misses = 0
+
+        survivors = []
+        for ti, track in enumerate(tracks):
+            if ti not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    continue
+            survivors.append(track)
+        for di, rect in enumerate(rects):
+            if di not in matched_rects:
+                survivors.append(Track(next(self._ids), rect, weights[di], now))
+        self.tracks = survivors
+        return self.visible()
+
+    def visible(self):
+        return [t for t in self.tracks if t.hits >= self.min_hits and t.misses == 0]
+
+
+# --- Detect every N frames, track in between ---
+# Callable like MotionGatedDetector (and usable as the DetectionWorker's
+# detect): every `every`-th call runs the wrapped detector and re-matches
+# tracks; the calls in between move each box by the median Lucas-Kanade
+# flow of corner points inside it, about 1-2 ms at 320x240 against tens of
+# ms for HOG. Boxes whose points can't be followed stay where they were
+# until the next detection. Returns (rects, weights) of the visible tracks
+# in analysis-size pixels; `tracks` has their ids and dwell times.
+class TrackingDetector:
+    def __init__(self, detect, size=(320, 240), every=5, tracker=None, max_points=20,
+                 clock=time.monotonic):
+        self.detect = detect
+        self.size = tuple(size)
+        self.every = max(1, int(every))
+        self.tracker = tracker or IouTracker()
+        self.max_points = max_points
+        self.clock = clock
+        self.tracks = []
+        self.prev_gray = None
+        self.full_runs = 0
+        self.propagated = 0
+        self._calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, frame):
+        image = frame if frame.shape[1::-1] == self.size else cv2.resize(frame, self.size)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        with self._lock:
+            now = self.clock()
+            if self.prev_gray is None or self._calls % self.every == 0:
+                rects, weights = self.detect(image)
+                self.tracks = self.tracker.update(rects, weights, now)
+                self.full_runs += 1
+            else:
+                self._propagate(self.prev_gray, gray, now)
+                self.propagated += 1
+            self._calls += 1
+            self.prev_gray = gray
+            return [t.rect for t in self.tracks], [t.weight for t in self.tracks]
+
+    def longest_dwell(self):
+        # Seconds the longest-present visible person has been tracked (0 if nobody)
+        return max((t.dwell for t in self.tracks), default=0.0)
+
+    def _propagate(self, prev_gray, gray, now):
+        points, owners = [], []
+        height, width = gray.shape[:2]
+        for index, track in enumerate(self.tracks):
+            x, y, w, h = track.rect
+            x0, y0 = max(0, x), max(0, y)
+            x1, y1 = min(width, x + w), min(height, y + h)
+            if x1 - x0 < 8 or y1 - y0 < 8:
+                continue
+            corners = cv2.goodFeaturesToTrack(prev_gray[y0:y1, x0:x1], self.max_points, 0.01, 3)
+            if corners is None:
+                continue
+            corners = corners.reshape(-1, 2) + (x0, y0)
+            points.append(corners)
+            owners.extend([index] * len(corners))
+        if not points:
+            return
+
+        start = np.concatenate(points).astype(np.float32).reshape(-1, 1, 2)
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, start, None,
+                                                    winSize=(15, 15), maxLevel=2)
+        owners = np.array(owners)
+        ok = status.ravel() == 1
+        shifts = (moved - start).reshape(-1, 2)
+        for index, track in enumerate(self.tracks):
+            mine = ok & (owners == index)
+            if np.count_nonzero(mine) < 3:
+                continue
+            dx, dy = np.median(shifts[mine], axis=0)
+            x, y, w, h = track.rect
+            x = int(round(min(max(x + dx, -w / 2), width - w / 2)))
+            y = int(round(min(max(y + dy, -h / 2), height - h / 2)))
+            track.rect = (x, y, w, h)
+            track.last_seen = now
@@ -0,0 +1,220 @@
+import argparse
+import datetime
+import glob
+import itertools
+import json
+import os
+import platform
+import time
+
+import cv2
+
+from detectors import HogDetector
+from frame_sources import ReplaySource
+from tracking import iou, non_max_suppression
+
+
+# --- HOG auto-tuner ---
+# Sweeps HOG settings over a few labeled local clips on this CPU, reports
+# precision/recall against fps for each, and writes the best config on the
+# precision/recall-vs-speed Pareto front that still runs at --min-fps to a
+# file create_detector() reads at startup ({'backend': 'hog', 'tuned':
+# 'hog_tuned.json'}).
+#
+#   python tune_hog.py clips/ --base 320x240 --min-fps 5 --out hog_tuned.json
+#
+# Every clip (video file or image directory) has a <clip>.labels.json next to
+# it with the people boxes of the frames that were labeled; frames with
+# nobody in them should be listed with [] so false positives count:
+#
+#   {"size": [640, 480], "frames": {"0": [[120, 40, 80, 200]], "30": []}}
+#
+# "size" is the pixel space of the boxes (default: the clip's own). Frames are
+# scaled to --base, the size the monitoring script hands the detector; the
+# swept resolution is HogDetector's resize factor on top of that, so a tuned
+# file belongs to one base size.
+
+LABELS_SUFFIX = '.labels.json'
+
+
+def find_clips(paths):
+    clips = []
+    for path in paths:
+        if path.endswith(LABELS_SUFFIX):
+            clips.append(path[:-len(LABELS_SUFFIX)])
+        elif os.path.exists(path + LABELS_SUFFIX):
+            clips.append(path)
+        elif os.path.isdir(path):
+            clips.extend(p[:-len(LABELS_SUFFIX)]
+                         for p in sorted(glob.glob(os.path.join(path, '*' + LABELS_SUFFIX))))
+    if not clips:
+        raise SystemExit(f"no labeled clips (*{LABELS_SUFFIX}) found in {paths}")
+    return clips
+
+
+def load_labeled_frames(clip, base):
+    # [(image at base size, [boxes at base size])] for the labeled frames
+    with open(clip + LABELS_SUFFIX) as f:
+        labels = json.load(f)
+    wanted = {int(k): v for k, v in labels['frames'].items()}
+    source = ReplaySource(clip, preload=False)
+    samples = []
+    index = 0
+    while wanted and index <= max(wanted):
+        ok, frame = source.read()
+        if not ok:
+            break
+        if index in wanted:
+            width, height = labels.get('size') or frame.shape[1::-1]
+            fx, fy = base[0] / width, base[1] / height
+            boxes = [(x * fx, y * fy, w * fx, h * fy) for x, y, w, h in wanted[index]]
+            samples.append((cv2.resize(frame, base), boxes))
+        index += 1
+    source.release()
+    return samples
+
+
+def score(found, truth, min_iou):
+    # Greedy one-to-one matching by IoU: (true positives, false positives, misses)
+    pairs = sorted(((iou(f, t), i, j) for i, f in enumerate(found) for j, t in enumerate(truth)),
+                   reverse=True)
+    used_found, used_truth = set(), set()
+    for overlap, i, j in pairs:
+        if overlap < min_iou:
+            break
+        if i in used_found or j in used_truth:
+            continue
+        used_found.add(i)
+        used_truth.add(j)
+    tp = len(used_found)
+    return tp, len(found) - tp, len(truth) - tp
+
+
+def evaluate(params, samples, min_iou, nms_overlap):
+    detector = HogDetector(**params)
+    detector.detect(samples[0][0])  # warm up the descriptor
+    tp = fp = fn = 0
+    elapsed = 0.0
+    for image, truth in samples:
+        started = time.perf_counter()
+        rects, weights = detector.detect(image)
+        elapsed += time.perf_counter() - started
+        rects, _ = non_max_suppression(rects, weights, nms_overlap)
+        t, f, n = score(rects, truth, min_iou)
+        tp, fp, fn = tp + t, fp + f, fn + n
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {
+        'params': params,
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'fps': len(samples) / elapsed if elapsed else 0.0,
+    }
+
+
+def pareto_front(results):
+    # Configs no other config beats on both F1 and fps
+    front = []
+    for r in results:
+        dominated = any(o['f1'] >= r['f1'] and o['fps'] >= r['fps']
+                        and (o['f1'] > r['f1'] or o['fps'] > r['fps']) for o in results)
+        if not dominated:
+            front.append(r)
+    return sorted(front, key=lambda r: r['fps'])
+
+
+def cpu_name():
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith(('model name', 'Model')):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def floats(text):
+    return [float(v) for v in text.split(',')]
+
+
+def ints(text):
+    return [int(v) for v in text.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Tune HOG people detection on labeled clips")
+    parser.add_argument('clips', nargs='+', help="clips, their label files, or directories of them")
+    parser.add_argument('--base', default='320x240', help="image size the detector is given")
+    parser.add_argument('--resize', type=floats, default=[1.0, 1.5, 2.0], help="HOG resize factors")
+    parser.add_argument('--win-stride', type=ints, default=[4, 8])
+    parser.add_argument('--padding', type=ints, default=[8, 16])
+    parser.add_argument('--scale', type=floats, default=[1.02, 1.05, 1.1])
+    parser.add_argument('--hit-threshold', type=floats, default=[0.0, 0.3, 0.6])
+    parser.add_argument('--iou', type=float, default=0.4, help="overlap that counts as a match")
+    parser.add_argument('--nms', type=float, default=0.5, help="NMS overlap, as in tracking.py")
+    parser.add_argument('--min-fps', type=float, default=1.0,
+                        help="slowest acceptable detector rate, e.g. 1 / detection interval")
+    parser.add_argument('--threads', type=int, default=None, help="cv2.setNumThreads before running")
+    parser.add_argument('--out', default='hog_tuned.json', help="tuned config for create_detector()")
+    parser.add_argument('--json', help="also write every result to this file")
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+    base = tuple(int(v) for v in args.base.split('x'))
+    samples = []
+    for clip in find_clips(args.clips):
+        clip_samples = load_labeled_frames(clip, base)
+        print(f"{clip}: {len(clip_samples)} labeled frames")
+        samples.extend(clip_samples)
+    if not samples:
+        raise SystemExit("none of the labeled frames could be read")
+    print(f"{len(samples)} frames, {sum(len(t) for _, t in samples)} people, on {cpu_name()}")
+
+    grid = list(itertools.product(args.resize, args.win_stride, args.padding, args.scale,
+                                  args.hit_threshold))
+    results = []
+    print(f"{'resize':>6} {'stride':>6} {'pad':>4} {'scale':>6} {'hit':>5} "
+          f"{'prec':>6} {'recall':>6} {'f1':>6} {'fps':>7}")
+    for resize, stride, padding, scale, hit in grid:
+        params = {'resize': resize, 'win_stride': [stride, stride], 'padding': [padding, padding],
+                  'scale': scale, 'hit_threshold': hit}
+        result = evaluate(params, samples, args.iou, args.nms)
+        results.append(result)
+        print(f"{resize:>6.2f} {stride:>6} {padding:>4} {scale:>6.2f} {hit:>5.2f} "
+              f"{result['precision']:>6.2f} {result['recall']:>6.2f} {result['f1']:>6.2f} "
+              f"{result['fps']:>7.1f}")
+
+    front = pareto_front(results)
+    print("\nPareto front (F1 vs fps):")
+    for r in front:
+        print(f"  f1 {r['f1']:.2f}  precision {r['precision']:.2f}  recall {r['recall']:.2f}  "
+              f"{r['fps']:6.1f} fps  {r['params']}")
+
+    fast_enough = [r for r in front if r['fps'] >= args.min_fps]
+    best = max(fast_enough, key=lambda r: r['f1']) if fast_enough else front[-1]
+    if not fast_enough:
+        print(f"No config reaches {args.min_fps} fps on this CPU; taking the fastest.")
+    print(f"\nChosen: {best['params']} (f1 {best['f1']:.2f}, {best['fps']:.1f} fps)")
+
+    tuned = {
+        'detector': dict(best['params'], backend='hog'),
+        'base_size': list(base),
+        'precision': best['precision'],
+        'recall': best['recall'],
+        'fps': best['fps'],
+        'cpu': cpu_name(),
+        'frames': len(samples),
+        'tuned_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'pareto': front,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(tuned, f, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)